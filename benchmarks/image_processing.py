@@ -0,0 +1,266 @@
+# -*- coding: utf8 -*-
+"""
+Micro-benchmarks of the image processing done for each ticket
+
+    python -m benchmarks.image_processing [--repeat 10] [--save] [--compare] [--baseline path]
+
+Inputs are an 18-MP camera frame (5184x3456) built from test_snapshot.jpg and tickets 576 and 640 pixels wide
+built from test_ticket.png. Each case runs in a forked process so that its peak memory is measured on its own.
+Baselines are kept per machine architecture and number of cores, baselines/image_processing-<machine>.json.
+--save stores the results as the baseline of this machine, --compare prints the change of each case relative
+to it and exits with status 1 if one of them regressed by more than --threshold percent, or if this machine has
+no baseline yet. Record one on the photobooth hardware with `make bench-baseline` and commit
+the file. Results are only compared, without failing, with a --baseline recorded on another kind of machine
+"""
+
+import argparse
+import cStringIO
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+import psutil
+
+from .simulated import install_fake_modules
+
+install_fake_modules()
+
+from PIL import Image
+
+from figureraspbian import settings, utils, imaging
+from figureraspbian.devices.printer import EpsonPrinter, VKP80III, iter_bands, get_raster_band
+
+
+BASELINES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+FRAME_SIZE = (5184, 3456)
+
+
+def encode(image, format, **kwargs):
+    buf = cStringIO.StringIO()
+    image.save(buf, format, **kwargs)
+    return buf.getvalue()
+
+
+def get_inputs():
+    """ Build the inputs once, before forking, so that their cost is not measured """
+    snapshot = Image.open('test_snapshot.jpg').convert('RGB')
+    frame = encode(snapshot.resize(FRAME_SIZE, Image.BICUBIC), 'JPEG', quality=95)
+    square = encode(utils.crop_to_square(Image.open(cStringIO.StringIO(frame))), 'JPEG', quality=95)
+    picture = Image.open(cStringIO.StringIO(square))
+    picture = picture.resize((settings.TICKET_TEMPLATE_PICTURE_SIZE, settings.TICKET_TEMPLATE_PICTURE_SIZE))
+    picture = Image.open(cStringIO.StringIO(encode(picture, 'JPEG')))
+    picture.load()
+    ticket = Image.open('test_ticket.png')
+    tickets = {}
+    for width in (576, 640):
+        resized = utils.resize_preserve_ratio(ticket, new_width=width)
+        tickets[width] = encode(resized, 'PNG')
+    gray_ticket = Image.open(cStringIO.StringIO(tickets[576])).convert('L')
+    gray_ticket.load()
+    return {'frame': frame, 'square': square, 'picture': picture, 'tickets': tickets, 'gray_ticket': gray_ticket}
+
+
+def get_printer(cls, max_width):
+    """ A printer able to prepare images without a USB device """
+    printer = cls.__new__(cls)
+    printer.max_width = max_width
+    return printer
+
+
+def get_cases(inputs):
+    epson = get_printer(EpsonPrinter, 576)
+    vkp80iii = get_printer(VKP80III, 640)
+    size = settings.TICKET_TEMPLATE_PICTURE_SIZE
+
+    def crop_to_square():
+        # decode, crop and encode as done by the camera after each capture
+        picture = Image.open(cStringIO.StringIO(inputs['frame']))
+        return encode(utils.crop_to_square(picture), 'JPEG')
+
+    def render_ticket_resize():
+        # resize of the square capture done by Photobooth.render_ticket
+        return imaging.open_resized(inputs['square'], (size, size))
+
+    def resize_preserve_ratio():
+        ticket = Image.open(cStringIO.StringIO(inputs['tickets'][640]))
+        return utils.resize_preserve_ratio(ticket, new_width=576).load()
+
+    # parameters are fixed so that results stay comparable with the baseline, they are not the settings
+    def enhance_image():
+        return imaging.enhance(inputs['picture'], contrast=1.3, gamma=1.2, sharpness=1.5)
+
+    def enhance_tone_curve():
+        return imaging.enhance(inputs['picture'], contrast=1.3, gamma=1.2)
+
+    def get_data_url():
+        return utils.get_data_url(inputs['picture'])
+
+    prepared = epson.prepare_image(inputs['tickets'][576])
+
+    def epson_raster():
+        ticket = epson.orient(Image.open(cStringIO.StringIO(prepared)))
+        return [get_raster_band(band) for band in iter_bands(ticket, settings.PRINTER_BAND_HEIGHT)]
+
+    def get_dither(method):
+        return lambda: imaging.dither(inputs['gray_ticket'], method)
+
+    def get_normalize(method, mode):
+        # no budget so that the full cost is measured
+        picture = inputs['picture'].convert(mode)
+        return lambda: imaging.normalize(picture, method, budget=float('inf'))
+
+    return [
+        ('crop_to_square', crop_to_square),
+        ('render_ticket_resize', render_ticket_resize),
+        ('resize_preserve_ratio', resize_preserve_ratio),
+        ('enhance_image', enhance_image),
+        ('enhance_tone_curve', enhance_tone_curve),
+        ('get_data_url', get_data_url),
+        ('epson_prepare_image_576', lambda: epson.prepare_image(inputs['tickets'][576])),
+        ('epson_prepare_image_640', lambda: epson.prepare_image(inputs['tickets'][640])),
+        ('vkp80iii_prepare_image_576', lambda: vkp80iii.prepare_image(inputs['tickets'][576])),
+        ('vkp80iii_prepare_image_640', lambda: vkp80iii.prepare_image(inputs['tickets'][640])),
+        ('epson_raster', epson_raster)
+    ] + [('dither_%s' % method, get_dither(method)) for method in imaging.DITHERING_METHODS] + [
+        ('normalize_%s_%s' % (method, mode), get_normalize(method, mode))
+        for method in (imaging.STRETCH, imaging.LOCAL) for mode in ('L', 'RGB')]
+
+
+def measure(func, repeat):
+    """ Time func and measure the memory it needs on top of the current resident set """
+    rss = psutil.Process(os.getpid()).memory_info().rss
+    durations = []
+    for _ in range(repeat):
+        ts = time.time()
+        func()
+        durations.append(time.time() - ts)
+    # ru_maxrss is in kilobytes on Linux, it is reset to the current resident set on fork
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return {
+        'min': min(durations),
+        'mean': sum(durations) / len(durations),
+        'peak_memory': max(peak - rss, 0)
+    }
+
+
+def run_forked(func, repeat):
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        status = 0
+        try:
+            result = measure(func, repeat)
+        except Exception as e:
+            result = {'error': repr(e)}
+            status = 1
+        with os.fdopen(w, 'w') as f:
+            json.dump(result, f)
+        os._exit(status)
+    os.close(w)
+    with os.fdopen(r) as f:
+        result = json.load(f)
+    os.waitpid(pid, 0)
+    return result
+
+
+def run(repeat, only=None):
+    inputs = get_inputs()
+    results = {}
+    for name, func in get_cases(inputs):
+        if only and name not in only:
+            continue
+        results[name] = run_forked(func, repeat)
+    return results
+
+
+def get_machine():
+    return {
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'python': platform.python_version(),
+        'cpu_count': psutil.cpu_count()
+    }
+
+
+def get_machine_key(machine):
+    """ Timings are only comparable between machines of the same architecture and number of cores """
+    return '%s-%scpu' % (machine['machine'], machine['cpu_count'])
+
+
+def get_baseline_path(machine):
+    return os.path.join(BASELINES_DIR, 'image_processing-%s.json' % get_machine_key(machine))
+
+
+def print_results(results, baseline=None):
+    print('%-28s %10s %10s %12s' % ('case', 'min ms', 'mean ms', 'peak MB') + ('  %10s' % 'vs baseline' if baseline else ''))
+    for name in sorted(results):
+        result = results[name]
+        if 'error' in result:
+            print('%-28s %s' % (name, result['error']))
+            continue
+        line = '%-28s %10.1f %10.1f %12.1f' % (
+            name, result['min'] * 1000, result['mean'] * 1000, result['peak_memory'] / 1048576.0)
+        reference = (baseline or {}).get(name)
+        if reference:
+            line += '  %+9.1f%%' % get_change(result, reference)
+        print(line)
+
+
+def get_change(result, reference):
+    """ Change of the best time relative to the baseline, in percent """
+    return (result['min'] - reference['min']) / reference['min'] * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--case', action='append', dest='cases', help='only run this case, can be repeated')
+    parser.add_argument('--baseline', help='baseline file, the one of this machine by default')
+    parser.add_argument('--save', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='compare the results with the baseline')
+    parser.add_argument('--threshold', type=float, default=10.0, help='regression threshold in percent')
+    args = parser.parse_args()
+
+    machine = get_machine()
+    baseline_path = args.baseline or get_baseline_path(machine)
+    baseline = None
+    # a regression is only reported against a baseline recorded on the same kind of machine
+    comparable = False
+    if args.compare:
+        if os.path.exists(baseline_path):
+            with open(baseline_path) as f:
+                stored = json.load(f)
+            baseline = stored['results']
+            comparable = get_machine_key(stored['machine']) == get_machine_key(machine)
+            print('baseline recorded on %s' % stored['machine']['platform'])
+            if not comparable:
+                print('the baseline was recorded on another kind of machine, regressions are not checked')
+        elif not args.save:
+            sys.exit('no baseline for %s in %s, record one with --save' % (get_machine_key(machine), baseline_path))
+
+    results = run(args.repeat, args.cases)
+    print_results(results, baseline)
+
+    if args.save:
+        if not os.path.isdir(os.path.dirname(baseline_path)):
+            os.makedirs(os.path.dirname(baseline_path))
+        with open(baseline_path, 'w') as f:
+            json.dump({'machine': machine, 'results': results}, f, indent=2, sort_keys=True)
+        print('baseline saved to %s' % baseline_path)
+
+    if baseline and comparable:
+        regressions = [name for name, result in results.items()
+                       if name in baseline and 'error' not in result and
+                       get_change(result, baseline[name]) > args.threshold]
+        if regressions:
+            print('regressions: %s' % ', '.join(sorted(regressions)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
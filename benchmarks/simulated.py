@@ -0,0 +1,159 @@
+# -*- coding: utf8 -*-
+"""
+Simulated devices replaying recorded data with realistic timings, so that the trigger pipeline can be
+measured without a camera, a printer or Xvfb
+"""
+
+import os
+import sys
+import time
+import types
+import cStringIO
+
+# gpiozero looks for a pin factory at import time
+os.environ.setdefault('GPIOZERO_PIN_FACTORY', 'mock')
+
+
+def install_fake_modules():
+    """
+    Register placeholders for the hardware libraries that cannot be imported on this machine
+    The simulated devices below never call into them
+    """
+    placeholders = {
+        'gphoto2': {},
+        'usb': {},
+        'usb.core': {'USBError': type('USBError', (IOError,), {})},
+        'RPi': {},
+        'RPi.GPIO': {},
+        'epson_printer': {},
+        'epson_printer.epsonprinter': {},
+        'custom_printer': {},
+        'custom_printer.printers': {},
+        'custom_printer.utils': {}
+    }
+    for name, attributes in sorted(placeholders.items()):
+        try:
+            __import__(name)
+        except ImportError:
+            module = types.ModuleType(name)
+            module.__dict__.update(attributes)
+            sys.modules[name] = module
+            parent, _, child = name.rpartition('.')
+            if parent:
+                setattr(sys.modules[parent], child, module)
+    # rendering HTML requires Qt and a running X server
+    sys.modules['figureraspbian.webkit2png'] = SimulatedWebkit2png
+
+
+class SimulatedWebkit2png(object):
+    """ Stands in for the webkit2png module and returns a recorded ticket after a delay """
+
+    delay = 1.5
+    ticket_path = 'test_ticket.png'
+
+    @classmethod
+    def get_screenshot(cls, html):
+        time.sleep(cls.delay)
+        with open(cls.ticket_path, 'rb') as f:
+            return f.read()
+
+
+def get_simulated_camera_class():
+    from figureraspbian.devices.camera import Camera
+    from figureraspbian.utils import crop_to_square
+    from figureraspbian.tracing import timed, span
+    from PIL import Image
+
+    class SimulatedCamera(Camera):
+        """ Replays recorded JPEG frames one after the other, waiting for shutter and USB transfer """
+
+        def __init__(self, frames, capture_delay=1.0, frame_size=None):
+            self.capture_delay = capture_delay
+            self.frames = []
+            for path in frames:
+                with open(path, 'rb') as f:
+                    frame = f.read()
+                if frame_size:
+                    # emulate a full resolution frame from the camera sensor
+                    buf = cStringIO.StringIO()
+                    Image.open(cStringIO.StringIO(frame)).convert('RGB').resize(frame_size).save(buf, 'JPEG')
+                    frame = buf.getvalue()
+                self.frames.append(frame)
+            self.count = 0
+
+        def configure(self):
+            pass
+
+        def clear_space(self):
+            pass
+
+        @timed('capture')
+        def capture(self):
+            time.sleep(self.capture_delay)
+            frame = self.frames[self.count % len(self.frames)]
+            self.count += 1
+            with span('crop'):
+                picture = Image.open(cStringIO.StringIO(frame))
+                cropped = crop_to_square(picture)
+                buf = cStringIO.StringIO()
+                cropped.save(buf, 'JPEG')
+                return buf.getvalue()
+
+    return SimulatedCamera
+
+
+class SimulatedUSBPrinter(object):
+    """ Emulates the time it takes to send data over USB and to feed paper """
+
+    def __init__(self, bytes_per_second=400000, lines_per_second=1200):
+        self.bytes_per_second = bytes_per_second
+        self.lines_per_second = lines_per_second
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        time.sleep(len(data) / float(self.bytes_per_second))
+
+    def feed(self, lines, elapsed):
+        """ Wait for the lines of a ticket to be printed, the paper feeds while data is transferred """
+        time.sleep(max(lines / float(self.lines_per_second) - elapsed, 0))
+
+    def linefeed(self, count):
+        time.sleep(count * 24 / float(self.lines_per_second))
+
+    def cut(self):
+        time.sleep(0.2)
+
+    def set_print_speed(self, speed):
+        pass
+
+
+def get_simulated_printer_class():
+    from figureraspbian.devices.printer import EpsonPrinter, PAPER_OK
+
+    class SimulatedEpsonPrinter(EpsonPrinter):
+        """ Epson printer sending its raster data to a simulated USB device """
+
+        def __init__(self, **kwargs):
+            super(SimulatedEpsonPrinter, self).__init__()
+            self.printer = SimulatedUSBPrinter(**kwargs)
+
+        def print_image(self, image, template=None):
+            started_at = time.time()
+            h = super(SimulatedEpsonPrinter, self).print_image(image, template)
+            self.printer.feed(h, time.time() - started_at)
+            return h
+
+        def get_status(self):
+            return {'paper': PAPER_OK}
+
+    return SimulatedEpsonPrinter
+
+
+class SimulatedDoorLock(object):
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
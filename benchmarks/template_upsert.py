@@ -0,0 +1,109 @@
+# -*- coding: utf8 -*-
+"""
+Benchmark TicketTemplate.update_or_create on a template with hundreds of text items
+
+    python -m benchmarks.template_upsert [number_of_items]
+
+The bulk upsert is compared with the previous behaviour of upserting each variable and item on its own
+"""
+
+import os
+import sys
+import time
+import logging
+
+# tables are dropped, never run against the database of a booth
+os.environ['SQLITE_FILEPATH'] = ':memory:'
+
+from figureraspbian.db import db
+from figureraspbian.models import get_all_models, TicketTemplate, TextVariable, Text
+
+
+class QueryCounter(logging.Handler):
+    """ Count the SQL queries peewee logs at debug level """
+
+    def __init__(self):
+        super(QueryCounter, self).__init__(logging.DEBUG)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+def get_ticket_template(number_of_items, modified='2017-01-01T00:00:00Z'):
+    return {
+        'id': 1,
+        'html': '<body>{{quote}}</body>',
+        'modified': modified,
+        'title': 'benchmark',
+        'description': '',
+        'text_variables': [
+            {'id': 1, 'name': 'quote', 'mode': 'random', 'items': [
+                {'id': i, 'text': 'quote %s %s' % (i, modified)} for i in range(1, number_of_items + 1)]}
+        ],
+        'image_variables': [],
+        'images': []
+    }
+
+
+def per_item_update_or_create(ticket_template):
+    """ Previous implementation, one get and save per row outside of any transaction """
+    try:
+        tt = TicketTemplate.get(TicketTemplate.id == ticket_template['id'])
+        tt.modified = ticket_template['modified']
+        tt.save()
+    except TicketTemplate.DoesNotExist:
+        tt = TicketTemplate.create(**ticket_template)
+    for text_variable in ticket_template['text_variables']:
+        try:
+            tv = TextVariable.get(TextVariable.id == text_variable['id'])
+            if tv.name != text_variable['name'] or tv.mode != text_variable['mode']:
+                tv.name = text_variable['name']
+                tv.mode = text_variable['mode']
+                tv.save()
+            text_ids = [item['id'] for item in text_variable['items']]
+            query = Text.select().where(~(Text.id << text_ids)).join(TextVariable).where(TextVariable.id == tv.id)
+            for text in query:
+                text.delete_instance()
+        except TextVariable.DoesNotExist:
+            tv = TextVariable.create(ticket_template=tt, **text_variable)
+        for item in text_variable['items']:
+            try:
+                text = Text.get(Text.id == item['id'])
+                if text.value != item['text']:
+                    text.value = item['text']
+                    text.save()
+            except Text.DoesNotExist:
+                Text.create(id=item['id'], value=item['text'], variable=tv)
+
+
+def run(upsert, number_of_items):
+    db.database.drop_tables(get_all_models(), safe=True)
+    db.database.create_tables(get_all_models())
+    results = []
+    counter = QueryCounter()
+    peewee_logger = logging.getLogger('peewee')
+    peewee_logger.addHandler(counter)
+    peewee_logger.setLevel(logging.DEBUG)
+    try:
+        for step, modified in [('create', '2017-01-01T00:00:00Z'), ('update', '2017-01-02T00:00:00Z')]:
+            counter.count = 0
+            ts = time.time()
+            upsert(get_ticket_template(number_of_items, modified))
+            results.append((step, time.time() - ts, counter.count))
+    finally:
+        peewee_logger.removeHandler(counter)
+    return results
+
+
+def main(number_of_items=500):
+    db.connect_db()
+    print('TicketTemplate upsert with %s text items' % number_of_items)
+    for name, upsert in [('per item', per_item_update_or_create), ('bulk', TicketTemplate.update_or_create)]:
+        for step, duration, queries in run(upsert, number_of_items):
+            print('%-10s %-8s %8.3f sec %6d queries' % (name, step, duration, queries))
+    db.close_db()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
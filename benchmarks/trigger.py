@@ -0,0 +1,112 @@
+# -*- coding: utf8 -*-
+"""
+End-to-end benchmark of Photobooth.trigger with simulated devices
+
+    python -m benchmarks.trigger [--triggers 20] [--frame 5184x3456] [--frames test_snapshot.jpg ...]
+
+The camera replays recorded JPEGs, the printer emulates USB transfer and paper feed timings and the screenshot
+of the ticket is a recorded PNG returned after a delay. Uploads to the API are disabled.
+Reports tickets per minute, the latency of each stage of a trigger and the peak resident memory
+"""
+
+import argparse
+import os
+import resource
+import tempfile
+import time
+
+from .simulated import install_fake_modules, SimulatedWebkit2png, SimulatedDoorLock
+from .simulated import get_simulated_camera_class, get_simulated_printer_class
+
+install_fake_modules()
+# the print queue thread updates the paper level, it can not see an in memory database
+# tables are dropped, never run against the database of a booth
+os.environ['SQLITE_FILEPATH'] = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+
+from figureraspbian import settings, tracing
+from figureraspbian import photobooth as photobooth_module
+from figureraspbian.db import db
+from figureraspbian.models import get_all_models, Code, TicketTemplate, Photobooth as PhotoboothModel
+from figureraspbian.devices.camera import Camera
+from figureraspbian.devices.printer import Printer
+from figureraspbian.devices.door_lock import DoorLock
+
+
+TICKET_TEMPLATE = {
+    'id': 1,
+    'html': '<html><link rel="stylesheet" href="{{css_url}}"><img src="{{picture}}">'
+            '<p>{{code}} {{datetime | datetimeformat}}</p></html>',
+    'title': 'benchmark',
+    'description': '',
+    'modified': '2017-01-01T00:00:00Z',
+    'text_variables': [],
+    'image_variables': [],
+    'images': []
+}
+
+
+def setup_database(number_of_codes):
+    db.connect_db()
+    db.database.drop_tables(get_all_models(), safe=True)
+    db.database.create_tables(get_all_models())
+    ticket_template = TicketTemplate.update_or_create(TICKET_TEMPLATE)
+    PhotoboothModel.create(uuid=settings.RESIN_UUID, ticket_template=ticket_template)
+    Code.bulk_insert(['%05d' % i for i in range(number_of_codes)])
+
+
+def create_photobooth(args):
+    SimulatedCamera = get_simulated_camera_class()
+    SimulatedEpsonPrinter = get_simulated_printer_class()
+    camera = SimulatedCamera(args.frames, capture_delay=args.capture_delay, frame_size=args.frame)
+    printer = SimulatedEpsonPrinter(bytes_per_second=args.usb_speed)
+    Camera.factory = staticmethod(lambda: camera)
+    Printer.factory = staticmethod(lambda: printer)
+    DoorLock.factory = staticmethod(lambda pin: SimulatedDoorLock())
+    # nothing is sent to the API
+    photobooth_module.request.upload_portrait_async = lambda portrait: None
+    photobooth_module.request.update_paper_level_async = lambda paper_level: None
+    return photobooth_module.Photobooth()
+
+
+def parse_size(value):
+    w, h = value.split('x')
+    return int(w), int(h)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--triggers', type=int, default=20)
+    parser.add_argument('--frames', nargs='+', default=['test_snapshot.jpg'], help='JPEG files replayed by the camera')
+    parser.add_argument('--frame', type=parse_size, default=None, help='resize frames to emulate a sensor, e.g. 5184x3456')
+    parser.add_argument('--capture-delay', type=float, default=1.0, help='shutter and transfer time in seconds')
+    parser.add_argument('--screenshot-delay', type=float, default=1.5, help='time to render the ticket HTML')
+    parser.add_argument('--usb-speed', type=int, default=400000, help='USB throughput in bytes per second')
+    parser.add_argument('--graphics-cache', action='store_true', help='store static bands in the printer memory')
+    args = parser.parse_args()
+
+    SimulatedWebkit2png.delay = args.screenshot_delay
+    settings.PRINTER_GRAPHICS_CACHE_ON = int(args.graphics_cache)
+    setup_database(args.triggers + 1)
+    photobooth = create_photobooth(args)
+    tracing.store.clear()
+
+    ts = time.time()
+    for _ in range(args.triggers):
+        photobooth.trigger()
+    # tickets are printed in the background
+    photobooth.print_queue.wait_until_idle()
+    duration = time.time() - ts
+
+    print('%s triggers in %.2f sec, %.2f tickets/minute' % (args.triggers, duration, args.triggers * 60 / duration))
+    print('%.1f kB sent to the printer per ticket' % (photobooth.printer.printer.bytes_written / 1024.0 / args.triggers))
+    print('%-14s %6s %8s %8s %8s %8s' % ('stage', 'count', 'mean', 'p50', 'p95', 'p99'))
+    for stage, stats in sorted(tracing.store.get_stats().items(), key=lambda item: -item[1]['mean']):
+        print('%-14s %6d %8.3f %8.3f %8.3f %8.3f' % (
+            stage, stats['count'], stats['mean'], stats['p50'], stats['p95'], stats['p99']))
+    # ru_maxrss is in kilobytes on Linux
+    print('peak RSS %.1f MB' % (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0))
+    db.close_db()
+
+
+if __name__ == '__main__':
+    main()
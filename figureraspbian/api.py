@@ -2,16 +2,20 @@
 from functools import wraps
 import cStringIO
 
-from flask import Flask, send_from_directory, request, jsonify, send_file
-import psutil
+from flask import Flask, send_from_directory, request, jsonify, send_file, url_for
 from PIL import Image
+from waitress import serve
 
 
 from threads import rlock
+from jobs import Job, get_job_runner
+from system import get_system_sampler
+from scheduler import get_scheduler
+import tracing
 from photobooth import get_photobooth
 from models import Photobooth, Portrait
 import settings
-from exceptions import DevicesBusy, PhotoboothNotReady, OutOfPaperError
+from exceptions import DevicesBusy, PhotoboothNotReady, OutOfPaperError, PrinterUSBError, PrintQueueFullError
 
 app = Flask(__name__)
 
@@ -28,32 +32,74 @@ def login_required(func):
     return decorated_function
 
 
+JOB_ERRORS = {
+    DevicesBusy: 'the photobooth is busy',
+    PhotoboothNotReady: 'the photobooth is not ready or not initialized properly',
+    OutOfPaperError: 'Out of paper',
+    PrinterUSBError: 'the communication with the printer failed',
+    PrintQueueFullError: 'the printer is busy'
+}
+
+
+def serialize_job(job):
+    res = {
+        'id': job.id,
+        'name': job.name,
+        'status': job.status,
+        'created': job.created_at,
+        'started': job.started_at,
+        'ended': job.ended_at,
+        'url': url_for('job', job_id=job.id)
+    }
+    if job.error:
+        res['error'] = JOB_ERRORS.get(type(job.error), 'an unexpected error occurred')
+    if job.status == Job.DONE and isinstance(job.result, str):
+        res['result_url'] = url_for('job_result', job_id=job.id)
+    return res
+
+
+def submit_job(name, func, *args, **kwargs):
+    """ Run a long operation in the background and return a job the client can poll """
+    job = get_job_runner().submit(name, func, *args, **kwargs)
+    return jsonify(**serialize_job(job)), 202
+
+
+@app.route('/jobs/<job_id>')
+@login_required
+def job(job_id):
+    job = get_job_runner().get(job_id)
+    if not job:
+        return jsonify(error='Job not found'), 404
+    return jsonify(**serialize_job(job))
+
+
+@app.route('/jobs/<job_id>/result')
+@login_required
+def job_result(job_id):
+    """ Returns the ticket printed by a trigger or test_template job """
+    job = get_job_runner().get(job_id)
+    if not job or job.status != Job.DONE or not isinstance(job.result, str):
+        return jsonify(error='Result not found'), 404
+    return send_file(cStringIO.StringIO(job.result), mimetype='image/png')
+
+
 @app.route('/focus', methods=['POST'])
 @login_required
 def focus():
-    try:
-        steps = request.values.get('focus_steps')
-        photobooth = get_photobooth()
-        if steps:
-            photobooth.focus_camera(int(steps))
-        else:
-            photobooth.focus_camera()
-        return jsonify(message='Camera focused')
-    except DevicesBusy:
-        return jsonify(error='the photobooth is busy'), 423
+    steps = request.values.get('focus_steps')
+    photobooth = get_photobooth()
+    if steps:
+        return submit_job('focus', photobooth.focus_camera, int(steps))
+    return submit_job('focus', photobooth.focus_camera)
 
 
 @app.route('/trigger', methods=['POST'])
 @login_required
 def trigger():
-    try:
-        photobooth = get_photobooth()
-        ticket = photobooth.trigger()
-        return send_file(cStringIO.StringIO(ticket), mimetype='jpg')
-    except DevicesBusy:
-        return jsonify(error='the photobooth is busy'), 423
-    except PhotoboothNotReady:
-        return jsonify(erro='the photobooth is not ready or not initialized properly'), 423
+    photobooth = get_photobooth()
+    if not photobooth.ready:
+        return jsonify(error='the photobooth is not ready or not initialized properly'), 423
+    return submit_job('trigger', photobooth.trigger)
 
 
 ALLOWED_EXTENSIONS = ['jpg', 'JPEG', 'JPG', 'png', 'PNG', 'gif']
@@ -75,8 +121,7 @@ def test_template():
         if w != h:
             return jsonify(error='The picture must have a square shape'), 400
         photobooth = get_photobooth()
-        photobooth.render_print_and_upload(picture_file.getvalue())
-        return jsonify(message='Ticket successfully printed')
+        return submit_job('test_template', photobooth.render_print_and_upload, picture_file.getvalue())
 
 
 @app.route('/print', methods=['POST'])
@@ -85,22 +130,49 @@ def print_image():
     """ Print the image uploaded by the user """
     image_file = request.files['image']
     if image_file and allowed_file(image_file.filename):
-        try:
-            photobooth = get_photobooth()
-            photobooth.print_image(image_file.getvalue())
-        except DevicesBusy:
-            return jsonify(error='the photobooth is busy'), 423
-        except OutOfPaperError:
-            return jsonify(error='Out of paper'), 500
-        return jsonify(message='Ticket printed succesfully')
+        photobooth = get_photobooth()
+        return submit_job('print', photobooth.print_image, image_file.getvalue())
+
+
+@app.route('/print_jobs')
+@login_required
+def print_jobs():
+    """ Returns the status of the last tickets sent to the printer """
+    photobooth = get_photobooth()
+    return jsonify(jobs=[job.serialize() for job in photobooth.print_queue.get_jobs()])
 
 
 @app.route('/door_open', methods=['POST'])
 @login_required
 def door_open():
+    """ Unlock the door for the number of seconds given by duration, DOOR_OPENING_TIME by default """
+    photobooth = get_photobooth()
+    state = photobooth.unlock_door(request.values.get('duration', type=int))
+    return jsonify(message='Door opened', door=state)
+
+
+@app.route('/door_extend', methods=['POST'])
+@login_required
+def door_extend():
+    """ Keep the door unlocked duration seconds longer """
+    photobooth = get_photobooth()
+    state = photobooth.extend_door_unlock(request.values.get('duration', type=int))
+    return jsonify(message='Door opening extended', door=state)
+
+
+@app.route('/door_close', methods=['POST'])
+@login_required
+def door_close():
+    """ Lock the door right away """
     photobooth = get_photobooth()
-    photobooth.unlock_door()
-    return jsonify(message='Door opened')
+    return jsonify(message='Door closed', door=photobooth.lock_door())
+
+
+@app.route('/door')
+@login_required
+def door():
+    photobooth = get_photobooth()
+    return jsonify(**photobooth.door_lock.get_state())
 
 
 @app.route('/info')
@@ -122,17 +194,39 @@ def info():
 @app.route('/system')
 @login_required
 def system():
-    cpu_percent = psutil.cpu_percent(interval=1)
-    memory_percent = psutil.virtual_memory().percent
-    disk_usage_percent = psutil.disk_usage('/').percent
-    number_of_processes = len(psutil.pids())
-    res = {
-        'cpu_percent': cpu_percent,
-        'memory_percent': memory_percent,
-        'disk_usage_percent': disk_usage_percent,
-        'number_of_processes': number_of_processes
-    }
-    return jsonify(**res)
+    """ Returns the latest system metrics sampled in the background """
+    return jsonify(**get_system_sampler().latest())
+
+
+@app.route('/system/history')
+@login_required
+def system_history():
+    since = request.args.get('since', type=float)
+    return jsonify(samples=get_system_sampler().history(since))
+
+
+@app.route('/scheduler')
+@login_required
+def scheduler():
+    """ Returns the run statistics of the background jobs """
+    return jsonify(jobs=[job.serialize() for job in get_scheduler().get_jobs()])
+
+
+@app.route('/scheduler/<name>/run', methods=['POST'])
+@login_required
+def scheduler_run(name):
+    """ Run a background job as soon as possible on the scheduler thread, poll /scheduler for its statistics """
+    scheduler = get_scheduler()
+    if scheduler.get(name) is None:
+        return jsonify(error='Scheduled job not found'), 404
+    return jsonify(**scheduler.run_soon(name).serialize()), 202
+
+
+@app.route('/latency')
+@login_required
+def latency():
+    """ Returns duration percentiles in seconds of each stage of a trigger and the spans of the last triggers """
+    return jsonify(stages=tracing.store.get_stats(), traces=tracing.store.get_traces())
 
 
 @app.route('/acquire_lock', methods=['POST'])
@@ -157,7 +251,8 @@ def release_lock():
 
 
 def start_server():
-    app.run(host='0.0.0.0', port=80)
+    serve(app, host='0.0.0.0', port=80, threads=settings.SERVER_THREADS,
+          channel_timeout=settings.SERVER_REQUEST_TIMEOUT)
 
 
 
@@ -1,17 +1,25 @@
 # -*- coding: utf8 -*-
 import logging
-from .threads import Interval, rlock
+from .threads import rlock
 import socket
 
 import settings
 from devices.button import Button
-from devices.real_time_clock import RTC
+from devices.real_time_clock import get_rtc
+from devices.usb_devices import get_usb_monitor
+from devices.io_hub import get_io_hub
 from api import start_server
+from jobs import get_job_runner
 from exceptions import OutOfPaperError
 from photobooth import get_photobooth
+from device_manager import DeviceManager
+from connectivity import get_connectivity_monitor
+from system import get_system_sampler
+from scheduler import get_scheduler
 
 from request import is_online, download_booting_ticket_template, download_ticket_stylesheet, update, upload_portraits
-from request import claim_new_codes, update_mac_addresses_async
+from request import claim_new_codes, update_mac_addresses, on_connectivity_change
+from startup import Startup
 from utils import set_system_time
 
 
@@ -23,37 +31,38 @@ class App(object):
 
     def __init__(self):
 
-        if is_online():
-            try:
-                download_ticket_stylesheet()
-                download_booting_ticket_template()
-            except Exception as e:
-                logger.exception(e)
-
-            try:
-                update()
-            except Exception as e:
-                logger.exception(e)
-
-            update_mac_addresses_async()
-
-            try:
-                claim_new_codes()
-            except Exception as e:
-                logger.exception(e)
-        else:
-            rtc = RTC.factory()
-            if rtc:
-                try:
-                    hc_dt = rtc.read_datetime()
-                    set_system_time(hc_dt)
-                except Exception as e:
-                    logger.exception(e)
-        self.photobooth = get_photobooth()
+        self.system_sampler = get_system_sampler()
+        self.system_sampler.start()
+        self.connectivity_monitor = get_connectivity_monitor()
+        # Network steps run concurrently with devices initialization, photobooth data is read from the local
+        # database so the photobooth can be used as soon as the camera and the printer are up
+        self.photobooth = get_photobooth(with_devices=False)
+        self.startup = Startup()
+        self.startup.add('connectivity', self.connectivity_monitor.start, timeout=settings.CONNECTIVITY_TIMEOUT + 1)
+        self.startup.add('devices', self.photobooth.initialize_devices, timeout=settings.STARTUP_DEVICES_TIMEOUT)
+        self.startup.add('static_files', download_static_files, requires=['connectivity'])
+        self.startup.add('update', if_online(update), requires=['connectivity'])
+        self.startup.add('mac_addresses', if_online(update_mac_addresses), requires=['connectivity'])
+        self.startup.add('codes', if_online(claim_new_codes), requires=['connectivity'])
+        self.startup.add('clock', set_clock_from_rtc, requires=['connectivity'])
+        self.startup.start()
+
+        # past its timeout the step goes on in the background, the device manager creates the devices still missing
+        self.startup.wait('devices')
+        self.paper_monitor = self.photobooth.paper_monitor
+        self.paper_monitor.start()
+        # devices missing or unplugged are created again in the background
+        self.device_manager = DeviceManager(self.photobooth)
+        self.usb_monitor = get_usb_monitor()
+        self.usb_monitor.subscribe(self.device_manager.on_usb_change)
+        self.usb_monitor.start()
+        self.device_manager.start()
         self.button = Button.factory(settings.BUTTON_PIN, 0.05, settings.DOOR_OPENING_DELAY)
         self.button.when_pressed = self.when_pressed
         self.button.when_held = self.when_held
-        self.intervals = set_intervals()
+        self.scheduler = schedule_jobs(self.photobooth)
+        self.connectivity_monitor.subscribe(on_connectivity_change)
+        self.connectivity_monitor.subscribe(self.scheduler.on_connectivity_change)
 
     def when_pressed(self):
         self.photobooth.trigger_async()
@@ -63,34 +72,92 @@ class App(object):
 
     def start(self):
         self.button.start()
+        logger.info("Ready...")
+        # the booting ticket shows the place and needs the latest template
+        self.startup.wait('static_files')
+        self.startup.wait('update')
         try:
             self.photobooth.print_booting_ticket()
         except OutOfPaperError:
             pass
-        logger.info("Ready...")
+        self.startup.join()
+        self.startup.log_timeline()
         try:
             start_server()
         except socket.error as e:
             logger.exception(e)
 
     def stop(self):
-        for interval in self.intervals:
-            interval.stop()
+        self.scheduler.stop()
+        if self.connectivity_monitor.is_alive():
+            self.connectivity_monitor.stop()
+        if self.paper_monitor.is_alive():
+            self.paper_monitor.stop()
+        if self.usb_monitor.is_alive():
+            self.usb_monitor.stop()
+        if self.device_manager.is_alive():
+            self.device_manager.stop()
+        self.system_sampler.stop()
         self.button.close()
+        job_runner = get_job_runner()
+        if job_runner.is_alive():
+            job_runner.stop()
         # wait for a trigger to complete before exiting
         rlock.acquire()
+        # then for the tickets it queued, the paper level is updated once they are printed
+        print_queue = self.photobooth.print_queue
+        if print_queue.is_alive():
+            if not print_queue.wait_until_idle(settings.PRINT_QUEUE_SHUTDOWN_TIMEOUT):
+                logger.warning("Tickets were still waiting to be printed at shutdown")
+            print_queue.stop()
+        get_io_hub().stop()
         logger.info("Bye Bye")
 
 
-def set_intervals():
-    """ Start tasks that are run in the background at regular intervals """
-    intervals = [
-        Interval(update, settings.UPDATE_POLL_INTERVAL),
-        Interval(upload_portraits, settings.UPLOAD_PORTRAITS_INTERVAL),
-        Interval(claim_new_codes, settings.CLAIM_NEW_CODES_INTERVAL)
-    ]
-
-    for interval in intervals:
-        interval.start()
-
-    return intervals
\ No newline at end of file
+def if_online(func):
+    """ Wrap func so that it is only called when the photobooth is online """
+    def wrapper():
+        if is_online():
+            return func()
+    return wrapper
+
+
+def download_static_files():
+    if is_online():
+        download_ticket_stylesheet()
+        download_booting_ticket_template()
+
+
+def set_clock_from_rtc():
+    """ Set system time from the hardware clock when it cannot be synchronized over the network """
+    if not is_online():
+        rtc = get_rtc()
+        if rtc:
+            hc_dt = rtc.read_datetime()
+            set_system_time(hc_dt)
+
+
+def correct_rtc_drift():
+    """ The system time is synchronized over the network while online, the hardware clock is set from it """
+    rtc = get_rtc()
+    if rtc and is_online():
+        rtc.correct_drift()
+
+
+def schedule_jobs(photobooth):
+    """
+    Run tasks in the background at regular intervals
+    Network jobs are skipped while offline so that being offline does not make them back off, and are put off
+    while the photobooth is busy
+    """
+    scheduler = get_scheduler()
+    scheduler.is_busy = photobooth.is_busy
+    scheduler.add('update', if_online(update), settings.UPDATE_POLL_INTERVAL, deadline=settings.UPDATE_DEADLINE,
+                  pausable=True)
+    scheduler.add('upload_portraits', if_online(upload_portraits), settings.UPLOAD_PORTRAITS_INTERVAL,
+                  deadline=settings.UPLOAD_PORTRAITS_DEADLINE, pausable=True)
+    scheduler.add('claim_new_codes', if_online(claim_new_codes), settings.CLAIM_NEW_CODES_INTERVAL,
+                  deadline=settings.CLAIM_NEW_CODES_DEADLINE, pausable=True)
+    scheduler.add('correct_rtc_drift', correct_rtc_drift, settings.RTC_DRIFT_CHECK_INTERVAL)
+    scheduler.start()
+    return scheduler
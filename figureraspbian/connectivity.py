@@ -0,0 +1,93 @@
+# -*- coding: utf8 -*-
+
+import logging
+import time
+from threading import Lock
+
+import requests
+
+import settings
+from threads import StoppableThread
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectivityMonitor(StoppableThread):
+    """
+    Checks in the background whether the API host can be reached and caches the result
+    The host is probed often while offline or right after a transition, and less and less often
+    while the connection stays up. Subscribers are called with the new state on every transition
+    """
+
+    def __init__(self, url=settings.API_HOST, timeout=settings.CONNECTIVITY_TIMEOUT,
+                 min_interval=settings.CONNECTIVITY_MIN_INTERVAL, max_interval=settings.CONNECTIVITY_MAX_INTERVAL):
+        super(ConnectivityMonitor, self).__init__(target=self.monitor)
+        self.daemon = True
+        self.url = url
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.is_online = False
+        self.checked_at = None
+        self._subscribers = []
+        self._lock = Lock()
+
+    def subscribe(self, callback):
+        """ Register a callback called with True or False when the connectivity state changes """
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers.remove(callback)
+
+    def probe(self):
+        """ Any HTTP response from the API host means we are online """
+        try:
+            requests.head(self.url, timeout=self.timeout)
+            return True
+        except requests.RequestException:
+            return False
+
+    def check(self):
+        online = self.probe()
+        with self._lock:
+            first_check = self.checked_at is None
+            changed = online != self.is_online
+            self.is_online = online
+            self.checked_at = time.time()
+            if online and not changed:
+                self.interval = min(self.interval * 2, self.max_interval)
+            else:
+                self.interval = self.min_interval
+            subscribers = list(self._subscribers)
+        if changed and not first_check:
+            logger.info("Connectivity changed, the photobooth is now %s" % ('online' if online else 'offline'))
+            for callback in subscribers:
+                try:
+                    callback(online)
+                except Exception as e:
+                    logger.exception(e)
+        return online
+
+    def monitor(self):
+        while not self.stopping.wait(self.interval):
+            self.check()
+
+    def start(self):
+        """ Check connectivity once so that the state is known when this returns, then keep monitoring """
+        self.check()
+        super(ConnectivityMonitor, self).start()
+
+
+_connectivity_monitor = None
+
+
+def get_connectivity_monitor():
+    """ Instantiate connectivity monitor lazily """
+    global _connectivity_monitor
+    if not _connectivity_monitor:
+        _connectivity_monitor = ConnectivityMonitor()
+    return _connectivity_monitor
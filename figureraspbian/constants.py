@@ -9,3 +9,5 @@ TMT20II_PRODUCT_ID = '0e15'
 CUSTOM_VENDOR_ID = '0dd4'
 
 VKP80III_PRODUCT_ID = '0205'
+
+EPSON_IN_ENDPOINT = 0x82
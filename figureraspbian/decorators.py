@@ -1,5 +1,7 @@
 # -*- coding: utf8 -*-
 
+from functools import wraps
+
 from exceptions import DevicesBusy
 
 
@@ -17,4 +19,20 @@ def execute_if_not_busy(lock):
             else:
                 raise DevicesBusy()
         return decorated
-    return wrap
\ No newline at end of file
+    return wrap
+
+
+def skip_if_running(lock):
+    """
+    This decorator makes concurrent calls to a function return None right away instead of running it twice
+    """
+    def wrap(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if lock.acquire(False):
+                try:
+                    return f(*args, **kwargs)
+                finally:
+                    lock.release()
+        return decorated
+    return wrap
@@ -0,0 +1,90 @@
+# -*- coding: utf8 -*-
+
+import logging
+from collections import OrderedDict
+from threading import Event, Lock
+
+import settings
+from devices.printer import Printer
+from threads import StoppableThread, elapsed
+
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceManager(StoppableThread):
+    """
+    Keeps the camera and the printer of the photobooth available without restarting the app
+    A device that could not be created is tried again after an interval doubled on each failure, and right away
+    when a USB device is plugged. An unplugged printer is dropped and created again once it is plugged back.
+    The camera opens a new gphoto2 session for each capture so it survives being unplugged
+    """
+
+    def __init__(self, photobooth, min_interval=settings.DEVICE_RETRY_MIN_INTERVAL,
+                 max_interval=settings.DEVICE_RETRY_MAX_INTERVAL):
+        super(DeviceManager, self).__init__(target=self.manage)
+        self.daemon = True
+        self.photobooth = photobooth
+        self.factories = OrderedDict([('camera', photobooth.create_camera), ('printer', Printer.factory)])
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.intervals = dict((name, min_interval) for name in self.factories)
+        self.retry_at = dict((name, 0) for name in self.factories)
+        self.wakeup = Event()
+        self._lock = Lock()
+
+    def get_missing(self):
+        return [name for name in self.factories if getattr(self.photobooth, name) is None]
+
+    def retry(self):
+        """ Create the missing devices whose interval is over, returns the ones created """
+        created = {}
+        with self._lock:
+            for name in self.get_missing():
+                now = elapsed()
+                if now < self.retry_at[name]:
+                    continue
+                device = self.factories[name]()
+                if device:
+                    logger.info("The %s is back" % name)
+                    created[name] = device
+                    self.intervals[name] = self.min_interval
+                else:
+                    logger.warning("The %s could not be found, trying again in %s sec" % (name, self.intervals[name]))
+                    self.retry_at[name] = now + self.intervals[name]
+                    self.intervals[name] = min(self.intervals[name] * 2, self.max_interval)
+        if created:
+            self.photobooth.swap_devices(**created)
+        return created
+
+    def get_timeout(self):
+        """ Time until the next device should be tried again """
+        retry_at = [self.retry_at[name] for name in self.get_missing()]
+        if not retry_at:
+            return None
+        return max(min(retry_at) - elapsed(), 0)
+
+    def on_usb_change(self, added, removed):
+        """ Called from the USB monitor thread with the devices plugged and unplugged """
+        printer = self.photobooth.printer
+        if printer and (any(printer.matches(device) for device in removed) or Printer.find_device(added)):
+            # a printer plugged back needs a fresh USB handle
+            logger.warning("The printer has been unplugged or plugged back")
+            self.photobooth.swap_devices(printer=None)
+        if added:
+            with self._lock:
+                for name in self.factories:
+                    self.retry_at[name] = 0
+                    self.intervals[name] = self.min_interval
+        self.wakeup.set()
+
+    def manage(self):
+        while not self.stopping.is_set():
+            self.retry()
+            self.wakeup.wait(self.get_timeout())
+            self.wakeup.clear()
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+        self.join()
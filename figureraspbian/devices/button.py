@@ -1,15 +1,12 @@
 # -*- coding: utf8 -*-
 import inspect
 from functools import wraps
-from threading import Event
 import logging
-
-from pifacedigitalio import PiFaceDigital
-import gpiozero
+from threading import Lock
+from Queue import Queue
 
 from ..threads import StoppableThread
-from .. import settings
-from .. exceptions import InvalidIOInterfaceError
+from .io_hub import get_io_hub
 
 logger = logging.getLogger(__name__)
 
@@ -18,35 +15,106 @@ class BadEventHandler(Exception):
     pass
 
 
+class CallbackRunner(StoppableThread):
+    """
+    Runs the callbacks of a button one after the other in their own thread, in the order the button fired them,
+    so that a callback that blocks never holds up the IO hub thread
+    """
+
+    def __init__(self):
+        super(CallbackRunner, self).__init__(target=self.work)
+        self.daemon = True
+        self.queue = Queue()
+        self._lock = Lock()
+
+    def submit(self, func):
+        with self._lock:
+            if not self.is_alive() and not self.stopping.is_set():
+                self.start()
+        self.queue.put(func)
+
+    def wait_idle(self):
+        """ Block until the callbacks submitted so far have returned """
+        self.queue.join()
+
+    def work(self):
+        while not self.stopping.is_set():
+            func = self.queue.get()
+            try:
+                if func is not None:
+                    func()
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                self.queue.task_done()
+
+    def stop(self):
+        self.stopping.set()
+        # wake up the worker, a callback in progress is not interrupted
+        self.queue.put(None)
+        if self.is_alive():
+            self.join()
+
+
 class Button(object):
     """
     Represents the push button that is used to trigger the devices
     It registers two optional callback "when_pressed" and "when_held" that are fired respectively when the
     button is pressed and when the button is held
+    Edges are reported on the IO hub thread. The first edge is handled right away and the following ones
+    are ignored for bounce_time, after which the pin is read again in case it was released in the meantime.
+    Holding is detected with a task scheduled on press. The callbacks are handed off to a CallbackRunner
     """
 
-    def __init__(self, pin, bounce_time, hold_time, pull_up=True):
+    def __init__(self, pin, bounce_time, hold_time, pull_up=True, io_hub=None):
         super(Button, self).__init__()
         self.pin = pin
         self.bounce_time = bounce_time
         self.hold_time = hold_time
         self.pull_up = pull_up
-        self._active_event = Event()
-        self._inactive_event = Event()
-        self._holding = Event()
+        self.io_hub = io_hub or get_io_hub()
         self._when_pressed = None
         self._when_unpressed = None
         self._when_held = None
         self._last_state = None
-        self._event_thread = EventThread(self)
-        self._hold_thread = HoldThread(self)
+        self._bounce_task = None
+        self._hold_task = None
+        self.callbacks = CallbackRunner()
 
     def start(self):
-        self._event_thread.start()
-        self._hold_thread.start()
+        self.io_hub.watch(self.pin, self._on_edge, self.pull_up)
+        self._last_state = self.value()
 
     def value(self):
-        raise NotImplementedError()
+        return self.io_hub.read(self.pin)
+
+    def _on_edge(self):
+        if self._bounce_task is not None:
+            return
+        self._bounce_task = self.io_hub.schedule(self.bounce_time, self._on_settled)
+        self._update()
+
+    def _on_settled(self):
+        self._bounce_task = None
+        self._update()
+
+    def _update(self):
+        state = self.value()
+        if state == self._last_state:
+            return
+        self._last_state = state
+        if self._hold_task is not None:
+            self._hold_task.cancel()
+            self._hold_task = None
+        if state:
+            self._hold_task = self.io_hub.schedule(self.hold_time, self._on_hold_time)
+            self._fire_activated()
+        else:
+            self._fire_deactivated()
+
+    def _on_hold_time(self):
+        self._hold_task = None
+        self._fire_held()
 
     @property
     def when_pressed(self):
@@ -105,109 +173,27 @@ class Button(object):
     def _fire_activated(self):
         logger.info("Button pressed")
         if self.when_pressed:
-            self.when_pressed()
+            self.callbacks.submit(self.when_pressed)
 
     def _fire_deactivated(self):
         logger.info("Button unpressed")
         if self.when_unpressed:
-            self.when_unpressed()
+            self.callbacks.submit(self.when_unpressed)
 
     def _fire_held(self):
         logger.info("Button held")
         if self.when_held:
-            self.when_held()
+            self.callbacks.submit(self.when_held)
 
     def close(self):
-        self._event_thread.stop()
-        self._hold_thread.stop()
+        self.io_hub.unwatch(self.pin)
+        for task in (self._bounce_task, self._hold_task):
+            if task is not None:
+                task.cancel()
+        self._bounce_task = self._hold_task = None
+        self.callbacks.stop()
 
     def factory(*args, **kwargs):
-        if settings.IO_INTERFACE == 'PIFACE':
-            return PiFaceDigitalButton(*args, **kwargs)
-        elif settings.IO_INTERFACE == 'GPIOZERO':
-            return GPIOZeroButton(*args, **kwargs)
-        raise InvalidIOInterfaceError()
+        return Button(*args, **kwargs)
 
     factory = staticmethod(factory)
-
-
-class PiFaceDigitalButton(Button):
-    """
-    Represents a button that is connected to the GPIO pins of the Raspberry Pi with a PiFaceDigital IO board
-    See http://www.piface.org.uk/products/piface_digital/ for more information
-    """
-
-    def __init__(self, *args, **kwargs):
-        self.pifacedigital = PiFaceDigital()
-        super(PiFaceDigitalButton, self).__init__(*args, **kwargs)
-
-    def value(self):
-        return self.pifacedigital.input_pins[self.pin].value
-
-
-class GPIOZeroButton(Button):
-    """ Represents a button whose value is determined using the GPIOZero library """
-
-    def __init__(self, *args, **kwargs):
-        super(GPIOZeroButton, self).__init__(*args, **kwargs)
-        self.device = gpiozero.Button(self.pin, pull_up=self.pull_up)
-
-    def value(self):
-        return self.device.is_pressed
-
-
-class EventThread(StoppableThread):
-    """
-    Provides a background thread that repeatedly check for button edges events (activated or deactivated)
-    """
-
-    def __init__(self, parent):
-        super(EventThread, self).__init__(target=self.event, args=(parent,))
-
-    def event(self, parent):
-        while not self.stopping.wait(parent.bounce_time):
-            self._fire_events(parent)
-
-    def _fire_events(self, parent):
-        old_state = parent._last_state
-        new_state = parent._last_state = parent.value()
-        if old_state is None:
-            # Initial "indeterminate" state; set events but don't fire
-            # callbacks as there's not necessarily an edge
-            if new_state:
-                parent._active_event.set()
-            else:
-                parent._inactive_event.set()
-        elif old_state != new_state:
-            if new_state:
-                parent._inactive_event.clear()
-                parent._active_event.set()
-                parent._holding.set()
-                parent._fire_activated()
-            else:
-                parent._active_event.clear()
-                parent._inactive_event.set()
-                parent._fire_deactivated()
-
-
-class HoldThread(StoppableThread):
-    """
-    Provides a background thread that repeatedly check if the button is held
-    """
-    def __init__(self, parent):
-        super(HoldThread, self).__init__(target=self.held, args=(parent,))
-
-    def held(self, parent):
-        while not self.stopping.is_set():
-            if parent._holding.wait(0.1):
-                parent._holding.clear()
-                if not (
-                        self.stopping.is_set() or
-                        parent._inactive_event.wait(parent.hold_time)
-                        ):
-                    parent._fire_held()
-
-
-
-
-
@@ -12,6 +12,8 @@ import piexif
 
 from .. import settings
 from ..utils import timeit, crop_to_square
+from ..tracing import timed, span, store, current_trace
+from ..threads import elapsed
 from .remote_release_connector import RemoteReleaseConnector
 from ..exceptions import TimeoutWaitingForFileAdded
 
@@ -68,6 +70,7 @@ class Camera(object):
             gp.gp_camera_set_config(camera, config, context)
 
     @timeit
+    @timed('capture')
     def capture(self):
         with open_camera() as (camera, context):
             # Capture picture
@@ -85,18 +88,19 @@ class Camera(object):
 
             file_data = gp.check_result(gp.gp_file_get_data_and_size(camera_file))
 
-            picture = Image.open(cStringIO.StringIO(file_data))
-            exif_dict = piexif.load(picture.info["exif"])
-            cropped = crop_to_square(picture)
+            with span('crop'):
+                picture = Image.open(cStringIO.StringIO(file_data))
+                exif_dict = piexif.load(picture.info["exif"])
+                cropped = crop_to_square(picture)
 
-            s, _ = cropped.size
-            exif_dict["Exif"][piexif.ExifIFD.PixelXDimension] = s
-            exif_bytes = piexif.dump(exif_dict)
+                s, _ = cropped.size
+                exif_dict["Exif"][piexif.ExifIFD.PixelXDimension] = s
+                exif_bytes = piexif.dump(exif_dict)
 
-            buf = cStringIO.StringIO()
-            cropped.save(buf, "JPEG", exif=exif_bytes)
-            cropped = buf.getvalue()
-            buf.close()
+                buf = cStringIO.StringIO()
+                cropped.save(buf, "JPEG", exif=exif_bytes)
+                cropped = buf.getvalue()
+                buf.close()
 
             return cropped
 
@@ -217,8 +221,12 @@ class RemoteReleaseConnectorCamera(Camera):
         self.remote_release_connector = RemoteReleaseConnector.factory(settings.REMOTE_RELEASE_CONNECTOR_PIN)
 
     def _trigger(self, camera, context):
-        self.remote_release_connector.trigger()
-        return self._wait_for_file_added(camera, context)
+        pulse = self.remote_release_connector.trigger()
+        camera_file_path = self._wait_for_file_added(camera, context)
+        # time between the full press and the picture being available on the camera
+        duration = elapsed() - pulse.pressed_at
+        store.record('release_to_file', duration, current_trace(), time.time() - duration)
+        return camera_file_path
 
     def _wait_for_file_added(self, camera, context, timeout=10):
         timeout_after = time.time() + timeout
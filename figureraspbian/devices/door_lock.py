@@ -1,9 +1,12 @@
+import time
+from threading import Lock
 
-from pifacedigitalio import PiFaceDigital
-import gpiozero
+from .io_hub import get_io_hub
+from ..threads import elapsed
 
-from .. import settings
-from ..exceptions import InvalidIOInterfaceError
+
+LOCKED = 'locked'
+UNLOCKED = 'unlocked'
 
 
 class DoorLock(object):
@@ -12,51 +15,86 @@ class DoorLock(object):
     When the current is passing, the lock is opened.
     When the current is not passing the lock is closed.
     It is used to control the opening of a door that keep the devices safe
+    The current is controlled with a PiFaceDigital relay or an external relay driven by a gpio, see IOHub
+    The lock is closed again by a task scheduled on the IO hub, so unlocking returns right away
+    Its deadline is kept in threads.elapsed time so that a change of the system time does not move it
     """
 
-    def open(self):
-        raise NotImplementedError()
-
-    def close(self):
-        raise NotImplementedError()
-
-    def factory(*args, **kwargs):
-        if settings.IO_INTERFACE == 'PIFACE':
-            return PiFaceDigitalDoorLock(*args, **kwargs)
-        elif settings.IO_INTERFACE == 'GPIOZERO':
-            return GPIOZeroDoorLock(*args, **kwargs)
-        else:
-            raise InvalidIOInterfaceError()
-
-    factory = staticmethod(factory)
-
-
-class PiFaceDigitalDoorLock(DoorLock):
-    """
-    In this implementation, the current from a 12V AC/DC converter is controlled via a PiFaceDigital relay
-    """
-
-    def __init__(self, pin=0):
-        self.pifacedigital = PiFaceDigital()
+    def __init__(self, pin=0, io_hub=None):
         self.pin = pin
+        self.io_hub = io_hub or get_io_hub()
+        self.state = LOCKED
+        self.unlocked_at = None
+        self.lock_deadline = None
+        self._lock_task = None
+        self._lock = Lock()
 
     def open(self):
-        self.pifacedigital.relays[self.pin].turn_on()
+        self.io_hub.write(self.pin, True)
 
     def close(self):
-        self.pifacedigital.relays[self.pin].turn_off()
-
-
-class GPIOZeroDoorLock(DoorLock):
-    """
-    In this implementation, the current from a 12V AC/DC converter is controlled via an external relay driven by a gpio
-    """
+        self.io_hub.write(self.pin, False)
+
+    def unlock(self, duration):
+        """ Unlock for duration seconds, unlocking an unlocked door never brings its locking time forward """
+        with self._lock:
+            now = elapsed()
+            if self.state == LOCKED:
+                self.open()
+                self.state = UNLOCKED
+                self.unlocked_at = time.time()
+                self._schedule_lock(now + duration)
+            elif now + duration > self.lock_deadline:
+                self._schedule_lock(now + duration)
+            return self.get_state()
+
+    def extend(self, duration):
+        """ Keep an unlocked door unlocked duration seconds longer, unlock it if it is locked """
+        with self._lock:
+            if self.state == UNLOCKED:
+                self._schedule_lock(self.lock_deadline + duration)
+                return self.get_state()
+        return self.unlock(duration)
+
+    def lock(self):
+        """ Lock right away, cancelling the scheduled locking """
+        with self._lock:
+            self._lock_now()
+            return self.get_state()
+
+    def get_state(self):
+        """ unlocked_at and locks_at are timestamps of the system time """
+        lock_deadline = self.lock_deadline
+        remaining = max(lock_deadline - elapsed(), 0) if lock_deadline is not None else 0
+        return {
+            'state': self.state,
+            'unlocked_at': self.unlocked_at,
+            'locks_at': time.time() + remaining if lock_deadline is not None else None,
+            'remaining': remaining
+        }
+
+    def _schedule_lock(self, lock_deadline):
+        if self._lock_task is not None:
+            self._lock_task.cancel()
+        self.lock_deadline = lock_deadline
+        self._lock_task = self.io_hub.schedule(lock_deadline - elapsed(), self._on_lock_time)
+
+    def _lock_now(self):
+        if self._lock_task is not None:
+            self._lock_task.cancel()
+            self._lock_task = None
+        self.close()
+        self.state = LOCKED
+        self.unlocked_at = self.lock_deadline = None
+
+    def _on_lock_time(self):
+        with self._lock:
+            # the locking may have been cancelled or pushed back since the task was popped
+            if self.lock_deadline is not None and elapsed() >= self.lock_deadline:
+                self._lock_task = None
+                self._lock_now()
 
-    def __init__(self, pin=0):
-        self.device = gpiozero.OutputDevice(pin)
-
-    def open(self):
-        self.device.on()
+    def factory(*args, **kwargs):
+        return DoorLock(*args, **kwargs)
 
-    def close(self):
-        self.device.off()
+    factory = staticmethod(factory)
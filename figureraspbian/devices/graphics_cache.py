@@ -0,0 +1,75 @@
+# -*- coding: utf8 -*-
+
+from .. import settings
+
+
+RASTER = 'raster'
+STORE = 'store'
+PRINT_STORED = 'print_stored'
+
+# number of key codes made of two printable characters with a fixed first one
+MAX_KEYS = 94
+
+
+def get_key(index):
+    """ Two printable characters identifying the graphics stored for a band """
+    return 'F' + chr(33 + index)
+
+
+class GraphicsCache(object):
+    """
+    Keeps track of the bands of tickets stored in the printer memory
+    A band printed identically on two successive tickets of a template is static (logo, artwork, fixed text).
+    It is stored once in the printer and printed from there on the next tickets until the template changes
+    """
+
+    def __init__(self, slots=settings.PRINTER_GRAPHICS_SLOTS):
+        self.slots = min(slots, MAX_KEYS)
+        self.template = None
+        self.previous = {}
+        self.current = {}
+        self.stored = {}
+        self.clear_pending = False
+
+    def start(self, template):
+        """
+        Start a ticket of the template identified by template, a (id, modified) tuple
+        Returns True if the graphics stored for a previous template must be deleted from the printer
+        """
+        self.current = {}
+        if template == self.template and not self.clear_pending:
+            return False
+        clear = bool(self.stored) or self.clear_pending
+        self.template = template
+        self.previous = {}
+        self.stored = {}
+        self.clear_pending = False
+        return clear
+
+    def get_action(self, index, digest):
+        """ Returns how a band should be sent, RASTER, STORE or PRINT_STORED, and the key of its graphics """
+        self.current[index] = digest
+        stored = self.stored.get(index)
+        if stored:
+            key, stored_digest = stored
+            if stored_digest == digest:
+                return PRINT_STORED, key
+            return RASTER, None
+        if index < MAX_KEYS and self.previous.get(index) == digest and len(self.stored) < self.slots:
+            key = get_key(index)
+            self.stored[index] = (key, digest)
+            return STORE, key
+        return RASTER, None
+
+    def end(self):
+        """ The bands of the ticket just printed are compared with the ones of the next ticket """
+        self.previous = self.current
+        self.current = {}
+
+    def reset(self):
+        """ Forget everything, the printer memory may not hold what we think it does """
+        self.template = None
+        self.previous = {}
+        self.current = {}
+        self.stored = {}
+        self.clear_pending = True
@@ -0,0 +1,199 @@
+# -*- coding: utf8 -*-
+
+import heapq
+import itertools
+import logging
+from threading import Condition, Lock
+
+from pifacedigitalio import PiFaceDigital, InputEventListener, IODIR_BOTH
+import gpiozero
+
+from .. import settings
+from ..threads import StoppableThread, elapsed
+from ..exceptions import InvalidIOInterfaceError
+
+
+logger = logging.getLogger(__name__)
+
+
+class Task(object):
+    """ A function scheduled on the IO hub thread, at is a time given by threads.elapsed """
+
+    def __init__(self, at, func, args):
+        self.at = at
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class IOHub(StoppableThread):
+    """
+    Owns the handle of the IO interface shared by all the IO devices and runs their work on a single thread:
+    callbacks of input edges and outputs scheduled in the future such as release pulses or door closing
+    Functions run on the hub thread must return quickly, they delay everything scheduled after them
+    read and write may also be called from other threads when timing matters more than ordering
+    """
+
+    def __init__(self):
+        super(IOHub, self).__init__(target=self.loop)
+        self.daemon = True
+        self._tasks = []
+        self._counter = itertools.count()
+        self._condition = Condition()
+
+    def schedule(self, delay, func, *args):
+        """ Run func(*args) on the hub thread in delay seconds, returns a task that can be cancelled """
+        task = Task(elapsed() + delay, func, args)
+        with self._condition:
+            if not self.is_alive() and not self.stopping.is_set():
+                self.start()
+            heapq.heappush(self._tasks, (task.at, next(self._counter), task))
+            self._condition.notify()
+        return task
+
+    def call_soon(self, func, *args):
+        return self.schedule(0, func, *args)
+
+    def loop(self):
+        while True:
+            with self._condition:
+                while not self.stopping.is_set():
+                    timeout = self._tasks[0][0] - elapsed() if self._tasks else None
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._condition.wait(timeout)
+                if self.stopping.is_set():
+                    return
+                _, _, task = heapq.heappop(self._tasks)
+            if task.cancelled:
+                continue
+            try:
+                task.func(*task.args)
+            except Exception as e:
+                logger.exception(e)
+
+    def stop(self):
+        with self._condition:
+            self.stopping.set()
+            self._condition.notify()
+        if self.is_alive():
+            self.join()
+        self.close()
+
+    def watch(self, pin, callback, pull_up=True):
+        """ Call callback on the hub thread whenever the input pin changes """
+        raise NotImplementedError()
+
+    def unwatch(self, pin):
+        raise NotImplementedError()
+
+    def read(self, pin):
+        raise NotImplementedError()
+
+    def write(self, pin, value):
+        raise NotImplementedError()
+
+    def pulse(self, pin, duration):
+        """ Turn an output on for duration seconds, returns the task turning it off """
+        self.write(pin, True)
+        return self.schedule(duration, self.write, pin, False)
+
+    def close(self):
+        pass
+
+
+class PiFaceIOHub(IOHub):
+    """
+    A single PiFaceDigital SPI handle shared by all devices
+    Outputs are the relays, edges of the inputs are reported by the interrupt listener of pifacedigitalio
+    """
+
+    def __init__(self):
+        super(PiFaceIOHub, self).__init__()
+        self.pifacedigital = PiFaceDigital()
+        self.listener = None
+        # relays are set with a read-modify-write of the output port, writes from other threads must not interleave
+        self._spi_lock = Lock()
+
+    def watch(self, pin, callback, pull_up=True):
+        if self.listener is None:
+            self.listener = InputEventListener(chip=self.pifacedigital)
+            self.listener.activate()
+        self.listener.register(pin, IODIR_BOTH, lambda event: self.call_soon(callback), settle_time=0)
+
+    def unwatch(self, pin):
+        if self.listener:
+            self.listener.deregister(pin)
+
+    def read(self, pin):
+        with self._spi_lock:
+            return self.pifacedigital.input_pins[pin].value
+
+    def write(self, pin, value):
+        with self._spi_lock:
+            if value:
+                self.pifacedigital.relays[pin].turn_on()
+            else:
+                self.pifacedigital.relays[pin].turn_off()
+
+    def close(self):
+        if self.listener:
+            self.listener.deactivate()
+
+
+class GPIOZeroIOHub(IOHub):
+    """ One gpiozero device per pin shared by all devices, edges are reported by the pin factory """
+
+    def __init__(self):
+        super(GPIOZeroIOHub, self).__init__()
+        self.inputs = {}
+        self.outputs = {}
+
+    def get_input(self, pin, pull_up=True):
+        if pin not in self.inputs:
+            # gpiozero.Button polls for holds in its own thread, devices built on the hub use timers
+            self.inputs[pin] = gpiozero.DigitalInputDevice(pin, pull_up=pull_up)
+        return self.inputs[pin]
+
+    def get_output(self, pin):
+        if pin not in self.outputs:
+            self.outputs[pin] = gpiozero.OutputDevice(pin)
+        return self.outputs[pin]
+
+    def watch(self, pin, callback, pull_up=True):
+        device = self.get_input(pin, pull_up)
+        device.when_activated = device.when_deactivated = lambda: self.call_soon(callback)
+
+    def unwatch(self, pin):
+        device = self.inputs.get(pin)
+        if device:
+            device.when_activated = device.when_deactivated = None
+
+    def read(self, pin):
+        return self.get_input(pin).is_active
+
+    def write(self, pin, value):
+        self.get_output(pin).value = value
+
+    def close(self):
+        for device in self.inputs.values() + self.outputs.values():
+            device.close()
+
+
+_io_hub = None
+
+
+def get_io_hub():
+    """ Instantiate the IO hub of the configured IO interface lazily """
+    global _io_hub
+    if not _io_hub:
+        if settings.IO_INTERFACE == 'PIFACE':
+            _io_hub = PiFaceIOHub()
+        elif settings.IO_INTERFACE == 'GPIOZERO':
+            _io_hub = GPIOZeroIOHub()
+        else:
+            raise InvalidIOInterfaceError()
+    return _io_hub
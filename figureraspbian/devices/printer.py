@@ -1,10 +1,10 @@
 # -*- coding: utf8 -*-
 
-import subprocess
-import os
-from os.path import join
 import cStringIO
+import hashlib
 import logging
+from collections import OrderedDict
+from threading import RLock
 
 from usb.core import USBError
 
@@ -14,20 +14,133 @@ from custom_printer import utils as custom_printer_utils
 from PIL import Image
 
 from .. import settings
-from ..utils import timeit, get_usb_devices, add_margin, resize_preserve_ratio
-from ..exceptions import OutOfPaperError, PrinterNotFoundError, PrinterModelNotRecognizedError
+from ..utils import timeit, add_margin
+from ..imaging import prepare_ticket
+from ..exceptions import OutOfPaperError, PrinterNotFoundError, PrinterModelNotRecognizedError, PrinterUSBError
 from .. import constants
+from ..tracing import span
+from .graphics_cache import GraphicsCache, STORE, PRINT_STORED
+from .usb_devices import get_usb_devices
 
 
 logger = logging.getLogger(__name__)
 
 
+PAPER_OK = 'ok'
+PAPER_NEAR_END = 'near_end'
+PAPER_OUT = 'out'
+
+# ESC/POS real-time status transmission
+DLE_EOT = '\x10\x04'
+PAPER_SENSOR_STATUS = 4
+PAPER_NEAR_END_BITS = 0x0C
+PAPER_OUT_BITS = 0x60
+
+# ESC/POS raster bit image, normal density
+GS_V_0 = '\x1dv0\x00'
+# ESC/POS graphics commands
+GS_L = '\x1d(L'
+DELETE_ALL_GRAPHICS = GS_L + '\x05\x00\x30\x51CLR'
+# maximum size of the data of a GS ( L command
+GS_L_MAX_DATA = 65535 - 11
+# bitwise not of each byte, in a 1 bit image set bits are white while the printer burns set bits
+INVERT_BITS = ''.join(chr(~i & 0xFF) for i in range(256))
+
+
+def iter_bands(im, band_height):
+    """ Successive horizontal bands of at most band_height lines of an image """
+    w, h = im.size
+    for top in range(0, h, band_height):
+        yield im.crop((0, top, w, min(top + band_height, h)))
+
+
+def get_raster_data(band):
+    """ Rows of a 1 bit image packed 8 dots a byte, set bits are burnt """
+    w, h = band.size
+    if w % 8:
+        # rows are padded to a whole byte with black bits, pad them with white so that they are not burnt
+        padded = Image.new('1', (w + 8 - w % 8, h), 1)
+        padded.paste(band, (0, 0))
+        band = padded
+    return band.tobytes().translate(INVERT_BITS)
+
+
+def get_raster_band(band, data=None):
+    """ GS v 0 command printing a band of a 1 bit image """
+    w, h = band.size
+    width_bytes = (w + 7) / 8
+    header = GS_V_0 + chr(width_bytes % 256) + chr(width_bytes / 256) + chr(h % 256) + chr(h / 256)
+    return header + (data or get_raster_data(band))
+
+
+def get_store_graphics(key, band, data=None):
+    """ GS ( L fn 83 command storing a band in the download graphics memory of the printer """
+    w, h = band.size
+    data = data or get_raster_data(band)
+    p = 11 + len(data)
+    return (GS_L + chr(p % 256) + chr(p / 256) + '\x30\x53\x30' + key + '\x01' +
+            chr(w % 256) + chr(w / 256) + chr(h % 256) + chr(h / 256) + '\x31' + data)
+
+
+def get_print_graphics(key):
+    """ GS ( L fn 85 command printing graphics stored in the download graphics memory """
+    return GS_L + '\x06\x00\x30\x55' + key + '\x01\x01'
+
+
+# printer classes by (vendor id, product id), in the order they are tried
+PRINTER_MODELS = OrderedDict()
+
+
+def register_printer(vendor_id, product_id):
+    """ Class decorator making a printer model known to Printer.factory """
+    def decorator(cls):
+        cls.vendor_id = vendor_id
+        cls.product_id = product_id
+        PRINTER_MODELS[(vendor_id, product_id)] = cls
+        return cls
+    return decorator
+
+
 class Printer(object):
     """ Base class for all printers """
 
-    def print_image(self, image):
+    vendor_id = None
+    product_id = None
+    # whether get_status may report PAPER_NEAR_END
+    has_near_end_sensor = False
+
+    def __init__(self):
+        # serializes the USB transfers of the print queue and status queries from other threads
+        self.lock = RLock()
+
+    def print_image(self, image, template=None):
+        """ Print an image, template identifies the ticket template it was rendered from """
+        raise NotImplementedError()
+
+    def get_status(self):
+        """ Returns the state of the paper sensors, one of PAPER_OK, PAPER_NEAR_END or PAPER_OUT """
         raise NotImplementedError()
 
+    def write_chunked(self, data):
+        """
+        Send data in chunks of PRINTER_CHUNK_SIZE bytes. Each write returns once the printer accepted the chunk
+        so that we never get more than a chunk ahead of the printer buffer
+        """
+        size = settings.PRINTER_CHUNK_SIZE
+        for i in range(0, len(data), size):
+            self.printer.write(data[i:i + size])
+
+    def get_error(self, error):
+        """ Tell a lack of paper apart from other USB faults by querying the printer status """
+        try:
+            status = self.get_status()
+        except USBError as e:
+            logger.error(e)
+            return PrinterUSBError(error)
+        if status['paper'] == PAPER_OUT:
+            return OutOfPaperError()
+        return PrinterUSBError(error)
+
     def print_image_from_file(self, file_path):
         with open(file_path, "rb") as image_file:
             self.print_image(image_file.read())
@@ -35,30 +148,29 @@ class Printer(object):
     def paper_present(self):
         raise NotImplemented()
 
+    @classmethod
+    def matches(cls, device):
+        """ Whether a USB device, as returned by get_usb_devices, is a printer of this model """
+        return (device['vendor_id'], device['product_id']) == (cls.vendor_id, cls.product_id)
+
+    @staticmethod
+    def find_device(devices):
+        """ The first USB device that is a registered printer model """
+        return next((device for device in devices
+                     if (device['vendor_id'], device['product_id']) in PRINTER_MODELS), None)
+
     @staticmethod
     def factory():
         def _factory():
-            """ factory method to create different types of printers based on the output of lsusb"""
+            """ factory method to create the printer model registered for the USB devices plugged """
             devices = get_usb_devices()
-            # Try finding an EPSON printer
-            generator = (device for device in devices if device['vendor_id'] == constants.EPSON_VENDOR_ID)
-            epson_printer_device = next(generator, None)
-            if epson_printer_device:
-                product_id = epson_printer_device['product_id']
-                if product_id == constants.TMT20_PRODUCT_ID:
-                    return EpsonTMT20()
-                if product_id == constants.TMT20II_PRODUCT_ID:
-                    return EpsonTMT20II()
-                else:
-                    raise PrinterModelNotRecognizedError(epson_printer_device)
-            generator = (device for device in devices if device['vendor_id'] == constants.CUSTOM_VENDOR_ID)
-            custom_printer_device = next(generator, None)
-            if custom_printer_device:
-                product_id = custom_printer_device['product_id']
-                if product_id == constants.VKP80III_PRODUCT_ID:
-                    return VKP80III()
-                else:
-                    raise PrinterModelNotRecognizedError(custom_printer_device)
+            device = Printer.find_device(devices)
+            if device:
+                return PRINTER_MODELS[(device['vendor_id'], device['product_id'])]()
+            vendor_ids = set(vendor_id for vendor_id, _ in PRINTER_MODELS)
+            unknown_device = next((device for device in devices if device['vendor_id'] in vendor_ids), None)
+            if unknown_device:
+                raise PrinterModelNotRecognizedError(unknown_device)
             raise PrinterNotFoundError()
 
         try:
@@ -69,76 +181,112 @@ class Printer(object):
 
 class EpsonPrinter(Printer):
 
+    has_near_end_sensor = True
+
     def __init__(self, *args, **kwargs):
         self.max_width = 576
+        self.graphics_cache = GraphicsCache()
         super(EpsonPrinter, self).__init__(*args, **kwargs)
 
+    def read_status(self, n):
+        """ Send a DLE EOT n real-time status request and read the status byte """
+        with self.lock:
+            self.printer.write(DLE_EOT + chr(n))
+            return self.printer.printer.read(constants.EPSON_IN_ENDPOINT, 1, settings.PRINTER_STATUS_TIMEOUT)[0]
+
+    def get_status(self):
+        paper = self.read_status(PAPER_SENSOR_STATUS)
+        if paper & PAPER_OUT_BITS:
+            return {'paper': PAPER_OUT}
+        if paper & PAPER_NEAR_END_BITS:
+            return {'paper': PAPER_NEAR_END}
+        return {'paper': PAPER_OK}
+
     def configure(self):
-        self.printer.set_print_speed(2)
-
-    def image_to_raster(self, ticket):
-        ticket_path = join(settings.RAMDISK_ROOT, 'ticket.png')
-        ticket.save(ticket_path, "PNG", quality=100)
-        # TODO make png2pos support passing base64 file argument
-        speed_arg = '-s%s' % settings.PRINTER_SPEED
-        args = ['png2pos', '-r', speed_arg, '-aC', ticket_path]
-        my_env = os.environ.copy()
-        my_env['PNG2POS_PRINTER_MAX_WIDTH'] = str(self.max_width)
-        p = subprocess.Popen(args, stdout=subprocess.PIPE, env=my_env)
-        pos_data, err = p.communicate()
-        if err:
-            raise err
-        return pos_data
+        self.printer.set_print_speed(settings.PRINTER_SPEED)
+
+    def orient(self, ticket):
+        """ Center the ticket on the paper width and turn it upside down, the paper comes out head first """
+        if ticket.mode != '1':
+            ticket = ticket.convert('1')
+        w, h = ticket.size
+        if w < self.max_width:
+            horizontal_margin = (self.max_width - w) / 2
+            ticket = add_margin(ticket, (horizontal_margin, 0, self.max_width - w - horizontal_margin, 0))
+        return ticket.rotate(180)
 
     def prepare_image(self, image):
-        im = Image.open(cStringIO.StringIO(image))
-        im = resize_preserve_ratio(im, new_width=self.max_width)
-        if im.mode is not '1':
-            im = im.convert('1')
+        im = prepare_ticket(image, width=self.max_width)
         buf = cStringIO.StringIO()
         im.save(buf, 'PNG')
         im = buf.getvalue()
         buf.close()
         return im
 
+    def get_band_commands(self, band, index, cache):
+        """ Commands printing a band, from the graphics stored in the printer when the band is static """
+        data = get_raster_data(band)
+        if cache and len(data) <= GS_L_MAX_DATA:
+            digest = hashlib.sha1(data).hexdigest() + '%sx%s' % band.size
+            action, key = self.graphics_cache.get_action(index, digest)
+            if action == STORE:
+                return get_store_graphics(key, band, data) + get_print_graphics(key)
+            if action == PRINT_STORED:
+                return get_print_graphics(key)
+        return get_raster_band(band, data)
+
     @timeit
-    def print_image(self, image):
+    def print_image(self, image, template=None):
         im = Image.open(cStringIO.StringIO(image))
-        raster_data = self.image_to_raster(im)
-        try:
-            self.printer.write(raster_data)
-            self.printer.linefeed(settings.LINE_FEED_COUNT)
-            self.printer.cut()
-            _, h = im.size
-            return h
-        except USBError:
-            # best guess is that we are out out of paper
-            raise OutOfPaperError()
+        with span('raster'):
+            oriented = self.orient(im)
+        cache = bool(settings.PRINTER_GRAPHICS_CACHE_ON and template)
+        with self.lock:
+            try:
+                with span('usb_write'):
+                    if cache and self.graphics_cache.start(template):
+                        self.printer.write(DELETE_ALL_GRAPHICS)
+                    # each band is rasterized while the printer feeds the previous one
+                    for index, band in enumerate(iter_bands(oriented, settings.PRINTER_BAND_HEIGHT)):
+                        self.write_chunked(self.get_band_commands(band, index, cache))
+                    if cache:
+                        self.graphics_cache.end()
+                    self.printer.linefeed(settings.LINE_FEED_COUNT)
+                    self.printer.cut()
+            except USBError as e:
+                self.graphics_cache.reset()
+                raise self.get_error(e)
+        _, h = im.size
+        return h
 
     def paper_present(self):
-        # TODO make this work
-        # return self.printer.paper_present()
-        return True
+        try:
+            return self.get_status()['paper'] != PAPER_OUT
+        except USBError as e:
+            # assume there is paper when the sensors can not be read
+            logger.error(e)
+            return True
 
 
+@register_printer(constants.EPSON_VENDOR_ID, constants.TMT20_PRODUCT_ID)
 class EpsonTMT20(EpsonPrinter):
 
     def __init__(self, *args, **kwargs):
         super(EpsonTMT20, self).__init__(*args, **kwargs)
-        product_id = '0x%s' % constants.TMT20_PRODUCT_ID
-        self.printer = epsonprinter.EpsonPrinter(int(product_id, 16))
+        self.printer = epsonprinter.EpsonPrinter(int(self.product_id, 16))
         self.configure()
 
 
+@register_printer(constants.EPSON_VENDOR_ID, constants.TMT20II_PRODUCT_ID)
 class EpsonTMT20II(EpsonPrinter):
 
     def __init__(self, *args, **kwargs):
         super(EpsonTMT20II, self).__init__(*args, **kwargs)
-        product_id = '0x%s' % constants.TMT20II_PRODUCT_ID
-        self.printer = epsonprinter.EpsonPrinter(int(product_id, 16))
+        self.printer = epsonprinter.EpsonPrinter(int(self.product_id, 16))
         self.configure()
 
 
+@register_printer(constants.CUSTOM_VENDOR_ID, constants.VKP80III_PRODUCT_ID)
 class VKP80III(Printer):
 
     def __init__(self, *args, **kwargs):
@@ -157,9 +305,7 @@ class VKP80III(Printer):
         return custom_printer_utils.image_to_raster(image)
 
     def prepare_image(self, image):
-        im = Image.open(cStringIO.StringIO(image))
-        if im.mode != '1':
-            im = im.convert('1')
+        im = prepare_ticket(image)
         horizontal_margin = (self.max_width - im.size[0]) / 2
         border = (horizontal_margin, 55, horizontal_margin, 0)
         im = add_margin(im, border)
@@ -170,20 +316,30 @@ class VKP80III(Printer):
         return im
 
     @timeit
-    def print_image(self, image):
+    def print_image(self, image, template=None):
         im = Image.open(cStringIO.StringIO(image))
-        im = im.rotate(180)
-        raster_data = custom_printer_utils.image_to_raster(im)
+        with span('raster'):
+            im = im.rotate(180)
         xH, xL = custom_printer_utils.to_base_256(self.max_width / 8)
-        yH, yL = custom_printer_utils.to_base_256(im.size[1])
-        try:
-            self.printer.print_raster_image(0, xL, xH, yL, yH, raster_data)
-            self.printer.present_paper(23, 1, 69, 0)
-            (_, h) = im.size
-            return h
-        except USBError:
-            raise OutOfPaperError()
+        with self.lock:
+            try:
+                with span('usb_write'):
+                    # each band is rasterized while the printer feeds the previous one
+                    for band in iter_bands(im, settings.PRINTER_BAND_HEIGHT):
+                        yH, yL = custom_printer_utils.to_base_256(band.size[1])
+                        raster_data = custom_printer_utils.image_to_raster(band)
+                        self.printer.print_raster_image(0, xL, xH, yL, yH, raster_data)
+                    self.printer.present_paper(23, 1, 69, 0)
+            except USBError as e:
+                raise self.get_error(e)
+        (_, h) = im.size
+        return h
+
+    def get_status(self):
+        # the paper sensor of the VKP80III does not report near end
+        return {'paper': PAPER_OK if self.paper_present() else PAPER_OUT}
 
     @timeit
     def paper_present(self):
-        return self.printer.paper_present()
+        with self.lock:
+            return self.printer.paper_present()
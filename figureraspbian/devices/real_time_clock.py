@@ -1,18 +1,58 @@
+import logging
 import time
-import operator
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 
-import RPi.GPIO
+from RPi import GPIO
 
 from .. import settings
+from ..threads import elapsed
+
+
+logger = logging.getLogger(__name__)
 
 
 class RTC(object):
+    """
+    A hardware clock keeping time while the photobooth is off
+    The clock is read once, later reads add the time elapsed since then so that they do not touch the bus
+    """
+
+    def __init__(self):
+        self._datetime = None
+        self._read_at = None
 
     def read_datetime(self):
-        raise NotImplementedError()
+        if self._datetime is None:
+            self._datetime = self._read_datetime()
+            self._read_at = elapsed()
+        return self._datetime + timedelta(seconds=elapsed() - self._read_at)
 
     def write_datetime(self, dt):
+        self._write_datetime(dt)
+        self._datetime = dt
+        self._read_at = elapsed()
+
+    def get_drift(self):
+        """ Seconds the clock is ahead of the system time, read from the bus """
+        dt = self._read_datetime()
+        self._datetime = dt
+        self._read_at = elapsed()
+        drift = dt - datetime.now()
+        return drift.days * 86400 + drift.seconds + drift.microseconds / 1e6
+
+    def correct_drift(self, max_drift=settings.RTC_MAX_DRIFT):
+        """ Set the clock to the system time if they drifted apart, only call it when the system time is right """
+        drift = self.get_drift()
+        if abs(drift) > max_drift:
+            logger.info("Hardware clock drifted by %.1f sec, setting it to the system time" % drift)
+            self.write_datetime(datetime.now())
+        return drift
+
+    def _read_datetime(self):
+        raise NotImplementedError()
+
+    def _write_datetime(self, dt):
         raise NotImplementedError()
 
     def factory(*args, **kwargs):
@@ -23,8 +63,26 @@ class RTC(object):
     factory = staticmethod(factory)
 
 
+_rtc = None
+
+
+def get_rtc():
+    """ Instantiate the hardware clock lazily, None if there is none """
+    global _rtc
+    if not _rtc:
+        _rtc = RTC.factory()
+    return _rtc
+
+
+def bcd_to_int(byte):
+    return (byte >> 4) * 10 + (byte & 0x0F)
 
-# RTC_DS1302 - Python Hardware Programming Education Project For Raspberry Pi
+
+def int_to_bcd(value):
+    return (value / 10) << 4 | value % 10
+
+
+# Originally based on RTC_DS1302 - Python Hardware Programming Education Project For Raspberry Pi
 # Copyright (C) 2015 Jason Birch
 #
 # This program is free software: you can redistribute it and/or modify
@@ -40,213 +98,95 @@ class RTC(object):
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-#/****************************************************************************/
-#/* RTC_DS1302                                                               */
-#/* ------------------------------------------------------------------------ */
-#/* V1.00 - 2015-08-26 - Jason Birch                                         */
-#/* ------------------------------------------------------------------------ */
-#/* Class to handle controlling a Real Time Clock IC DS1302.                 */
-#/****************************************************************************/
-
-
-class RTC_DS1302:
-    RTC_DS1302_SCLK = settings.RTC_SCLK_PIN
-    RTC_DS1302_CE = settings.RTC_RST_PIN
-    RTC_DS1302_IO = settings.RTC_SDAT_PIN
-
-    CLK_PERIOD = 0.00001
 
-    DOW = [ "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday" ]
-
-
-    def __init__(self):
-        # Turn off GPIO warnings.
-        RPi.GPIO.setwarnings(False)
-        # Configure Raspberry Pi GPIO interfaces.
-        RPi.GPIO.setmode(RPi.GPIO.BCM)
-        # Initiate DS1302 communication.
-        self.InitiateDS1302()
-        # Make sure write protect is turned off.
-        self.WriteByte(int("10001110", 2))
-        self.WriteByte(int("00000000", 2))
-        # Make sure trickle charge mode is turned off.
-        self.WriteByte(int("10010000", 2))
-        self.WriteByte(int("00000000", 2))
-        # End DS1302 communication.
-        self.EndDS1302()
-
-    #/***********************************/
-    #/* Write date and time to the RTC. */
-    #/***********************************/
-    def write_datetime(self, dt):
-        year = dt.year % 100
-        month = dt.month
-        day = dt.day
-        day_of_week = dt.weekday()
-        hour = dt.hour
-        minute = dt.minute
-        second = dt.second
-        self._write_datetime(year, month, day, day_of_week, hour, minute, second)
-
-
-    #/*************************************/
-    #/* Read date and time from the RTC. */
-    #/*************************************/
-    def read_datetime(self):
-        # Initiate DS1302 communication.
-        self.InitiateDS1302()
-        # Write address byte.
-        self.WriteByte(int("10111111", 2))
-        # Read date and time data.
-
-        Byte = self.ReadByte()
-        second = operator.mod(Byte, 16) + operator.div(Byte, 16) * 10
-        Byte = self.ReadByte()
-        minute = operator.mod(Byte, 16) + operator.div(Byte, 16) * 10
-        Byte = self.ReadByte()
-        hour = operator.mod(Byte, 16) + operator.div(Byte, 16) * 10
-        Byte = self.ReadByte()
-        day = operator.mod(Byte, 16) + operator.div(Byte, 16) * 10
-        Byte = self.ReadByte()
-        month = operator.mod(Byte, 16) + operator.div(Byte, 16) * 10
-        Byte = self.ReadByte()
-        _ = (operator.mod(Byte, 16) + operator.div(Byte, 16) * 10) - 1
-        Byte = self.ReadByte()
-        year = 2000 + operator.mod(Byte, 16) + operator.div(Byte, 16) * 10
-
-        dt = datetime(year, month, day, hour, minute, second)
-
-        # End DS1302 communication.
-        self.EndDS1302()
-        return dt
-
-    #/*************************************************/
-    #/* Close Raspberry Pi GPIO use before finishing. */
-    #/*************************************************/
-    def CloseGPIO(self):
-        RPi.GPIO.cleanup()
-
-
-    #/********************************************/
-    #/* Start a transaction with the DS1302 RTC. */
-    #/********************************************/
-    def InitiateDS1302(self):
-        RPi.GPIO.setup(self.RTC_DS1302_SCLK, RPi.GPIO.OUT, initial=0)
-        RPi.GPIO.setup(self.RTC_DS1302_CE, RPi.GPIO.OUT, initial=0)
-        RPi.GPIO.setup(self.RTC_DS1302_IO, RPi.GPIO.OUT, initial=0)
-        RPi.GPIO.output(self.RTC_DS1302_SCLK, 0)
-        RPi.GPIO.output(self.RTC_DS1302_IO, 0)
-        time.sleep(self.CLK_PERIOD)
-        RPi.GPIO.output(self.RTC_DS1302_CE, 1)
-
-
-    #/***********************************************/
-    #/* Complete a transaction with the DS1302 RTC. */
-    #/***********************************************/
-    def EndDS1302(self):
-        RPi.GPIO.setup(self.RTC_DS1302_SCLK, RPi.GPIO.OUT, initial=0)
-        RPi.GPIO.setup(self.RTC_DS1302_CE, RPi.GPIO.OUT, initial=0)
-        RPi.GPIO.setup(self.RTC_DS1302_IO, RPi.GPIO.OUT, initial=0)
-        RPi.GPIO.output(self.RTC_DS1302_SCLK, 0)
-        RPi.GPIO.output(self.RTC_DS1302_IO, 0)
-        time.sleep(self.CLK_PERIOD)
-        RPi.GPIO.output(self.RTC_DS1302_CE, 0)
-
-
-    #/*******************************************/
-    #/* Write a byte of data to the DS1302 RTC. */
-    #/*******************************************/
-    def WriteByte(self, Byte):
-        for Count in range(8):
-            time.sleep(self.CLK_PERIOD)
-            RPi.GPIO.output(self.RTC_DS1302_SCLK, 0)
-
-            Bit = operator.mod(Byte, 2)
-            Byte = operator.div(Byte, 2)
-            time.sleep(self.CLK_PERIOD)
-            RPi.GPIO.output(self.RTC_DS1302_IO, Bit)
-
-            time.sleep(self.CLK_PERIOD)
-            RPi.GPIO.output(self.RTC_DS1302_SCLK, 1)
-
-
-    #/******************************************/
-    #/* Read a byte of data to the DS1302 RTC. */
-    #/******************************************/
-    def ReadByte(self):
-        RPi.GPIO.setup(self.RTC_DS1302_IO, RPi.GPIO.IN, pull_up_down=RPi.GPIO.PUD_DOWN)
-
-        Byte = 0
-        for Count in range(8):
-            time.sleep(self.CLK_PERIOD)
-            RPi.GPIO.output(self.RTC_DS1302_SCLK, 1)
-
-            time.sleep(self.CLK_PERIOD)
-            RPi.GPIO.output(self.RTC_DS1302_SCLK, 0)
-
-            time.sleep(self.CLK_PERIOD)
-            Bit = RPi.GPIO.input(self.RTC_DS1302_IO)
-            Byte |= ((2 ** Count) * Bit)
-
-        return Byte
-
-
-    #/***********************************/
-    #/* Write a message to the RTC RAM. */
-    #/***********************************/
-    def WriteRAM(self, Data):
-        # Initiate DS1302 communication.
-        self.InitiateDS1302()
-        # Write address byte.
-        self.WriteByte(int("11111110", 2))
-        # Write data bytes.
-        for Count in range(len(Data)):
-            self.WriteByte(ord(Data[Count:Count + 1]))
-        for Count in range(31 - len(Data)):
-            self.WriteByte(ord(" "))
-        # End DS1302 communication.
-        self.EndDS1302()
-
-
-    #/**********************************/
-    #/* Read message from the RTC RAM. */
-    #/**********************************/
-    def ReadRAM(self):
-    # Initiate DS1302 communication.
-        self.InitiateDS1302()
-        # Write address byte.
-        self.WriteByte(int("11111111", 2))
-        # Read data bytes.
-        Data = ""
-        for Count in range(31):
-            Byte = self.ReadByte()
-            Data += chr(Byte)
-            # End DS1302 communication.
-        self.EndDS1302()
-        return Data
-
-    def _write_datetime(self, Year, Month, Day, DayOfWeek, Hour, Minute, Second):
-        # Initiate DS1302 communication.
-        self.InitiateDS1302()
-        # Write address byte.
-        self.WriteByte(int("10111110", 2))
-        # Write seconds data.
-        self.WriteByte(operator.mod(Second, 10) | operator.div(Second, 10) * 16)
-        # Write minute data.
-        self.WriteByte(operator.mod(Minute, 10) | operator.div(Minute, 10) * 16)
-        # Write hour data.
-        self.WriteByte(operator.mod(Hour, 10) | operator.div(Hour, 10) * 16)
-        # Write day data.
-        self.WriteByte(operator.mod(Day, 10) | operator.div(Day, 10) * 16)
-        # Write month data.
-        self.WriteByte(operator.mod(Month, 10) | operator.div(Month, 10) * 16)
-        # Write day of week data.
-        self.WriteByte(operator.mod(DayOfWeek, 10) | operator.div(DayOfWeek, 10) * 16)
-        # Write year of week data.
-        self.WriteByte(operator.mod(Year, 10) | operator.div(Year, 10) * 16)
-        # Make sure write protect is turned off.
-        self.WriteByte(int("00000000", 2))
-        # Make sure trickle charge mode is turned off.
-        self.WriteByte(int("00000000", 2))
-        # End DS1302 communication.
-        self.EndDS1302()
+class RTC_DS1302(RTC):
+    """
+    DS1302 clock bit-banged over three gpios
+    Date and time are read and written with a single clock burst command. The chip is fast enough for the
+    gpios to be driven back to back, the clock and data lines are set with a single call when they change
+    together. Bytes are sent least significant bit first, data is latched on rising edges of the clock and
+    read after falling edges
+    """
+
+    CLOCK_BURST_READ = 0xBF
+    CLOCK_BURST_WRITE = 0xBE
+    RAM_BURST_READ = 0xFF
+    RAM_BURST_WRITE = 0xFE
+    WRITE_PROTECT = 0x8E
+    TRICKLE_CHARGE = 0x90
+    RAM_SIZE = 31
+
+    # chip enable to clock setup time
+    CE_SETUP_TIME = 0.000004
+
+    def __init__(self, sclk=settings.RTC_SCLK_PIN, io=settings.RTC_SDAT_PIN, ce=settings.RTC_RST_PIN):
+        super(RTC_DS1302, self).__init__()
+        self.sclk = sclk
+        self.io = io
+        self.ce = ce
+        GPIO.setwarnings(False)
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup([self.sclk, self.ce], GPIO.OUT, initial=0)
+        # turn off write protect and trickle charge
+        with self.transaction():
+            self.write_bytes([self.WRITE_PROTECT, 0])
+        with self.transaction():
+            self.write_bytes([self.TRICKLE_CHARGE, 0])
+
+    @contextmanager
+    def transaction(self):
+        GPIO.setup(self.io, GPIO.OUT, initial=0)
+        GPIO.output(self.sclk, 0)
+        GPIO.output(self.ce, 1)
+        time.sleep(self.CE_SETUP_TIME)
+        try:
+            yield
+        finally:
+            GPIO.output([self.ce, self.sclk], [0, 0])
+
+    def write_bytes(self, data):
+        sclk, io = self.sclk, self.io
+        for byte in data:
+            for bit in range(8):
+                GPIO.output([sclk, io], [0, byte >> bit & 1])
+                GPIO.output(sclk, 1)
+
+    def read_bytes(self, count):
+        """ Read count bytes, right after a read command """
+        sclk, io = self.sclk, self.io
+        GPIO.setup(io, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+        data = []
+        for _ in range(count):
+            byte = 0
+            for bit in range(8):
+                GPIO.output(sclk, 1)
+                GPIO.output(sclk, 0)
+                byte |= GPIO.input(io) << bit
+            data.append(byte)
+        return data
+
+    def _read_datetime(self):
+        with self.transaction():
+            self.write_bytes([self.CLOCK_BURST_READ])
+            second, minute, hour, day, month, _, year, _ = self.read_bytes(8)
+        # mask the clock halt flag and the 12 hours mode bit
+        return datetime(2000 + bcd_to_int(year), bcd_to_int(month & 0x1F), bcd_to_int(day & 0x3F),
+                        bcd_to_int(hour & 0x3F), bcd_to_int(minute & 0x7F), bcd_to_int(second & 0x7F))
+
+    def _write_datetime(self, dt):
+        data = [dt.second, dt.minute, dt.hour, dt.day, dt.month, dt.isoweekday(), dt.year % 100]
+        with self.transaction():
+            # the last byte of a clock burst is the write protect register
+            self.write_bytes([self.CLOCK_BURST_WRITE] + [int_to_bcd(value) for value in data] + [0])
+
+    def write_ram(self, data):
+        with self.transaction():
+            self.write_bytes([self.RAM_BURST_WRITE] + [ord(c) for c in data.ljust(self.RAM_SIZE)[:self.RAM_SIZE]])
+
+    def read_ram(self):
+        with self.transaction():
+            self.write_bytes([self.RAM_BURST_READ])
+            return ''.join(chr(byte) for byte in self.read_bytes(self.RAM_SIZE))
+
+    def close(self):
+        GPIO.cleanup([self.sclk, self.io, self.ce])
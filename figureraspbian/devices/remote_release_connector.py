@@ -1,51 +1,103 @@
-
+import gc
+import logging
 import time
 
-from pifacedigitalio import PiFaceDigital
-import gpiozero
-
 from .. import settings
-from ..exceptions import InvalidIOInterfaceError
-
+from ..threads import elapsed
+from .io_hub import get_io_hub
 
-class RemoteReleaseConnector(object):
 
-    def __init__(self, pin):
-        self.pin = pin
+logger = logging.getLogger(__name__)
 
-    def trigger(self):
-        raise NotImplementedError()
+# sleeping is only accurate to a few milliseconds, the end of a wait is spent polling the clock
+SPIN_TIME = 0.002
 
-    def factory(*args, **kwargs):
-        if settings.IO_INTERFACE == 'PIFACE':
-            return PiFaceRemoteReleaseConnector(*args, **kwargs)
-        elif settings.IO_INTERFACE == 'GPIOZERO':
-            return GPIOZeroRemoteReleaseConnector(*args, **kwargs)
-        else:
-            raise InvalidIOInterfaceError()
 
-    factory = staticmethod(factory)
+def wait_until(deadline):
+    """ Sleep until shortly before deadline then spin until it is reached, returns the time it woke up """
+    remaining = deadline - elapsed()
+    if remaining > SPIN_TIME:
+        time.sleep(remaining - SPIN_TIME)
+    now = elapsed()
+    while now < deadline:
+        now = elapsed()
+    return now
 
 
-class PiFaceRemoteReleaseConnector(RemoteReleaseConnector):
+class Pulse(object):
+    """ Times at which the release was half pressed, fully pressed and released, on the clock of threads.elapsed """
 
-    def __init__(self, *args, **kwargs):
-        super(PiFaceRemoteReleaseConnector, self).__init__(*args, **kwargs)
-        self.pifacedigital = PiFaceDigital()
+    def __init__(self):
+        self.half_pressed_at = None
+        self.pressed_at = None
+        self.released_at = None
 
-    def trigger(self):
-        self.pifacedigital.relays[self.pin].turn_on()
-        time.sleep(0.1)
-        self.pifacedigital.relays[self.pin].turn_off()
+    def serialize(self):
+        return {
+            'half_pressed': self.half_pressed_at,
+            'pressed': self.pressed_at,
+            'released': self.released_at
+        }
 
 
-class GPIOZeroRemoteReleaseConnector(RemoteReleaseConnector):
+class RemoteReleaseConnector(object):
+    """
+    Triggers the camera by closing its remote release connector with a relay or a gpio, see IOHub
+    When the focus wire is connected the release is half pressed for focus_time before being fully pressed
+    """
 
-    def __init__(self, *args, **kwargs):
-        super(GPIOZeroRemoteReleaseConnector, self).__init__(*args, **kwargs)
-        self.device = gpiozero.OutputDevice(self.pin)
+    def __init__(self, pin, focus_pin=None, io_hub=None, focus_time=settings.REMOTE_RELEASE_FOCUS_TIME,
+                 pulse_duration=settings.REMOTE_RELEASE_PULSE_DURATION):
+        self.pin = pin
+        self.focus_pin = focus_pin
+        self.io_hub = io_hub or get_io_hub()
+        self.focus_time = focus_time
+        self.pulse_duration = pulse_duration
+        self.last_pulse = None
 
     def trigger(self):
-        self.device.on()
-        time.sleep(0.1)
-        self.device.off()
+        """
+        Press the release and return the Pulse with the time of each step
+        The sequence runs in the calling thread rather than on the IO hub so that no other IO work can delay it,
+        and without garbage collection pauses. Each time is taken right after its pin is written
+        """
+        pulse = Pulse()
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        released = False
+        try:
+            if self.focus_pin is not None:
+                self.io_hub.write(self.focus_pin, True)
+                pulse.half_pressed_at = elapsed()
+                wait_until(pulse.half_pressed_at + self.focus_time)
+            self.io_hub.write(self.pin, True)
+            pulse.pressed_at = elapsed()
+            wait_until(pulse.pressed_at + self.pulse_duration)
+            self.io_hub.write(self.pin, False)
+            pulse.released_at = elapsed()
+            if self.focus_pin is not None:
+                self.io_hub.write(self.focus_pin, False)
+            released = True
+        finally:
+            if not released:
+                self.release()
+            if gc_enabled:
+                gc.enable()
+        self.last_pulse = pulse
+        return pulse
+
+    def release(self):
+        """ Make sure the release is not left pressed or half pressed after a failed write """
+        for pin in (self.pin, self.focus_pin):
+            if pin is not None:
+                try:
+                    self.io_hub.write(pin, False)
+                except Exception as e:
+                    logger.exception(e)
+
+    def factory(pin, *args, **kwargs):
+        if 'focus_pin' not in kwargs and settings.REMOTE_RELEASE_FOCUS_PIN >= 0:
+            kwargs['focus_pin'] = settings.REMOTE_RELEASE_FOCUS_PIN
+        return RemoteReleaseConnector(pin, *args, **kwargs)
+
+    factory = staticmethod(factory)
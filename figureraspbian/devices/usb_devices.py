@@ -0,0 +1,145 @@
+# -*- coding: utf8 -*-
+
+import logging
+import os
+import time
+from os.path import join, exists
+from threading import Lock
+
+from .. import settings
+from ..threads import StoppableThread
+
+
+logger = logging.getLogger(__name__)
+
+
+SYSFS_USB_DEVICES = '/sys/bus/usb/devices'
+
+_usb_devices = {'devices': None, 'enumerated_at': None}
+_usb_devices_lock = Lock()
+
+
+def read_attribute(path, name):
+    try:
+        with open(join(path, name)) as f:
+            return f.read().strip()
+    except IOError:
+        return None
+
+
+def enumerate_sysfs(root=SYSFS_USB_DEVICES):
+    """ List USB devices from the attributes the kernel exposes in sysfs, interfaces are skipped """
+    devices = []
+    for entry in sorted(os.listdir(root)):
+        path = join(root, entry)
+        vendor_id = read_attribute(path, 'idVendor')
+        if vendor_id is None:
+            continue
+        tag = ' '.join(filter(None, [read_attribute(path, 'manufacturer'), read_attribute(path, 'product')]))
+        devices.append({
+            'device': '/dev/bus/usb/%03d/%03d' % (int(read_attribute(path, 'busnum')),
+                                                  int(read_attribute(path, 'devnum'))),
+            'vendor_id': vendor_id,
+            'product_id': read_attribute(path, 'idProduct'),
+            'tag': tag
+        })
+    return devices
+
+
+def enumerate_pyusb():
+    """ List USB devices with libusb when sysfs is not mounted, descriptor strings are not read """
+    import usb.core
+    return [{
+        'device': '/dev/bus/usb/%03d/%03d' % (device.bus, device.address),
+        'vendor_id': '%04x' % device.idVendor,
+        'product_id': '%04x' % device.idProduct,
+        'tag': ''
+    } for device in usb.core.find(find_all=True)]
+
+
+def get_usb_devices(max_age=None):
+    """
+    List USB devices as dicts with device, vendor_id, product_id and tag keys
+    The list is cached for max_age seconds, USB_DEVICES_CACHE_TTL by default
+    """
+    max_age = settings.USB_DEVICES_CACHE_TTL if max_age is None else max_age
+    with _usb_devices_lock:
+        enumerated_at = _usb_devices['enumerated_at']
+        if enumerated_at is None or time.time() - enumerated_at >= max_age:
+            if exists(SYSFS_USB_DEVICES):
+                devices = enumerate_sysfs()
+            else:
+                devices = enumerate_pyusb()
+            _usb_devices['devices'] = devices
+            _usb_devices['enumerated_at'] = time.time()
+        return list(_usb_devices['devices'])
+
+
+class USBMonitor(StoppableThread):
+    """
+    Enumerates USB devices at regular intervals and calls subscribers with the lists of devices added and
+    removed since the previous check. A device unplugged and plugged back gets a new device path so it
+    shows up as removed then added even if both happened between two checks
+    """
+
+    def __init__(self, interval=settings.USB_HOTPLUG_INTERVAL):
+        super(USBMonitor, self).__init__(target=self.monitor)
+        self.daemon = True
+        self.interval = interval
+        self.devices = None
+        self._subscribers = []
+        self._lock = Lock()
+
+    def subscribe(self, callback):
+        """ Register a callback called with the lists of added and removed devices """
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers.remove(callback)
+
+    def check(self):
+        devices = get_usb_devices(max_age=0)
+        with self._lock:
+            previous = self.devices
+            self.devices = devices
+            subscribers = list(self._subscribers)
+        if previous is None:
+            return [], []
+        added = [device for device in devices if device not in previous]
+        removed = [device for device in previous if device not in devices]
+        if added or removed:
+            for device in added:
+                logger.info("USB device plugged: %s" % device)
+            for device in removed:
+                logger.info("USB device unplugged: %s" % device)
+            for callback in subscribers:
+                try:
+                    callback(added, removed)
+                except Exception as e:
+                    logger.exception(e)
+        return added, removed
+
+    def monitor(self):
+        while not self.stopping.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.exception(e)
+
+    def start(self):
+        """ Enumerate devices once so that later checks report changes from now on """
+        self.check()
+        super(USBMonitor, self).start()
+
+
+_usb_monitor = None
+
+
+def get_usb_monitor():
+    """ Instantiate USB monitor lazily """
+    global _usb_monitor
+    if not _usb_monitor:
+        _usb_monitor = USBMonitor()
+    return _usb_monitor
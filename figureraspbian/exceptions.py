@@ -39,4 +39,12 @@ class TimeoutWaitingForFileAdded(FigureError):
 
 
 class UnknownFilterException(FigureError):
-    """ Error raised when an invalid PIL image filter name was provided """
\ No newline at end of file
+    """ Error raised when an invalid PIL image filter name was provided """
+
+
+class PrinterUSBError(FigureError):
+    """ Error raised when the communication with the printer fails while it still has paper """
+
+
+class PrintQueueFullError(FigureError):
+    """ Error raised when the printer does not catch up with the tickets submitted to it """
@@ -0,0 +1,369 @@
+# -*- coding: utf8 -*-
+
+import cStringIO
+import json
+import logging
+import time
+
+from PIL import Image, ImageChops, ImageFilter
+
+import settings
+
+
+logger = logging.getLogger(__name__)
+
+FLOYD_STEINBERG = 'floyd-steinberg'
+ORDERED = 'ordered'
+ATKINSON = 'atkinson'
+NONE = 'none'
+
+STRETCH = 'stretch'
+LOCAL = 'local'
+
+NORMALIZATION_METHODS = (STRETCH, LOCAL, NONE)
+
+DITHERING_METHODS = (FLOYD_STEINBERG, ORDERED, ATKINSON, NONE)
+
+# 8x8 Bayer index matrix used for ordered dithering
+BAYER_MATRIX = [
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21]
+]
+
+# maps an L image to a 1 image, any non zero pixel is white
+_NON_ZERO_TO_WHITE = [0] + [255] * 255
+_THRESHOLD_TO_WHITE = [0] * 128 + [255] * 128
+
+_threshold_maps = {}
+THRESHOLD_MAPS_CACHE_SIZE = 8
+
+TONE_PARAMETERS = ('contrast', 'brightness', 'gamma', 'sharpness')
+
+# tone curves by (contrast, brightness, gamma)
+_tone_curves = {}
+
+# parameters by event id, by value of the TONE_CURVES setting
+_event_tone_parameters = {}
+
+# interpolation masks by (size, grid)
+_tile_masks = {}
+
+
+def open_resized(data, size, resample=Image.ANTIALIAS):
+    """
+    Decode an image to the given size
+    JPEG images are decoded at the smallest scale (1/2, 1/4 or 1/8) that is still larger than the target size
+    so that only one high quality resample of a small image is needed
+    """
+    im = Image.open(cStringIO.StringIO(data))
+    format = im.format
+    if format == 'JPEG':
+        im.draft(im.mode, size)
+    if im.size != size:
+        im = im.resize(size, resample)
+    # keep the format so that the picture can be encoded back the same way
+    im.format = format
+    return im
+
+
+def resize_to_width(image, width, resample=Image.ANTIALIAS):
+    """ Resize an image to the given width preserving its ratio """
+    w, h = image.size
+    if w == width:
+        return image
+    return image.resize((width, int(round(width * h / float(w)))), resample)
+
+
+def is_valid_tone_parameter(name, value):
+    if name not in TONE_PARAMETERS or isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    return value > 0 if name == 'gamma' else value >= 0
+
+
+def parse_tone_curves(value):
+    """
+    Parameters by event id of the TONE_CURVES setting
+    Invalid JSON or an invalid curve is logged and ignored, the global parameters are used instead
+    """
+    try:
+        curves = json.loads(value)
+    except ValueError:
+        logger.error('TONE_CURVES is not valid JSON, it is ignored')
+        return {}
+    if not isinstance(curves, dict):
+        logger.error('TONE_CURVES is not a JSON object, it is ignored')
+        return {}
+    parsed = {}
+    for event_id, parameters in curves.items():
+        if not isinstance(parameters, dict) or \
+                not all(is_valid_tone_parameter(name, v) for name, v in parameters.items()):
+            logger.error('Tone curve of event %s is invalid, it is ignored: %r' % (event_id, parameters))
+            continue
+        parsed[str(event_id)] = {name: float(v) for name, v in parameters.items()}
+    return parsed
+
+
+def get_event_tone_parameters():
+    """ TONE_CURVES parsed once for each of its values """
+    value = settings.TONE_CURVES
+    parameters = _event_tone_parameters.get(value)
+    if parameters is None:
+        parameters = parse_tone_curves(value)
+        _event_tone_parameters.clear()
+        _event_tone_parameters[value] = parameters
+    return parameters
+
+
+def get_tone_parameters(event=None):
+    """ Enhancement parameters of an event, falling back to the global settings """
+    parameters = {
+        'contrast': settings.CONTRAST_FACTOR,
+        'brightness': settings.BRIGHTNESS_FACTOR,
+        'gamma': settings.GAMMA,
+        'sharpness': settings.SHARPNESS_FACTOR
+    }
+    if event is not None:
+        parameters.update(get_event_tone_parameters().get(str(event.id), {}))
+    return parameters
+
+
+def get_tone_curve(contrast=1.0, brightness=1.0, gamma=1.0):
+    """
+    Lookup table applying contrast around middle gray, then brightness, then gamma
+    Tables are cached by parameters since they only change with the event
+    """
+    key = (contrast, brightness, gamma)
+    tone_curve = _tone_curves.get(key)
+    if tone_curve is None:
+        tone_curve = []
+        for i in range(256):
+            value = (0.5 + contrast * (i / 255.0 - 0.5)) * brightness
+            value = min(max(value, 0.0), 1.0) ** (1.0 / gamma)
+            tone_curve.append(int(round(value * 255)))
+        _tone_curves[key] = tone_curve
+    return tone_curve
+
+
+def enhance(image, contrast=1.0, brightness=1.0, gamma=1.0, sharpness=1.0):
+    """
+    Apply the tone curve in a single pass and sharpen with an unsharp mask
+    Meant to be run on the picture at its output resolution
+    """
+    format = image.format
+    if (contrast, brightness, gamma) != (1.0, 1.0, 1.0):
+        image = image.point(get_tone_curve(contrast, brightness, gamma) * len(image.getbands()))
+    if sharpness > 1.0:
+        percent = int(round((sharpness - 1.0) * 100))
+        image = image.filter(ImageFilter.UnsharpMask(radius=2, percent=percent, threshold=3))
+    image.format = format
+    return image
+
+
+def get_stretch_curve(histogram, cutoff):
+    """ Lookup table stretching the levels between the cutoff percentiles of the histogram to the full range """
+    limit = sum(histogram) * cutoff / 100.0
+    low, count = 0, histogram[0]
+    while low < 255 and count <= limit:
+        low += 1
+        count += histogram[low]
+    high, count = 255, histogram[255]
+    while high > 0 and count <= limit:
+        high -= 1
+        count += histogram[high]
+    if high <= low:
+        return range(256)
+    scale = 255.0 / (high - low)
+    return [min(max(int(round((i - low) * scale)), 0), 255) for i in range(256)]
+
+
+def get_equalization_curve(histogram, clip_limit):
+    """
+    Lookup table equalizing a histogram whose bins are clipped to clip_limit times the average bin
+    The clipped counts are spread over all bins which limits the amplification of noise in flat areas
+    """
+    total = sum(histogram)
+    if not total:
+        return range(256)
+    limit = max(clip_limit * total / 256.0, 1)
+    excess = sum(max(count - limit, 0) for count in histogram)
+    spread = excess / 256.0
+    # the darkest level is mapped to black
+    first = min(histogram[0], limit) + spread
+    if total - first <= 0:
+        return range(256)
+    curve = []
+    cumulated = 0
+    for count in histogram:
+        cumulated += min(count, limit) + spread
+        curve.append(min(max(int(round((cumulated - first) * 255 / (total - first))), 0), 255))
+    return curve
+
+
+def get_tile_masks(size, grid, mode='L'):
+    """
+    Weight of each tile for each pixel, the bilinear resize of a grid with a single lit cell
+    The weights of a pixel add up to 255
+    """
+    key = (size, grid, mode)
+    masks = _tile_masks.get(key)
+    if masks is None:
+        masks = []
+        for index in range(grid * grid):
+            cells = [0] * (grid * grid)
+            cells[index] = 255
+            cell = Image.new('L', (grid, grid))
+            cell.putdata(cells)
+            mask = cell.resize(size, Image.BILINEAR)
+            if mode != 'L':
+                mask = Image.merge(mode, [mask] * len(mode))
+            masks.append(mask)
+        _tile_masks.clear()
+        _tile_masks[key] = masks
+    return masks
+
+
+def normalize(image, method=None, cutoff=None, grid=None, clip_limit=None, budget=None):
+    """
+    Normalize the tones of a picture to compensate for the lighting of the booth
+    stretch: map the levels between the cutoff percentiles to the full range
+    local: contrast limited equalization of each tile of a grid, interpolated between tiles
+    Histograms are computed on a downscaled copy. Local equalization falls back to the stretch if it
+    is not going to complete within budget seconds
+    """
+    method = method or settings.NORMALIZATION
+    cutoff = settings.NORMALIZATION_CUTOFF if cutoff is None else cutoff
+    grid = grid or settings.NORMALIZATION_GRID
+    clip_limit = clip_limit or settings.NORMALIZATION_CLIP_LIMIT
+    budget = settings.NORMALIZATION_BUDGET if budget is None else budget
+    if method not in NORMALIZATION_METHODS:
+        raise ValueError('Unknown normalization method %s' % method)
+    if method == NONE or image.mode not in ('L', 'RGB'):
+        return image
+    started_at = time.time()
+    format = image.format
+    bands = len(image.getbands())
+    w, h = image.size
+    ratio = min(settings.NORMALIZATION_SAMPLE_SIZE / float(max(w, h)), 1.0)
+    sample = image.resize((max(int(w * ratio), grid), max(int(h * ratio), grid)), Image.NEAREST)
+    if sample.mode != 'L':
+        sample = sample.convert('L')
+    stretch_curve = get_stretch_curve(sample.histogram(), cutoff)
+    stretched = image.point(stretch_curve * bands)
+    stretched.format = format
+    if method == STRETCH:
+        return stretched
+    # tiles are equalized after the stretch, both curves are combined to map the picture in one pass
+    sample = sample.point(stretch_curve)
+    sw, sh = sample.size
+    normalized = None
+    masks = get_tile_masks(image.size, grid, image.mode)
+    for index, mask in enumerate(masks):
+        # give up as soon as the tiles done so far show the budget will be exceeded
+        elapsed = time.time() - started_at
+        if index and elapsed / index * len(masks) > budget:
+            logger.warning('Local normalization would exceed its budget of %s sec' % budget)
+            return stretched
+        x, y = index % grid, index / grid
+        box = (x * sw / grid, y * sh / grid, (x + 1) * sw / grid, (y + 1) * sh / grid)
+        curve = get_equalization_curve(sample.crop(box).histogram(), clip_limit)
+        curve = [curve[level] for level in stretch_curve]
+        weighted = ImageChops.multiply(image.point(curve * bands), mask)
+        normalized = weighted if normalized is None else ImageChops.add(normalized, weighted)
+    normalized.format = format
+    return normalized
+
+
+def get_threshold_map(size):
+    """ Bayer thresholds tiled to the given size, cached because tickets of a template share their size """
+    threshold_map = _threshold_maps.get(size)
+    if threshold_map is None:
+        tile = Image.new('L', (8, 8))
+        tile.putdata([(value * 4 + 2) for row in BAYER_MATRIX for value in row])
+        w, h = size
+        row = Image.new('L', (w, 8))
+        for x in range(0, w, 8):
+            row.paste(tile, (x, 0))
+        threshold_map = Image.new('L', size)
+        for y in range(0, h, 8):
+            threshold_map.paste(row, (0, y))
+        if len(_threshold_maps) >= THRESHOLD_MAPS_CACHE_SIZE:
+            _threshold_maps.clear()
+        _threshold_maps[size] = threshold_map
+    return threshold_map
+
+
+def ordered_dither(image):
+    """ A pixel is white if it is brighter than its Bayer threshold """
+    difference = ImageChops.subtract(image, get_threshold_map(image.size))
+    return difference.point(_NON_ZERO_TO_WHITE, '1')
+
+
+def atkinson_dither(image):
+    """
+    Atkinson error diffusion, only 3/4 of the error is propagated which keeps highlights and shadows clean
+    on thermal paper. Written in pure Python, pixels without error are skipped, which is most of a ticket.
+    Each pixel depends on the error of the previous ones so it cannot be split into PIL operations, it is still
+    too slow to print tickets in production, see settings.DITHERING
+    """
+    w, h = image.size
+    pixels = bytearray(image.tobytes())
+    # errors of the current row and of the next two rows, padded to avoid bound checks
+    errors = [[0] * (w + 3) for _ in range(3)]
+    for y in range(h):
+        current, next_row, after_next = errors
+        offset = y * w
+        for x in range(w):
+            value = pixels[offset + x] + current[x + 1]
+            if value >= 128:
+                pixels[offset + x] = 255
+                error = value - 255
+            else:
+                pixels[offset + x] = 0
+                error = value
+            # an eighth of the error, rounded to the nearest integer
+            error = (error + 4) >> 3
+            if error:
+                current[x + 2] += error
+                current[x + 3] += error
+                next_row[x] += error
+                next_row[x + 1] += error
+                next_row[x + 2] += error
+                after_next[x + 1] += error
+        current[:] = [0] * (w + 3)
+        errors = [next_row, after_next, current]
+    return Image.frombytes('L', image.size, bytes(pixels)).point(_NON_ZERO_TO_WHITE, '1')
+
+
+def dither(image, method=None):
+    """ Convert an image to a black and white bitmap suitable for thermal printers """
+    method = method or settings.DITHERING
+    if image.mode == '1':
+        return image
+    if method not in DITHERING_METHODS:
+        raise ValueError('Unknown dithering method %s' % method)
+    if method == FLOYD_STEINBERG:
+        return image.convert('1')
+    if image.mode != 'L':
+        image = image.convert('L')
+    if method == ORDERED:
+        return ordered_dither(image)
+    if method == ATKINSON:
+        return atkinson_dither(image)
+    return image.point(_THRESHOLD_TO_WHITE, '1')
+
+
+def prepare_ticket(data, width=None, method=None):
+    """ Decode a ticket, resize it to the printer width and dither it """
+    im = Image.open(cStringIO.StringIO(data))
+    if width and im.size[0] != width or im.mode != '1':
+        # one channel to resample and dither instead of three or four
+        im = im.convert('L')
+    if width:
+        im = resize_to_width(im, width)
+    return dither(im, method)
@@ -0,0 +1,101 @@
+# -*- coding: utf8 -*-
+
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from threading import Lock
+from Queue import Queue
+
+import settings
+from threads import StoppableThread
+
+
+logger = logging.getLogger(__name__)
+
+
+class Job(object):
+    """ A long running operation requested through the API """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, name, func, args=(), kwargs=None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.status = Job.QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.ended_at = None
+
+    def run(self):
+        self.started_at = time.time()
+        self.status = Job.RUNNING
+        try:
+            self.result = self.func(*self.args, **self.kwargs)
+            self.status = Job.DONE
+        except Exception as e:
+            logger.exception(e)
+            self.error = e
+            self.status = Job.FAILED
+        finally:
+            self.ended_at = time.time()
+
+
+class JobRunner(StoppableThread):
+    """
+    Runs jobs one after the other in a background thread so that API requests return right away
+    Only the last `history_size` jobs are kept along with their results
+    """
+
+    def __init__(self, history_size=settings.JOBS_HISTORY_SIZE):
+        super(JobRunner, self).__init__(target=self.work)
+        self.daemon = True
+        self.history_size = history_size
+        self.queue = Queue()
+        self.jobs = OrderedDict()
+        self._lock = Lock()
+
+    def submit(self, name, func, *args, **kwargs):
+        job = Job(name, func, args, kwargs)
+        with self._lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.history_size:
+                self.jobs.popitem(last=False)
+            if not self.is_alive():
+                self.start()
+        self.queue.put(job)
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def work(self):
+        while not self.stopping.is_set():
+            job = self.queue.get()
+            if job is not None:
+                job.run()
+
+    def stop(self):
+        self.stopping.set()
+        # wake up the worker
+        self.queue.put(None)
+        self.join()
+
+
+_job_runner = None
+
+
+def get_job_runner():
+    """ Instantiate job runner lazily """
+    global _job_runner
+    if not _job_runner:
+        _job_runner = JobRunner()
+    return _job_runner
@@ -8,6 +8,44 @@ import settings
 import utils
 from db import db
 
+# SQLite does not accept more than 999 parameters in a single query
+SQLITE_MAX_VARIABLES = 999
+
+
+def _get_existing(model, ids, owned):
+    """ Returns the instances of model having one of the given ids or matching the owned clause, indexed by id """
+    existing = {instance.id: instance for instance in model.select().where(owned)}
+    missing = [pk for pk in ids if pk not in existing]
+    for chunk in utils.chunks(missing, SQLITE_MAX_VARIABLES):
+        existing.update((instance.id, instance) for instance in model.select().where(model.id << chunk))
+    return existing
+
+
+def _bulk_sync(model, rows, existing):
+    """
+    Insert, update and delete instances of model so that they match rows, a list of dicts of raw field values
+    existing maps the ids of instances currently stored to the instances, instances not in rows are deleted
+    """
+    ids = set(row['id'] for row in rows)
+    stale = [pk for pk in existing if pk not in ids]
+    for chunk in utils.chunks(stale, SQLITE_MAX_VARIABLES):
+        model.delete().where(model.id << chunk).execute()
+
+    new, changed = [], []
+    for row in rows:
+        instance = existing.get(row['id'])
+        if instance is None:
+            new.append(row)
+        elif any(instance._data.get(key) != value for key, value in row.items()):
+            changed.append(row)
+
+    # changed rows are written back whole with INSERT OR REPLACE so that updates are batched too
+    for batch, upsert in [(new, False), (changed, True)]:
+        if batch:
+            for chunk in utils.chunks(batch, SQLITE_MAX_VARIABLES // len(batch[0])):
+                model.insert_many(chunk).upsert(upsert).execute()
+
+
 class Place(db.Model):
 
     name = CharField()
@@ -85,25 +123,74 @@ class TicketTemplate(db.Model):
 
     @classmethod
     def update_or_create(cls, ticket_template):
+        """
+        Create or update a ticket template along with its variables, texts and images
+        Existing rows are diffed against the payload in memory, new images are downloaded and the changes
+        are then written in a single transaction with batched inserts, updates and deletes
+        """
+        template_id = ticket_template['id']
+        text_variables = ticket_template['text_variables']
+        image_variables = ticket_template['image_variables']
+
+        existing_text_variables = _get_existing(
+            TextVariable, [tv['id'] for tv in text_variables], TextVariable.ticket_template == template_id)
+        existing_image_variables = _get_existing(
+            ImageVariable, [iv['id'] for iv in image_variables], ImageVariable.ticket_template == template_id)
+
+        text_variable_ids = list(existing_text_variables) + [tv['id'] for tv in text_variables]
+        texts = [dict(item, variable=tv['id']) for tv in text_variables for item in tv['items']]
+        existing_texts = _get_existing(Text, [text['id'] for text in texts], Text.variable << text_variable_ids)
+
+        image_variable_ids = list(existing_image_variables) + [iv['id'] for iv in image_variables]
+        images = [dict(image, variable=None, ticket_template=template_id) for image in ticket_template['images']]
+        images += [dict(item, variable=iv['id'], ticket_template=None) for iv in image_variables for item in iv['items']]
+        existing_images = _get_existing(
+            Image, [image['id'] for image in images],
+            (Image.ticket_template == template_id) | (Image.variable << image_variable_ids))
+
+        # make sure all image files are present before writing anything to the database
+        to_download = set(image['id'] for image in images
+                          if image['id'] not in existing_images or
+                          basename(existing_images[image['id']].path) != image.get('name'))
+        downloaded = utils.download_all(
+            [image['image'] for image in images if image['id'] in to_download], settings.IMAGE_ROOT)
+
+        image_rows = []
+        for image in images:
+            if image['id'] in to_download:
+                path = downloaded[image['image']]
+            else:
+                path = existing_images[image['id']].path
+            image_rows.append({
+                'id': image['id'], 'path': path, 'variable': image['variable'],
+                'ticket_template': image['ticket_template']})
 
-        try:
-            tt = cls.get(TicketTemplate.id == ticket_template['id'])
-            tt.html = ticket_template['html']
-            tt.title = ticket_template['title']
-            tt.description = ticket_template['description']
-            tt.modified = ticket_template['modified']
-            tt.save()
-        except cls.DoesNotExist:
-            tt = cls.create(**ticket_template)
-
-        for text_variable in ticket_template['text_variables']:
-            TextVariable.update_or_create(text_variable, ticket_template=tt)
-
-        for image_variable in ticket_template['image_variables']:
-            ImageVariable.update_or_create(image_variable, ticket_template=tt)
-
-        for image in ticket_template['images']:
-            Image.update_or_create(image, ticket_template=tt)
+        with db.database.atomic():
+            try:
+                tt = cls.get(cls.id == template_id)
+                tt.html = ticket_template['html']
+                tt.title = ticket_template['title']
+                tt.description = ticket_template['description']
+                tt.modified = ticket_template['modified']
+                tt.save()
+            except cls.DoesNotExist:
+                tt = cls.create(
+                    id=template_id,
+                    html=ticket_template['html'],
+                    title=ticket_template['title'],
+                    description=ticket_template['description'],
+                    modified=ticket_template['modified'])
+
+            _bulk_sync(TextVariable, [
+                {'id': tv['id'], 'name': tv.get('name'), 'mode': tv.get('mode'), 'ticket_template': template_id}
+                for tv in text_variables], existing_text_variables)
+            _bulk_sync(ImageVariable, [
+                {'id': iv['id'], 'name': iv.get('name'), 'mode': iv.get('mode'), 'ticket_template': template_id}
+                for iv in image_variables], existing_image_variables)
+            _bulk_sync(Text, [
+                {'id': text['id'], 'value': text['text'], 'variable': text['variable']}
+                for text in texts], existing_texts)
+            _bulk_sync(Image, image_rows, existing_images)
 
         return tt
 
@@ -123,24 +210,6 @@ class TextVariable(db.Model):
         }
         return data
 
-    @classmethod
-    def update_or_create(cls, text_variable, ticket_template=None):
-        try:
-            tv = cls.get(TextVariable.id == text_variable['id'])
-            if tv.name != text_variable.get('name') or tv.mode != text_variable.get('mode'):
-                tv.name = text_variable.get('name')
-                tv.mode = text_variable.get('mode')
-                tv.save()
-            text_ids = [item['id'] for item in text_variable['items']]
-            query = Text.select().where(~(Text.id << text_ids)).join(TextVariable).where(TextVariable.id == text_variable['id'])
-            for text in query:
-                text.delete_instance()
-        except cls.DoesNotExist:
-            tv = cls.create(ticket_template=ticket_template, **text_variable)
-        for text in text_variable['items']:
-            Text.update_or_create(text, tv)
-        return tv
-
 
 class Text(db.Model):
 
@@ -150,17 +219,6 @@ class Text(db.Model):
     def serialize(self):
         return {'id': self.id, 'text': self.value}
 
-    @classmethod
-    def update_or_create(cls, text, variable=None):
-        try:
-            txt = Text.get(cls.id == text['id'])
-            if txt.value != text['text']:
-                txt.value = text['text']
-                txt.save()
-            return txt
-        except cls.DoesNotExist:
-            return Text.create(id=text['id'], value=text['text'], variable=variable)
-
 
 class ImageVariable(db.Model):
 
@@ -177,24 +235,6 @@ class ImageVariable(db.Model):
         }
         return data
 
-    @classmethod
-    def update_or_create(cls, image_variable, ticket_template=None):
-        try:
-            iv = cls.get(ImageVariable.id == image_variable['id'])
-            if iv.name != image_variable.get('name') or iv.mode != image_variable.get('mode'):
-                iv.name = image_variable.get('name')
-                iv.mode = image_variable.get('mode')
-                iv.save()
-            image_ids = [item['id'] for item in image_variable['items']]
-            query = Image.select().where(~(Image.id << image_ids)).join(ImageVariable).where(ImageVariable.id == image_variable['id'])
-            for image in query:
-                image.delete_instance()
-        except cls.DoesNotExist:
-            iv = cls.create(ticket_template=ticket_template, **image_variable)
-        for image in image_variable['items']:
-            Image.update_or_create(image, variable=iv)
-        return iv
-
 
 class Image(db.Model):
 
@@ -205,18 +245,18 @@ class Image(db.Model):
     def serialize(self):
         return {'id': self.id, 'name': basename(self.path)}
 
-    @classmethod
-    def update_or_create(cls, image, variable=None, ticket_template=None):
-        try:
-            img = cls.get(Image.id == image['id'])
-            if basename(img.path) != image['name']:
-                path = utils.download(image['image'], settings.IMAGE_ROOT)
-                img.path = path
-                img.save()
-            return img
-        except cls.DoesNotExist:
-            path = utils.download(image['image'], settings.IMAGE_ROOT)
-            return cls.create(id=image['id'], path=path, variable=variable, ticket_template=ticket_template)
+
+# Relations of the photobooth that are synced from the API, each carrying a modification date
+SYNCED_RELATIONS = ('place', 'event', 'ticket_template')
+
+
+def get_versions_from_api_data(photobooth):
+    """ Returns the versions of a full photobooth payload in the same format as Photobooth.get_versions """
+    versions = {'id': photobooth['id'], 'serial_number': photobooth.get('serial_number')}
+    for key in SYNCED_RELATIONS:
+        related = photobooth.get(key)
+        versions[key] = (related['id'], related.get('modified')) if related else None
+    return versions
 
 
 class Photobooth(db.Model):
@@ -229,7 +269,19 @@ class Photobooth(db.Model):
     paper_level = FloatField(default=100.0)
     counter = IntegerField(default=0)
 
-    def update_from_api_data(self, photobooth):
+    def get_versions(self):
+        """ Returns the identifiers and last known modification dates of the data synced from the API """
+        versions = {'id': self.id, 'serial_number': self.serial_number}
+        for key in SYNCED_RELATIONS:
+            related = getattr(self, key)
+            versions[key] = (related.id, related.modified) if related else None
+        return versions
+
+    def update_from_api_data(self, photobooth, partial=False):
+        """
+        Update the photobooth and its related data from an API payload
+        When partial is True, relations missing from the payload are considered unchanged
+        """
 
         update_dict = {}
 
@@ -243,7 +295,10 @@ class Photobooth(db.Model):
         # check if we need to update the place
         place = photobooth.get('place')
 
-        if place and not self.place:
+        if partial and 'place' not in photobooth:
+            pass
+
+        elif place and not self.place:
             p = Place.update_or_create(place)
             update_dict['place'] = p
 
@@ -266,7 +321,11 @@ class Photobooth(db.Model):
 
         # check if we need to update the event
         event = photobooth.get('event')
-        if event and not self.event:
+
+        if partial and 'event' not in photobooth:
+            pass
+
+        elif event and not self.event:
             e = Event.update_or_create(event)
             update_dict['event'] = e
 
@@ -289,7 +348,10 @@ class Photobooth(db.Model):
         # check if we need to update the ticket template
         ticket_template = photobooth.get('ticket_template')
 
-        if ticket_template and not self.ticket_template:
+        if partial and 'ticket_template' not in photobooth:
+            pass
+
+        elif ticket_template and not self.ticket_template:
             t = TicketTemplate.update_or_create(ticket_template)
             update_dict['ticket_template'] = t
 
@@ -0,0 +1,97 @@
+# -*- coding: utf8 -*-
+
+import logging
+import time
+from threading import Lock
+
+from usb.core import USBError
+
+import settings
+from threads import StoppableThread
+from devices.printer import PAPER_OK, PAPER_NEAR_END, PAPER_OUT
+
+
+logger = logging.getLogger(__name__)
+
+
+def reconcile_paper_level(paper_level, status, previous_status=None, near_end_sensor=True):
+    """
+    Correct the paper level estimated from the length of the tickets with the state of the paper sensors
+    The estimate is kept as long as it agrees with the sensors. Paper found after the sensors reported it out
+    is a new roll, or at startup when the level was left at 0. The near end floor only applies to printers
+    whose sensors report the near end
+    """
+    if status is None:
+        return paper_level
+    if status == PAPER_OUT:
+        return 0
+    if previous_status == PAPER_OUT or (previous_status is None and paper_level == 0):
+        return 100.0 if status == PAPER_OK else settings.PAPER_NEAR_END_LEVEL
+    if status == PAPER_NEAR_END:
+        return min(paper_level, settings.PAPER_NEAR_END_LEVEL)
+    if near_end_sensor:
+        return max(paper_level, settings.PAPER_NEAR_END_LEVEL)
+    return paper_level
+
+
+class PaperMonitor(StoppableThread):
+    """
+    Reads the paper sensors of the printer in the background and caches the result so that a trigger never
+    waits for a USB status query. Subscribers are called with the new status on every change
+    """
+
+    def __init__(self, printer=None, interval=settings.PAPER_STATUS_INTERVAL):
+        super(PaperMonitor, self).__init__(target=self.monitor)
+        self.daemon = True
+        self.printer = printer
+        self.interval = interval
+        # None until the sensors have been read successfully
+        self.status = None
+        self.checked_at = None
+        self._subscribers = []
+        self._lock = Lock()
+
+    def subscribe(self, callback):
+        """ Register a callback called with PAPER_OK, PAPER_NEAR_END or PAPER_OUT when the status changes """
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers.remove(callback)
+
+    def check(self):
+        if self.printer is None:
+            return self.status
+        try:
+            status = self.printer.get_status()['paper']
+        except (USBError, NotImplementedError) as e:
+            # keep the last known status, the printer may be busy printing
+            logger.warning("Paper sensors could not be read: %s" % e)
+            return self.status
+        with self._lock:
+            changed = status != self.status
+            self.status = status
+            self.checked_at = time.time()
+            subscribers = list(self._subscribers)
+        if changed:
+            logger.info("Paper status is now %s" % status)
+            for callback in subscribers:
+                try:
+                    callback(status)
+                except Exception as e:
+                    logger.exception(e)
+        return status
+
+    def paper_present(self):
+        """ Cached answer, there is paper unless the sensors said otherwise """
+        return self.status != PAPER_OUT
+
+    def monitor(self):
+        while not self.stopping.wait(self.interval):
+            self.check()
+
+    def start(self):
+        """ Read the sensors once so that the status is known when this returns, then keep monitoring """
+        self.check()
+        super(PaperMonitor, self).start()
@@ -2,25 +2,26 @@
 
 from datetime import datetime
 import pytz
-import cStringIO
 import logging
-from threading import Thread
-import time
+from threading import Thread, Lock, Event
 from os import path
 
 from ticketrenderer import TicketRenderer
-from PIL import Image
 
 from models import Code, Photobooth as PhotoboothModel
 import settings
 import utils
+import imaging
 from decorators import execute_if_not_busy
-from exceptions import OutOfPaperError, DevicesBusy, PhotoboothNotReady
+from exceptions import OutOfPaperError, DevicesBusy, PhotoboothNotReady, PrintQueueFullError
 import request
 from devices.camera import Camera
 from devices.printer import Printer
 from devices.door_lock import DoorLock
+from print_queue import PrintJob, PrintQueue
+from paper_monitor import PaperMonitor, reconcile_paper_level
 from threads import rlock
+from tracing import trace, span
 import webkit2png
 
 
@@ -29,24 +30,51 @@ logger = logging.getLogger(__name__)
 
 class Photobooth(object):
 
-    def __init__(self):
+    def __init__(self, with_devices=True):
         # data
         self.photobooth = PhotoboothModel.get()
         self.context = None
-        self.update_dict = {}
         # devices
         self.camera = self.printer = self.door_lock = None
+        self.print_queue = PrintQueue()
+        self.paper_monitor = PaperMonitor()
+        self.paper_monitor.subscribe(self.on_paper_status_change)
+        self._paper_level_lock = Lock()
+        # last status reported by the paper monitor, a refill is the paper coming back after it was out
+        self._paper_status = None
+        self._triggering = Event()
         self.ready = False
-        self.initialize_devices()
-        if self.camera and self.printer:
-            self.ready = True
+        if with_devices:
+            self.initialize_devices()
 
     def initialize_devices(self):
-        self.camera = Camera.factory()
-        if self.camera:
-            self.camera.clear_space()
-        self.printer = Printer.factory()
+        """ Create the devices, the ones created in the meantime by the device manager are kept """
+        devices = {'camera': self.create_camera(), 'printer': Printer.factory()}
         self.door_lock = DoorLock.factory(settings.DOOR_LOCK_PIN)
+        self.swap_devices(**dict((name, device) for name, device in devices.items()
+                                 if device and getattr(self, name) is None))
+
+    def create_camera(self):
+        camera = Camera.factory()
+        if camera:
+            camera.clear_space()
+        return camera
+
+    def set_printer(self, printer):
+        """ Hand the printer over to everything that uses it """
+        self.printer = self.print_queue.printer = self.paper_monitor.printer = printer
+
+    def swap_devices(self, **devices):
+        """
+        Replace the camera and/or the printer and update readiness at once
+        Waits for a trigger in progress so that it never sees a device change under its feet
+        """
+        with rlock:
+            if 'camera' in devices:
+                self.camera = devices['camera']
+            if 'printer' in devices:
+                self.set_printer(devices['printer'])
+            self.ready = bool(self.camera and self.printer)
 
     def trigger(self):
         if self.ready:
@@ -59,26 +87,40 @@ class Photobooth(object):
 
     @execute_if_not_busy(rlock)
     def _trigger(self):
-        self.photobooth = PhotoboothModel.get()
-        if self.photobooth.paper_level == 0:
-            # check if someone has refilled the paper
-            paper_present = self.printer.paper_present()
-            if not paper_present:
-                return
-        picture = self.camera.capture()
-        return self.render_print_and_upload(picture)
+        self._triggering.set()
+        try:
+            with trace(), span('trigger'):
+                self.photobooth = PhotoboothModel.get()
+                # the paper sensors are read in the background, a refill raises the paper level on its own
+                if self.photobooth.paper_level == 0 and not self.paper_monitor.paper_present():
+                    return
+                picture = self.camera.capture()
+                return self.render_print_and_upload(picture)
+        finally:
+            self._triggering.clear()
+
+    def is_busy(self):
+        """ True while a picture is taken or tickets are waiting to be printed """
+        return self._triggering.is_set() or not self.print_queue.is_idle()
 
     @execute_if_not_busy(rlock)
     def render_print_and_upload(self, picture):
+        with trace():
+            return self._render_print_and_upload(picture)
+
+    def _render_print_and_upload(self, picture):
         self.set_context()
         html = self.render_ticket(picture)
-        ticket = webkit2png.get_screenshot(html)
+        with span('screenshot'):
+            ticket = webkit2png.get_screenshot(html)
+        # the ticket is printed in the background, the paper level is updated once it is out
+        template = (self.ticket_template.id, self.ticket_template.modified) if self.ticket_template else None
         try:
-            ticket_length = self.print_image(ticket)
-            self.update_dict['paper_level'] = utils.new_paper_level(self.paper_level, ticket_length)
-        except OutOfPaperError:
-            logger.info("The printer is out of paper")
-            self.update_dict['paper_level'] = 0
+            self.print_image_async(ticket, callback=self.on_ticket_printed, template=template)
+        except PrintQueueFullError:
+            # the ticket is not printed, its code was never handed out
+            Code.create(value=self.context['code'])
+            raise
         filename = utils.get_file_name(self.context['code'])
 
         portrait = {
@@ -92,16 +134,49 @@ class Photobooth(object):
             'filename': filename
         }
 
-        q = PhotoboothModel.update(counter=PhotoboothModel.counter + 1, **self.update_dict)
-        q = q.where(PhotoboothModel.uuid == settings.RESIN_UUID)
-        q.execute()
-        self.photobooth = PhotoboothModel.get()
+        with span('db_update'):
+            q = PhotoboothModel.update(counter=PhotoboothModel.counter + 1)
+            q = q.where(PhotoboothModel.uuid == settings.RESIN_UUID)
+            q.execute()
+            self.photobooth = PhotoboothModel.get()
 
         request.upload_portrait_async(portrait)
-        request.update_paper_level_async(self.paper_level)
 
         return ticket
 
+    def on_ticket_printed(self, job):
+        """ Update the paper level once a ticket is printed, called from the print queue thread """
+        with self._paper_level_lock:
+            if job.status == PrintJob.DONE:
+                paper_level = utils.new_paper_level(self.paper_level, job.ticket_length)
+                paper_level = reconcile_paper_level(paper_level, self.paper_monitor.status, self._paper_status,
+                                                    self.has_near_end_sensor())
+            elif isinstance(job.error, OutOfPaperError):
+                logger.info("The printer is out of paper")
+                paper_level = 0
+            else:
+                return
+            self.set_paper_level(paper_level)
+
+    def on_paper_status_change(self, status):
+        """ Correct the paper level when the paper sensors change, called from the paper monitor thread """
+        with self._paper_level_lock:
+            paper_level = reconcile_paper_level(self.paper_level, status, self._paper_status,
+                                                self.has_near_end_sensor())
+            self._paper_status = status
+            if paper_level != self.paper_level:
+                self.set_paper_level(paper_level)
+
+    def has_near_end_sensor(self):
+        return bool(self.printer and self.printer.has_near_end_sensor)
+
+    def set_paper_level(self, paper_level):
+        self.paper_level = paper_level
+        q = PhotoboothModel.update(paper_level=paper_level)
+        q = q.where(PhotoboothModel.uuid == settings.RESIN_UUID)
+        q.execute()
+        request.update_paper_level_async(paper_level)
+
     def trigger_async(self):
         thr = Thread(target=self.trigger, args=(), kwargs={})
         thr.start()
@@ -109,7 +184,8 @@ class Photobooth(object):
 
     def set_context(self):
         """ returns the context used to generate a ticket from a ticket template """
-        code = Code.pop()
+        with span('code_pop'):
+            code = Code.pop()
         tz = self.place.tz if self.place else settings.DEFAULT_TIMEZONE
         date = datetime.now(pytz.timezone(tz))
         counter = self.counter
@@ -121,18 +197,27 @@ class Photobooth(object):
             settings.MEDIA_URL,
             settings.LOCAL_TICKET_CSS_URL)
         # resize picture
-        w = h = settings.TICKET_TEMPLATE_PICTURE_SIZE
-        pil_picture = Image.open(cStringIO.StringIO(picture))
-        resized = pil_picture.resize((w, h))
-        resized.format = pil_picture.format
-        data_url = utils.get_data_url(resized)
-        html = ticket_renderer.render(data_url, **self.context)
+        with span('resize'):
+            w = h = settings.TICKET_TEMPLATE_PICTURE_SIZE
+            resized = imaging.open_resized(picture, (w, h))
+        with span('normalize'):
+            normalized = imaging.normalize(resized)
+        with span('enhance'):
+            enhanced = imaging.enhance(normalized, **imaging.get_tone_parameters(self.event))
+        with span('render'):
+            data_url = utils.get_data_url(enhanced)
+            html = ticket_renderer.render(data_url, **self.context)
         return html
 
-    def unlock_door(self):
-        self.door_lock.open()
-        time.sleep(settings.DOOR_OPENING_TIME)
-        self.door_lock.close()
+    def unlock_door(self, duration=None):
+        """ Unlock the door for duration seconds, DOOR_OPENING_TIME by default, returns right away """
+        return self.door_lock.unlock(duration or settings.DOOR_OPENING_TIME)
+
+    def extend_door_unlock(self, duration=None):
+        return self.door_lock.extend(duration or settings.DOOR_OPENING_TIME)
+
+    def lock_door(self):
+        return self.door_lock.lock()
 
     @execute_if_not_busy(rlock)
     def print_booting_ticket(self):
@@ -161,8 +246,18 @@ class Photobooth(object):
 
     @execute_if_not_busy(rlock)
     def print_image(self, image):
-        image = self.printer.prepare_image(image)
-        return self.printer.print_image(image)
+        """ Print an image and wait for it to come out, returns the length of the ticket """
+        job = self.print_image_async(image)
+        job.wait()
+        if job.error:
+            raise job.error
+        return job.ticket_length
+
+    def print_image_async(self, image, callback=None, template=None):
+        """ Queue an image to be printed and return the print job """
+        with span('prepare_image'):
+            image = self.printer.prepare_image(image)
+        return self.print_queue.submit(image, callback, template)
 
     @property
     def id(self):
@@ -201,13 +296,14 @@ class Photobooth(object):
         self.photobooth.paper_level = value
 
 
-
 _photobooth = None
+_photobooth_lock = Lock()
 
 
-def get_photobooth():
-    """ Instantiate photobooth lazily """
+def get_photobooth(with_devices=True):
+    """ Instantiate photobooth lazily, without devices the caller is left to initialize them """
     global _photobooth
-    if not _photobooth:
-        _photobooth = Photobooth()
+    with _photobooth_lock:
+        if not _photobooth:
+            _photobooth = Photobooth(with_devices)
     return _photobooth
\ No newline at end of file
@@ -0,0 +1,152 @@
+# -*- coding: utf8 -*-
+
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from threading import Event, Lock
+from Queue import Queue, Full
+
+import settings
+from threads import StoppableThread
+from tracing import trace, current_trace
+from exceptions import PrintQueueFullError
+
+
+logger = logging.getLogger(__name__)
+
+
+class PrintJob(object):
+    """ A prepared image waiting to be printed """
+
+    QUEUED = 'queued'
+    PRINTING = 'printing'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, image, callback=None, template=None):
+        self.id = uuid.uuid4().hex
+        self.image = image
+        self.template = template
+        self.callback = callback
+        self.status = PrintJob.QUEUED
+        self.ticket_length = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.ended_at = None
+        # spans recorded while printing belong to the trace of the trigger that submitted the job
+        self.trace_id = current_trace()
+        self._done = Event()
+
+    def run(self, printer):
+        self.started_at = time.time()
+        self.status = PrintJob.PRINTING
+        try:
+            with trace(self.trace_id):
+                self.ticket_length = printer.print_image(self.image, template=self.template)
+            self.status = PrintJob.DONE
+        except Exception as e:
+            logger.exception(e)
+            self.error = e
+            self.status = PrintJob.FAILED
+        finally:
+            self.ended_at = time.time()
+            # the image is not needed anymore, do not keep it in the history
+            self.image = None
+        if self.callback:
+            try:
+                self.callback(self)
+            except Exception as e:
+                logger.exception(e)
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """ Block until the job is done or failed and return its status """
+        self._done.wait(timeout)
+        return self.status
+
+    def serialize(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'ticket_length': self.ticket_length,
+            'error': repr(self.error) if self.error else None,
+            'created': self.created_at,
+            'started': self.started_at,
+            'ended': self.ended_at
+        }
+
+
+class PrintQueue(StoppableThread):
+    """
+    Prints jobs one after the other in a background thread so that a trigger returns as soon as its ticket
+    is queued. The queue holds at most `size` jobs, submitting more waits for the printer to catch up
+    """
+
+    def __init__(self, printer=None, size=settings.PRINT_QUEUE_SIZE, history_size=settings.PRINT_JOBS_HISTORY_SIZE):
+        super(PrintQueue, self).__init__(target=self.work)
+        self.daemon = True
+        self.printer = printer
+        self.history_size = history_size
+        self.queue = Queue(maxsize=size)
+        self.jobs = OrderedDict()
+        self._lock = Lock()
+
+    def submit(self, image, callback=None, template=None, timeout=settings.PRINT_QUEUE_TIMEOUT):
+        job = PrintJob(image, callback, template)
+        with self._lock:
+            if not self.is_alive():
+                self.start()
+        try:
+            self.queue.put(job, timeout=timeout)
+        except Full:
+            raise PrintQueueFullError()
+        with self._lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.history_size:
+                self.jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def get_jobs(self):
+        with self._lock:
+            return self.jobs.values()
+
+    def is_idle(self):
+        """ True when every job submitted so far is printed """
+        return self.queue.unfinished_tasks == 0
+
+    def wait_until_idle(self, timeout=None):
+        """ Block until every job submitted so far is printed, returns False if they are not after timeout seconds """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                if deadline is None:
+                    self.queue.all_tasks_done.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def work(self):
+        while not self.stopping.is_set():
+            job = self.queue.get()
+            try:
+                if job is not None:
+                    job.run(self.printer)
+            finally:
+                self.queue.task_done()
+
+    def stop(self):
+        self.stopping.set()
+        # wake up the worker, if the queue is full the worker is printing and exits after the current job
+        try:
+            self.queue.put(None, timeout=1)
+        except Full:
+            pass
+        self.join()
@@ -2,14 +2,16 @@
 
 import logging
 from os import path
-from threading import Thread
+from threading import Thread, Lock
 import errno
 
 import figure
-from gpiozero import PingServer
 
 import settings
-from models import Photobooth, Portrait, Code
+from connectivity import get_connectivity_monitor
+from decorators import skip_if_running
+from tracing import trace, current_trace, timed
+from models import Photobooth, Portrait, Code, SYNCED_RELATIONS, get_versions_from_api_data
 import utils
 
 
@@ -29,13 +31,54 @@ def download_booting_ticket_template():
     utils.download(settings.BOOTING_TICKET_TEMPLATE_URL, settings.STATIC_ROOT, force=True)
 
 
+# Versions of the local data as of the last successful update, see Photobooth.get_versions
+_versions = None
+
+# Prevent scheduled and connectivity triggered runs from overlapping
+update_lock = Lock()
+upload_portraits_lock = Lock()
+
+
+def get_versions_query(versions):
+    """ Convert local versions into query parameters so that the API only sends back what changed """
+    query = {}
+    for key in SYNCED_RELATIONS:
+        if versions[key]:
+            query['%s_id' % key], query['%s_modified' % key] = versions[key]
+    return query
+
+
+@skip_if_running(update_lock)
 def update():
-    """ This will update the data in case it has been changed in the API """
+    """
+    This will update the data in case it has been changed in the API
+    The last known versions are sent along the request. An API supporting it answers with a delta payload
+    flagged with `delta` that only contains the relations that changed, otherwise the full document is sent back
+    """
+    global _versions
     photobooth = Photobooth.get()
-    updated = figure.Photobooth.get(settings.RESIN_UUID)
-    return photobooth.update_from_api_data(updated)
+    if _versions is None:
+        _versions = photobooth.get_versions()
+    updated = figure.Photobooth.get(settings.RESIN_UUID, query=get_versions_query(_versions))
+    if updated.get('delta'):
+        unchanged = not any(key in updated for key in SYNCED_RELATIONS) and \
+            updated['id'] == _versions['id'] and \
+            updated.get('serial_number') == _versions['serial_number']
+    else:
+        unchanged = get_versions_from_api_data(updated) == _versions
+    if unchanged:
+        return 0
+    r = photobooth.update_from_api_data(updated, partial=bool(updated.get('delta')))
+    _versions = Photobooth.get().get_versions()
+    return r
+
+
+def update_async():
+    thr = Thread(target=update, args=(), kwargs={})
+    thr.start()
 
 
+@timed('upload')
 def upload_portrait(portrait):
     """ Upload a portrait to Figure API or save it to local file system if an error occurs"""
 
@@ -72,10 +115,17 @@ def upload_portrait(portrait):
 
 
 def upload_portrait_async(portrait):
-    thr = Thread(target=upload_portrait, args=(portrait,), kwargs={})
+    thr = Thread(target=upload_portrait_in_trace, args=(portrait, current_trace()), kwargs={})
     thr.start()
 
 
+def upload_portrait_in_trace(portrait, trace_id):
+    """ Upload a portrait recording the upload span in the trace of the trigger that took it """
+    with trace(trace_id):
+        upload_portrait(portrait)
+
+
+@skip_if_running(upload_portraits_lock)
 def upload_portraits():
 
     not_uploaded_count = Portrait.not_uploaded_count()
@@ -119,6 +169,11 @@ def upload_portraits():
                 break
 
 
+def upload_portraits_async():
+    thr = Thread(target=upload_portraits, args=(), kwargs={})
+    thr.start()
+
+
 def update_paper_level(paper_level):
     figure.Photobooth.edit(
         settings.RESIN_UUID, data={'paper_level': paper_level})
@@ -148,10 +203,14 @@ def claim_new_codes():
         Code.bulk_insert(new_codes)
         logger.info('New codes fetched and saved !')
 
+
 def is_online():
-    # check if the device is online
-    ping_host = '8.8.8.8'
-    server = PingServer(ping_host)
-    b = server.is_active
-    server.close()
-    return b
\ No newline at end of file
+    """ Returns the last known connectivity state without waiting on the network """
+    return get_connectivity_monitor().is_online
+
+
+def on_connectivity_change(online):
+    """ Catch up with the API as soon as the connection comes back """
+    if online:
+        update_async()
+        upload_portraits_async()
@@ -0,0 +1,226 @@
+# -*- coding: utf8 -*-
+
+import logging
+import random
+import time
+from collections import OrderedDict
+from threading import Condition
+
+import settings
+from threads import StoppableThread, elapsed
+
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledJob(object):
+    """
+    A function run periodically by the scheduler along with its run statistics
+    Each run is delayed by a random jitter so that jobs sharing an interval drift apart, and failures back off
+    exponentially up to max_backoff. A run must be over deadline seconds after it was due, a run that cannot start
+    in time is dropped. Pausable jobs are deferred while the photobooth is busy. Runs are scheduled on the clock
+    of threads.elapsed so that setting the system time neither makes every job due nor stalls them
+    """
+
+    def __init__(self, name, func, interval, jitter=settings.SCHEDULER_JITTER, max_backoff=None, deadline=None,
+                 pausable=False):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff or interval * settings.SCHEDULER_MAX_BACKOFF_FACTOR
+        self.deadline = deadline
+        self.pausable = pausable
+        self.next_run = None
+        self.due_at = None
+        self.consecutive_failures = 0
+        # statistics
+        self.runs = 0
+        self.failures = 0
+        self.missed = 0
+        self.deferred = 0
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+        self.last_started = None
+        self.last_duration = None
+        self.last_error = None
+        self.running = False
+
+    def get_delay(self):
+        """ Interval doubled on each consecutive failure, spread by the jitter """
+        delay = min(self.interval * 2 ** self.consecutive_failures, max(self.max_backoff, self.interval))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def schedule(self, delay=None):
+        self.next_run = self.due_at = elapsed() + (self.get_delay() if delay is None else delay)
+
+    def is_late(self, now):
+        return self.deadline is not None and now > self.due_at + self.deadline
+
+    def run(self):
+        """ Run the job and record its statistics, jobs are only run on the scheduler thread """
+        self.running = True
+        self.last_started = time.time()
+        started_at = elapsed()
+        try:
+            self.func()
+            self.consecutive_failures = 0
+        except Exception as e:
+            logger.exception(e)
+            self.consecutive_failures += 1
+            self.failures += 1
+            self.last_error = repr(e)
+        finally:
+            self.running = False
+        ended_at = elapsed()
+        self.runs += 1
+        self.last_duration = ended_at - started_at
+        self.total_duration += self.last_duration
+        self.max_duration = max(self.max_duration, self.last_duration)
+        if self.due_at is not None and self.is_late(ended_at):
+            self.missed += 1
+            logger.warning('Job %s missed its deadline by %.1f sec' % (
+                self.name, ended_at - self.due_at - self.deadline))
+
+    def serialize(self):
+        return {
+            'name': self.name,
+            'interval': self.interval,
+            'deadline': self.deadline,
+            'pausable': self.pausable,
+            'running': self.running,
+            'next_run': time.time() + self.next_run - elapsed() if self.next_run is not None else None,
+            'runs': self.runs,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'missed': self.missed,
+            'deferred': self.deferred,
+            'last_started': self.last_started,
+            'last_duration': self.last_duration,
+            'mean_duration': self.total_duration / self.runs if self.runs else None,
+            'max_duration': self.max_duration if self.runs else None,
+            'last_error': self.last_error
+        }
+
+
+class Scheduler(StoppableThread):
+    """
+    Runs the periodic background jobs one after the other on a single thread
+    is_busy is polled before running a pausable job, while it returns True the job is deferred by busy_delay
+    so that network heavy jobs do not compete with a trigger or with printing
+    """
+
+    def __init__(self, is_busy=None, busy_delay=settings.SCHEDULER_BUSY_DELAY):
+        super(Scheduler, self).__init__(target=self.loop)
+        self.daemon = True
+        self.is_busy = is_busy
+        self.busy_delay = busy_delay
+        self.jobs = OrderedDict()
+        self._condition = Condition()
+
+    def add(self, name, func, interval, delay=None, **kwargs):
+        """ Run func every interval seconds, the first run happens after delay seconds, one interval by default """
+        job = ScheduledJob(name, func, interval, **kwargs)
+        job.schedule(delay)
+        with self._condition:
+            self.jobs[name] = job
+            self._condition.notify()
+        return job
+
+    def remove(self, name):
+        with self._condition:
+            return self.jobs.pop(name, None)
+
+    def get(self, name):
+        return self.jobs.get(name)
+
+    def get_jobs(self):
+        with self._condition:
+            return self.jobs.values()
+
+    def run_soon(self, name):
+        """ Make a job due now, it is run on the scheduler thread once the jobs due before it are done """
+        with self._condition:
+            job = self.jobs[name]
+            job.schedule(0)
+            self._condition.notify()
+        return job
+
+    def reset_backoff(self):
+        """ Forget the failures of every job, a job backing off runs again within an interval """
+        with self._condition:
+            for job in self.jobs.values():
+                if job.consecutive_failures:
+                    job.consecutive_failures = 0
+                    job.schedule()
+            self._condition.notify()
+
+    def on_connectivity_change(self, online):
+        """ Jobs failed while the network was down, they should not keep waiting once it is back """
+        if online:
+            self.reset_backoff()
+
+    def is_paused(self):
+        if self.is_busy is None:
+            return False
+        try:
+            return self.is_busy()
+        except Exception as e:
+            logger.exception(e)
+            return False
+
+    def get_next(self):
+        """ The job due first and the time to wait for it """
+        job = min(self.jobs.values(), key=lambda j: j.next_run) if self.jobs else None
+        return job, job.next_run - elapsed() if job else None
+
+    def run_pending(self):
+        """ Run the job due first if it is due, returns the job run or None """
+        with self._condition:
+            job, timeout = self.get_next()
+            if job is None or timeout > 0:
+                return None
+            now = elapsed()
+            if job.is_late(now):
+                job.missed += 1
+                logger.warning('Job %s could not start before its deadline, dropped' % job.name)
+                job.schedule()
+                return None
+            if job.pausable and self.is_paused():
+                job.deferred += 1
+                job.next_run = now + self.busy_delay
+                return None
+        job.run()
+        with self._condition:
+            job.schedule()
+        return job
+
+    def loop(self):
+        while True:
+            with self._condition:
+                while not self.stopping.is_set():
+                    _, timeout = self.get_next()
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._condition.wait(timeout)
+                if self.stopping.is_set():
+                    return
+            self.run_pending()
+
+    def stop(self):
+        with self._condition:
+            self.stopping.set()
+            self._condition.notify()
+        if self.is_alive():
+            self.join()
+
+
+_scheduler = None
+
+
+def get_scheduler():
+    """ Instantiate scheduler lazily """
+    global _scheduler
+    if not _scheduler:
+        _scheduler = Scheduler()
+    return _scheduler
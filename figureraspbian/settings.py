@@ -31,6 +31,16 @@ UPDATE_POLL_INTERVAL = int(get_env_setting('UPDATE_POLL_INTERVAL', 90))
 UPLOAD_PORTRAITS_INTERVAL = int(get_env_setting('UPLOAD_PORTRAITS_INTERVAL', 90))
 CLAIM_NEW_CODES_INTERVAL = int(get_env_setting('CLAIM_NEW_CODES_INTERVAL', 3600))
 NUMBER_OF_CODES_TO_CLAIM = int(get_env_setting('NUMBER_OF_CODES_TO_CLAIM', 5000))
+# Number of files downloaded concurrently when fetching ticket template images
+DOWNLOAD_POOL_SIZE = int(get_env_setting('DOWNLOAD_POOL_SIZE', 4))
+# Connectivity checks against API host, in seconds
+CONNECTIVITY_TIMEOUT = float(get_env_setting('CONNECTIVITY_TIMEOUT', 3))
+CONNECTIVITY_MIN_INTERVAL = float(get_env_setting('CONNECTIVITY_MIN_INTERVAL', 5))
+CONNECTIVITY_MAX_INTERVAL = float(get_env_setting('CONNECTIVITY_MAX_INTERVAL', 60))
+# Time in seconds after which a background job that could not start or is still running is late
+UPDATE_DEADLINE = float(get_env_setting('UPDATE_DEADLINE', 60))
+UPLOAD_PORTRAITS_DEADLINE = float(get_env_setting('UPLOAD_PORTRAITS_DEADLINE', 600))
+CLAIM_NEW_CODES_DEADLINE = float(get_env_setting('CLAIM_NEW_CODES_DEADLINE', 600))
 # Timezone information
 DEFAULT_TIMEZONE = 'Europe/Paris'
 ########## END API CONFIGURATION
@@ -70,10 +80,27 @@ IO_INTERFACE = get_env_setting('IO_INTERFACE', 'GPIOZERO')
 # Pin used to trigger the process
 BUTTON_PIN = int(get_env_setting('BUTTON_PIN', 4))
 REMOTE_RELEASE_CONNECTOR_PIN = int(get_env_setting('REMOTE_RELEASE_CONNECTOR_PIN', 5))
+# Pin of the focus wire of the remote release connector, -1 when it is not wired
+REMOTE_RELEASE_FOCUS_PIN = int(get_env_setting('REMOTE_RELEASE_FOCUS_PIN', -1))
+# Time in seconds the release is half pressed before being fully pressed, when the focus pin is wired
+REMOTE_RELEASE_FOCUS_TIME = float(get_env_setting('REMOTE_RELEASE_FOCUS_TIME', 0.3))
+# Time in seconds the release is fully pressed
+REMOTE_RELEASE_PULSE_DURATION = float(get_env_setting('REMOTE_RELEASE_PULSE_DURATION', 0.1))
 DOOR_LOCK_PIN = int(get_env_setting('DOOR_LOCK_PIN', 12))
 SHUTDOWN_PIN = int(get_env_setting('SHUTDOWN_PIN', 19))
 ######### END I/O CONFIGURATION
 
+######### USB CONFIGURATION
+# Time in seconds the list of USB devices is reused before enumerating them again
+USB_DEVICES_CACHE_TTL = int(get_env_setting('USB_DEVICES_CACHE_TTL', 5))
+# Time in seconds between two checks for plugged or unplugged USB devices
+USB_HOTPLUG_INTERVAL = int(get_env_setting('USB_HOTPLUG_INTERVAL', 3))
+# Time in seconds before trying again to create a camera or a printer that could not be found,
+# doubled after each failure up to the max
+DEVICE_RETRY_MIN_INTERVAL = int(get_env_setting('DEVICE_RETRY_MIN_INTERVAL', 2))
+DEVICE_RETRY_MAX_INTERVAL = int(get_env_setting('DEVICE_RETRY_MAX_INTERVAL', 60))
+######### END USB CONFIGURATION
+
 ######### CAMERA CONFIGURATION
 APERTURE = int(get_env_setting('APERTURE', 11))
 SHUTTER_SPEED = int(get_env_setting('SHUTTER_SPEED', 39))
@@ -89,19 +116,61 @@ TICKET_TEMPLATE_PICTURE_SIZE = int(get_env_setting('TICKET_TEMPLATE_PICTURE_SIZE
 ######## END TICKET TEMPLATE CONFIGURATION
 
 ######### IMAGE ENHANCEMENT CONFIGURATION
-# http://effbot.org/imagingbook/imageenhance.htm
+# Enhancement of the picture at ticket resolution, 1.0 leaves the picture unchanged
 CONTRAST_FACTOR = float(get_env_setting('CONTRAST_FACTOR', 1.0))
+BRIGHTNESS_FACTOR = float(get_env_setting('BRIGHTNESS_FACTOR', 1.0))
+GAMMA = float(get_env_setting('GAMMA', 1.0))
+# Strength of the unsharp mask, values below 1.0 are ignored
 SHARPNESS_FACTOR = float(get_env_setting('SHARPNESS_FACTOR', 1.0))
+# JSON object of parameters by event id overriding the ones above, e.g. {"12": {"contrast": 1.2, "gamma": 1.1}}
+# An invalid value is ignored, it is read by imaging.get_event_tone_parameters
+TONE_CURVES = get_env_setting('TONE_CURVES', '{}')
+# Normalization of the tones of each picture, one of stretch, local or none
+NORMALIZATION = get_env_setting('NORMALIZATION', 'stretch')
+# Percentage of the darkest and lightest pixels ignored by the stretch
+NORMALIZATION_CUTOFF = float(get_env_setting('NORMALIZATION_CUTOFF', 1.0))
+# Local normalization equalizes each tile of a grid x grid division of the picture
+NORMALIZATION_GRID = int(get_env_setting('NORMALIZATION_GRID', 3))
+NORMALIZATION_CLIP_LIMIT = float(get_env_setting('NORMALIZATION_CLIP_LIMIT', 2.0))
+# Size in pixels of the copy of the picture histograms are computed on
+NORMALIZATION_SAMPLE_SIZE = int(get_env_setting('NORMALIZATION_SAMPLE_SIZE', 128))
+# Time in seconds after which local normalization falls back to the stretch
+NORMALIZATION_BUDGET = float(get_env_setting('NORMALIZATION_BUDGET', 0.2))
 ######### END IMAGE ENHANCEMENT CONFIGURATION
 
 ######### PRINTER CONFIGURATION
 PRINTER_SPEED = int(get_env_setting('PRINTER_SPEED', 2))
 PRINTER_MAX_WIDTH = int(get_env_setting('PRINTER_MAX_WIDTH', 576))
+# Dithering of tickets, one of floyd-steinberg, ordered, atkinson or none
+# atkinson is written in pure Python and takes several seconds per ticket on a Raspberry Pi, on the trigger path.
+# It is too slow for production, use it to preview tickets only
+DITHERING = get_env_setting('DITHERING', 'floyd-steinberg')
 # Paper roll length in cm
 PAPER_ROLL_LENGTH = int(get_env_setting('PAPER_ROLL_LENGTH', 8000))
 PIXEL_CM_RATIO = float(get_env_setting('PIXEL_CM_RATIO', 75.59))
 # Number of line feed at the end of the ticket
 LINE_FEED_COUNT = int(get_env_setting('LINE_FEED_COUNT', 5))
+# Size in bytes of each USB write, the next chunk is sent once the printer accepted the previous one
+PRINTER_CHUNK_SIZE = int(get_env_setting('PRINTER_CHUNK_SIZE', 4096))
+# Number of lines of each raster band, printing starts once the first band is sent
+PRINTER_BAND_HEIGHT = int(get_env_setting('PRINTER_BAND_HEIGHT', 256))
+# Store the bands shared by the tickets of a template in the printer memory, Epson printers only
+PRINTER_GRAPHICS_CACHE_ON = int(get_env_setting('PRINTER_GRAPHICS_CACHE_ON', 0))
+# Maximum number of bands stored in the printer memory
+PRINTER_GRAPHICS_SLOTS = int(get_env_setting('PRINTER_GRAPHICS_SLOTS', 16))
+# Time in milliseconds to wait for the printer to answer a status query
+PRINTER_STATUS_TIMEOUT = int(get_env_setting('PRINTER_STATUS_TIMEOUT', 1000))
+# Number of tickets waiting to be printed, submitting more waits up to PRINT_QUEUE_TIMEOUT seconds
+PRINT_QUEUE_SIZE = int(get_env_setting('PRINT_QUEUE_SIZE', 2))
+PRINT_QUEUE_TIMEOUT = int(get_env_setting('PRINT_QUEUE_TIMEOUT', 60))
+# Time in seconds the app waits on shutdown for the tickets queued to be printed
+PRINT_QUEUE_SHUTDOWN_TIMEOUT = int(get_env_setting('PRINT_QUEUE_SHUTDOWN_TIMEOUT', 30))
+# Number of print jobs whose status is kept
+PRINT_JOBS_HISTORY_SIZE = int(get_env_setting('PRINT_JOBS_HISTORY_SIZE', 20))
+# Time in seconds between two reads of the paper sensors
+PAPER_STATUS_INTERVAL = int(get_env_setting('PAPER_STATUS_INTERVAL', 10))
+# Highest paper level, in percent, once the near end sensor reports the end of the roll
+PAPER_NEAR_END_LEVEL = float(get_env_setting('PAPER_NEAR_END_LEVEL', 10.0))
 ######### END PRINTER CONFIGURATION
 
 ######### DOOR LOCK CONFIGURATION
@@ -114,6 +183,10 @@ RTC = get_env_setting('RTC', '')
 RTC_SCLK_PIN = int(get_env_setting('RTC_SLCK_PIN', 3))
 RTC_SDAT_PIN = int(get_env_setting('RTC_SDAT_PIN', 2))
 RTC_RST_PIN = int(get_env_setting('RTC_RST_PIN', 13))
+# Time in seconds between two comparisons of the hardware clock with the system time while online
+RTC_DRIFT_CHECK_INTERVAL = int(get_env_setting('RTC_DRIFT_CHECK_INTERVAL', 3600))
+# Drift in seconds above which the hardware clock is set to the system time
+RTC_MAX_DRIFT = float(get_env_setting('RTC_MAX_DRIFT', 2.0))
 ######## END RTC CONFIGURATION
 
 ######## WIFI CONFIGURATION
@@ -127,8 +200,37 @@ LINE_DETECT_HOLD_TIME = int(get_env_setting('LINE_DETECT_HOLD_TIME', 35))
 
 ####### SERVER CONFIGURATION
 SERVER_ON = int(get_env_setting('SERVER_ON', 0))
+SERVER_THREADS = int(get_env_setting('SERVER_THREADS', 4))
+# Time in seconds after which an inactive connection is closed
+SERVER_REQUEST_TIMEOUT = int(get_env_setting('SERVER_REQUEST_TIMEOUT', 30))
+# Number of API jobs whose status and result are kept
+JOBS_HISTORY_SIZE = int(get_env_setting('JOBS_HISTORY_SIZE', 20))
+# Interval in seconds between two samples of system metrics and number of samples kept
+SYSTEM_SAMPLE_INTERVAL = float(get_env_setting('SYSTEM_SAMPLE_INTERVAL', 10))
+SYSTEM_SAMPLE_HISTORY_SIZE = int(get_env_setting('SYSTEM_SAMPLE_HISTORY_SIZE', 360))
 ####### END SERVER CONFIGURATION
 
+######## LATENCY CONFIGURATION
+# Number of durations kept per trigger stage and number of triggers whose spans are kept
+LATENCY_SAMPLES_SIZE = int(get_env_setting('LATENCY_SAMPLES_SIZE', 1000))
+LATENCY_TRACES_SIZE = int(get_env_setting('LATENCY_TRACES_SIZE', 20))
+######## END LATENCY CONFIGURATION
+
+######## SCHEDULER CONFIGURATION
+# Fraction of its interval by which each run of a background job is randomly moved
+SCHEDULER_JITTER = float(get_env_setting('SCHEDULER_JITTER', 0.1))
+# Failing jobs wait twice as long after each failure, up to this many times their interval
+SCHEDULER_MAX_BACKOFF_FACTOR = int(get_env_setting('SCHEDULER_MAX_BACKOFF_FACTOR', 8))
+# Time in seconds a network job is put off while a picture is taken or a ticket is printed
+SCHEDULER_BUSY_DELAY = float(get_env_setting('SCHEDULER_BUSY_DELAY', 5))
+######## END SCHEDULER CONFIGURATION
+
+######## STARTUP CONFIGURATION
+# Time in seconds after which a startup step is not waited for anymore
+STARTUP_STEP_TIMEOUT = float(get_env_setting('STARTUP_STEP_TIMEOUT', 30))
+STARTUP_DEVICES_TIMEOUT = float(get_env_setting('STARTUP_DEVICES_TIMEOUT', 60))
+######## END STARTUP CONFIGURATION
+
 ######## LOG CONFIGURATION
 LOG_FORMAT = "[%(asctime)s] %(levelname)s [%(name)s.%(funcName)s:%(lineno)d] %(message)s"
 ######## END LOG CONFIGURATION
@@ -0,0 +1,98 @@
+# -*- coding: utf8 -*-
+
+import logging
+import time
+from collections import OrderedDict
+from threading import Thread, Event
+
+import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class Step(object):
+    """ A unit of work of the startup sequence """
+
+    def __init__(self, name, func, timeout, requires=()):
+        self.name = name
+        self.func = func
+        self.timeout = timeout
+        self.requires = requires
+        self.status = 'pending'
+        self.started_at = None
+        self.ended_at = None
+        self.started = Event()
+        self.done = Event()
+
+    @property
+    def deadline(self):
+        return self.started_at + self.timeout
+
+
+class Startup(object):
+    """
+    Runs the steps of the application startup concurrently, each one in its own thread as soon as the steps it
+    requires are over. A step is only waited for up to its timeout, after which it is considered timed out and
+    left running in the background. Step failures are logged and do not prevent other steps from running
+    """
+
+    def __init__(self):
+        self.steps = OrderedDict()
+        self.started_at = None
+
+    def add(self, name, func, timeout=settings.STARTUP_STEP_TIMEOUT, requires=()):
+        self.steps[name] = Step(name, func, timeout, requires)
+
+    def start(self):
+        self.started_at = time.time()
+        for step in self.steps.values():
+            thr = Thread(target=self._run, args=(step,), name='startup-%s' % step.name)
+            thr.daemon = True
+            thr.start()
+
+    def _run(self, step):
+        for name in step.requires:
+            self.wait(name)
+        step.started_at = time.time()
+        step.status = 'running'
+        step.started.set()
+        try:
+            step.func()
+            step.status = 'done'
+        except Exception as e:
+            logger.exception(e)
+            step.status = 'failed'
+        finally:
+            step.ended_at = time.time()
+            step.done.set()
+
+    def wait(self, name):
+        """ Wait for a step to be over or to time out and return True if it succeeded """
+        step = self.steps[name]
+        step.started.wait()
+        if not step.done.wait(max(0, step.deadline - time.time())) and step.status == 'running':
+            step.status = 'timeout'
+            logger.warning("Startup step %s timed out after %s sec" % (name, step.timeout))
+        return step.status == 'done'
+
+    def join(self):
+        """ Wait for all the steps """
+        for name in self.steps:
+            self.wait(name)
+
+    def get_timeline(self):
+        """ Returns the name, status, start and end offsets in seconds of each step """
+        timeline = []
+        for step in self.steps.values():
+            started = step.started_at - self.started_at if step.started_at else None
+            ended = step.ended_at - self.started_at if step.ended_at else None
+            timeline.append((step.name, step.status, started, ended))
+        return timeline
+
+    def log_timeline(self):
+        for name, status, started, ended in self.get_timeline():
+            logger.info("Startup step %-15s %-8s %s -> %s" % (
+                name, status,
+                '%6.2f sec' % started if started is not None else '-',
+                '%6.2f sec' % ended if ended is not None else '-'))
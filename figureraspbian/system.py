@@ -0,0 +1,137 @@
+# -*- coding: utf8 -*-
+
+import logging
+import os
+import subprocess
+import time
+from collections import deque
+from threading import Lock
+
+import psutil
+
+import settings
+from threads import StoppableThread
+
+
+logger = logging.getLogger(__name__)
+
+
+SOC_TEMPERATURE_PATH = '/sys/class/thermal/thermal_zone0/temp'
+THROTTLED_PATH = '/sys/devices/platform/soc/soc:firmware/get_throttled'
+
+# Bits of the throttled state reported by the Raspberry Pi firmware
+THROTTLED_FLAGS = {
+    'under_voltage': 0x1,
+    'frequency_capped': 0x2,
+    'throttled': 0x4,
+    'soft_temperature_limit': 0x8,
+    'under_voltage_occurred': 0x10000,
+    'frequency_capped_occurred': 0x20000,
+    'throttled_occurred': 0x40000,
+    'soft_temperature_limit_occurred': 0x80000
+}
+
+
+def get_soc_temperature():
+    """ Returns the temperature of the SoC in degrees Celsius or None if it is not available """
+    try:
+        with open(SOC_TEMPERATURE_PATH) as f:
+            return int(f.read().strip()) / 1000.0
+    except (IOError, ValueError):
+        return None
+
+
+def get_throttled_state():
+    """ Returns the throttled bit field of the Raspberry Pi firmware or None if it is not available """
+    try:
+        with open(THROTTLED_PATH) as f:
+            return int(f.read().strip(), 16)
+    except (IOError, ValueError):
+        pass
+    try:
+        # throttled=0x50000
+        output = subprocess.check_output(['vcgencmd', 'get_throttled'])
+        return int(output.strip().split('=')[1], 16)
+    except (OSError, subprocess.CalledProcessError, IndexError, ValueError):
+        return None
+
+
+def get_throttling(throttled):
+    if throttled is None:
+        return None
+    return {flag: bool(throttled & mask) for flag, mask in THROTTLED_FLAGS.items()}
+
+
+class SystemSampler(StoppableThread):
+    """
+    Collects system metrics at a fixed interval in the background and keeps the last samples in a ring buffer
+    so that reading them never blocks
+    """
+
+    def __init__(self, interval=settings.SYSTEM_SAMPLE_INTERVAL, history_size=settings.SYSTEM_SAMPLE_HISTORY_SIZE):
+        super(SystemSampler, self).__init__(target=self.run_sampler)
+        self.daemon = True
+        self.interval = interval
+        self.samples = deque(maxlen=history_size)
+        self.process = psutil.Process(os.getpid())
+        self._lock = Lock()
+        # the first call to cpu_percent with no interval returns a meaningless 0.0
+        psutil.cpu_percent(interval=None)
+        self.process.cpu_percent(interval=None)
+
+    def sample(self):
+        throttled = get_throttled_state()
+        memory_info = self.process.memory_info()
+        sample = {
+            'timestamp': time.time(),
+            'cpu_percent': psutil.cpu_percent(interval=None),
+            'memory_percent': psutil.virtual_memory().percent,
+            'disk_usage_percent': psutil.disk_usage('/').percent,
+            'number_of_processes': len(psutil.pids()),
+            'soc_temperature': get_soc_temperature(),
+            'throttled': throttled,
+            'throttling': get_throttling(throttled),
+            'process': {
+                'cpu_percent': self.process.cpu_percent(interval=None),
+                'rss': memory_info.rss,
+                'number_of_threads': self.process.num_threads()
+            }
+        }
+        with self._lock:
+            self.samples.append(sample)
+        return sample
+
+    def run_sampler(self):
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                logger.exception(e)
+            if self.stopping.wait(self.interval):
+                break
+
+    def latest(self):
+        """ Returns the last sample, taking one right away if there is none yet """
+        with self._lock:
+            if self.samples:
+                return self.samples[-1]
+        return self.sample()
+
+    def history(self, since=None):
+        """ Returns the samples in the buffer, optionally only those taken after the since timestamp """
+        with self._lock:
+            samples = list(self.samples)
+        if since is not None:
+            samples = [sample for sample in samples if sample['timestamp'] > since]
+        return samples
+
+
+_system_sampler = None
+
+
+def get_system_sampler():
+    """ Instantiate system sampler lazily """
+    global _system_sampler
+    if not _system_sampler:
+        _system_sampler = SystemSampler()
+    return _system_sampler
@@ -0,0 +1,75 @@
+# -*- coding: utf8 -*-
+
+import json
+import re
+from threading import Thread
+from urlparse import urlsplit, parse_qsl
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from ..models import SYNCED_RELATIONS
+
+
+def get_delta(photobooth, query):
+    """ Compute the delta payload the API sends back given the versions known by the photobooth """
+    delta = {'id': photobooth['id'], 'serial_number': photobooth.get('serial_number'), 'delta': True}
+    for key in SYNCED_RELATIONS:
+        related = photobooth.get(key)
+        known_id = query.get('%s_id' % key)
+        known_modified = query.get('%s_modified' % key)
+        if related is None:
+            if known_id:
+                delta[key] = None
+        elif str(related['id']) != known_id or related.get('modified') != known_modified:
+            delta[key] = related
+    return delta
+
+
+class StandInAPI(object):
+    """
+    Local stand-in for the photobooth endpoint of Figure API
+    It serves `photobooth` either as delta payloads or, when `delta` is False, as full documents like legacy API
+    """
+
+    def __init__(self, photobooth, delta=True):
+        self.photobooth = photobooth
+        self.delta = delta
+        self.requests = []
+        self.bytes_sent = 0
+        self.server = HTTPServer(('127.0.0.1', 0), self._handler_class())
+        self.url = 'http://127.0.0.1:%s' % self.server.server_port
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                path, query = urlsplit(self.path)[2:4]
+                query = dict(parse_qsl(query))
+                api.requests.append((path, query))
+                if not re.match(r'^/photobooths/[^/]+/$', path):
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                payload = get_delta(api.photobooth, query) if api.delta else api.photobooth
+                body = json.dumps(payload)
+                api.bytes_sent += len(body)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -2,7 +2,9 @@
 from unittest import TestCase
 import mock
 import sys
+import time
 from datetime import datetime
+from threading import Event
 
 RPi = mock.Mock()
 sys.modules['RPi'] = RPi
@@ -11,43 +13,58 @@ sys.modules['RPi.GPIO'] = RPi.GPIO
 webkit2png = mock.Mock()
 sys.modules['figureraspbian.webkit2png'] = webkit2png
 
-from ..app import App
+from ..app import App, schedule_jobs
 
 
 class AppTestCase(TestCase):
 
+    @mock.patch("figureraspbian.app.DeviceManager")
+    @mock.patch("figureraspbian.app.get_usb_monitor")
+    @mock.patch("figureraspbian.app.get_system_sampler")
+    @mock.patch("figureraspbian.app.get_connectivity_monitor")
     @mock.patch("figureraspbian.app.is_online")
     @mock.patch("figureraspbian.app.download_booting_ticket_template")
     @mock.patch("figureraspbian.app.download_ticket_stylesheet")
     @mock.patch("figureraspbian.app.update")
     @mock.patch("figureraspbian.app.claim_new_codes")
-    @mock.patch("figureraspbian.app.update_mac_addresses_async")
+    @mock.patch("figureraspbian.app.update_mac_addresses")
     @mock.patch("figureraspbian.app.get_photobooth")
-    @mock.patch("figureraspbian.app.set_intervals")
+    @mock.patch("figureraspbian.app.schedule_jobs")
     @mock.patch("figureraspbian.app.Button")
-    def test_init_is_online(self, Button, set_intervals, get_photobooth, update_mac_addresses_async, claim_new_codes,
-                            update, download_ticket_stylesheet, download_booting_ticket_template, is_online):
+    def test_init_is_online(self, Button, schedule_jobs, get_photobooth, update_mac_addresses, claim_new_codes,
+                            update, download_ticket_stylesheet, download_booting_ticket_template, is_online,
+                            get_connectivity_monitor, get_system_sampler, get_usb_monitor, DeviceManager):
         is_online.return_value = True
         button = mock.Mock()
         Button.factory.return_value = button
 
-        App()
+        app = App()
+        app.startup.join()
 
         self.assertTrue(download_booting_ticket_template.called)
         self.assertTrue(download_ticket_stylesheet.called)
         self.assertTrue(update.called)
         self.assertTrue(claim_new_codes.called)
-        self.assertTrue(update_mac_addresses_async.called)
-        self.assertTrue(get_photobooth.called)
-        self.assertTrue(set_intervals.called)
-
+        self.assertTrue(update_mac_addresses.called)
+        get_photobooth.assert_called_with(with_devices=False)
+        self.assertTrue(get_photobooth.return_value.initialize_devices.called)
+        schedule_jobs.assert_called_with(get_photobooth.return_value)
+        self.assertTrue(get_connectivity_monitor.return_value.start.called)
+        DeviceManager.assert_called_with(get_photobooth.return_value)
+        get_usb_monitor.return_value.subscribe.assert_called_with(DeviceManager.return_value.on_usb_change)
+        self.assertTrue(DeviceManager.return_value.start.called)
+
+    @mock.patch("figureraspbian.app.DeviceManager")
+    @mock.patch("figureraspbian.app.get_usb_monitor")
+    @mock.patch("figureraspbian.app.get_system_sampler")
+    @mock.patch("figureraspbian.app.get_connectivity_monitor")
     @mock.patch("figureraspbian.app.is_online")
     @mock.patch("figureraspbian.app.get_photobooth")
-    @mock.patch("figureraspbian.app.set_intervals")
+    @mock.patch("figureraspbian.app.schedule_jobs")
     @mock.patch("figureraspbian.app.set_system_time")
     @mock.patch("figureraspbian.app.Button")
-    @mock.patch("figureraspbian.app.RTC")
-    def test_init_is_offline(self, RTC, Button, set_system_time, _1, _2, is_online):
+    @mock.patch("figureraspbian.app.get_rtc")
+    def test_init_is_offline(self, get_rtc, Button, set_system_time, _1, _2, is_online, _3, _4, _5, _6):
         """ it should set clock from hardware clock"""
         is_online.return_value = False
 
@@ -55,17 +72,75 @@ class AppTestCase(TestCase):
         Button.factory.return_value = button
 
         rtc = mock.Mock()
-        RTC.factory.return_value = rtc
+        get_rtc.return_value = rtc
 
         dt = datetime(2017, 1, 1)
         rtc.read_datetime.return_value = dt
 
-        App()
+        app = App()
+        app.startup.join()
 
         set_system_time.assert_called_with(dt)
 
-
-
-
-
-
+    @mock.patch("figureraspbian.app.DeviceManager")
+    @mock.patch("figureraspbian.app.get_usb_monitor")
+    @mock.patch("figureraspbian.app.get_system_sampler")
+    @mock.patch("figureraspbian.app.get_connectivity_monitor")
+    @mock.patch("figureraspbian.app.is_online")
+    @mock.patch("figureraspbian.app.get_photobooth")
+    @mock.patch("figureraspbian.app.schedule_jobs")
+    @mock.patch("figureraspbian.app.Button")
+    @mock.patch("figureraspbian.app.settings.STARTUP_DEVICES_TIMEOUT", 0.1)
+    def test_init_devices_timeout(self, Button, schedule_jobs, get_photobooth, is_online, _1, _2, _3, DeviceManager):
+        """ it should go on without devices when creating them hangs and let the device manager create them """
+        is_online.return_value = False
+        released = Event()
+        photobooth = get_photobooth.return_value
+        photobooth.initialize_devices.side_effect = lambda: released.wait(5)
+
+        started_at = time.time()
+        try:
+            App()
+            self.assertLess(time.time() - started_at, 2)
+            DeviceManager.assert_called_with(photobooth)
+            self.assertTrue(DeviceManager.return_value.start.called)
+            schedule_jobs.assert_called_with(photobooth)
+        finally:
+            released.set()
+
+
+    @mock.patch("figureraspbian.app.rlock")
+    @mock.patch("figureraspbian.app.get_io_hub")
+    @mock.patch("figureraspbian.app.get_job_runner")
+    def test_stop(self, get_job_runner, get_io_hub, rlock):
+        """ it should wait for the queued tickets to be printed before exiting """
+        app = App.__new__(App)
+        for name in ['scheduler', 'connectivity_monitor', 'paper_monitor', 'usb_monitor', 'device_manager',
+                     'system_sampler', 'button', 'photobooth']:
+            setattr(app, name, mock.Mock())
+        print_queue = app.photobooth.print_queue
+        print_queue.wait_until_idle.return_value = True
+        app.stop()
+        self.assertTrue(get_job_runner.return_value.stop.called)
+        self.assertTrue(rlock.acquire.called)
+        self.assertTrue(print_queue.wait_until_idle.called)
+        self.assertTrue(print_queue.stop.called)
+        self.assertTrue(get_io_hub.return_value.stop.called)
+
+    @mock.patch("figureraspbian.app.get_scheduler")
+    @mock.patch("figureraspbian.app.is_online")
+    @mock.patch("figureraspbian.app.claim_new_codes")
+    def test_schedule_jobs_offline(self, claim_new_codes, is_online, get_scheduler):
+        """ it should not run network jobs while offline so that they do not back off """
+        scheduler = get_scheduler.return_value
+        photobooth = mock.Mock()
+        self.assertIs(schedule_jobs(photobooth), scheduler)
+        self.assertEqual(scheduler.is_busy, photobooth.is_busy)
+        jobs = dict((c[0][0], c[0][1]) for c in scheduler.add.call_args_list)
+        is_online.return_value = False
+        jobs['claim_new_codes']()
+        self.assertFalse(claim_new_codes.called)
+        is_online.return_value = True
+        jobs['claim_new_codes']()
+        self.assertTrue(claim_new_codes.called)
+        self.assertTrue(scheduler.start.called)
@@ -0,0 +1,95 @@
+# -*- coding: utf8 -*-
+
+from unittest import TestCase
+import time
+from threading import Event
+
+import mock
+
+from ..devices.button import Button
+from .test_io_hub import FakeIOHub
+
+
+class ButtonTestCase(TestCase):
+
+    def setUp(self):
+        self.hub = FakeIOHub()
+
+    def tearDown(self):
+        self.hub.stop()
+
+    def test_edges(self):
+        """ it should fire callbacks on the first edge and ignore bounces """
+        button = Button(4, 0.05, 10, io_hub=self.hub)
+        pressed = mock.Mock()
+        button.when_pressed = lambda: pressed()
+        unpressed = mock.Mock()
+        button.when_unpressed = lambda: unpressed()
+        button.start()
+        self.assertIn(4, self.hub.callbacks)
+        self.hub.set_input(4, True)
+        self.hub.wait_idle()
+        button.callbacks.wait_idle()
+        self.assertEqual(pressed.call_count, 1)
+        # bounces
+        self.hub.set_input(4, False)
+        self.hub.set_input(4, True)
+        self.hub.wait_idle()
+        button.callbacks.wait_idle()
+        self.assertEqual(pressed.call_count, 1)
+        self.assertFalse(unpressed.called)
+        time.sleep(0.1)
+        self.hub.set_input(4, False)
+        self.hub.wait_idle()
+        button.callbacks.wait_idle()
+        self.assertEqual(unpressed.call_count, 1)
+        button.close()
+        self.assertNotIn(4, self.hub.callbacks)
+
+    def test_release_during_bounce_time(self):
+        """ it should read the pin again once bounces are over """
+        button = Button(4, 0.05, 10, io_hub=self.hub)
+        unpressed = mock.Mock()
+        button.when_unpressed = lambda: unpressed()
+        button.start()
+        self.hub.set_input(4, True)
+        self.hub.wait_idle()
+        self.hub.set_input(4, False)
+        self.hub.wait_idle()
+        self.assertFalse(unpressed.called)
+        time.sleep(0.1)
+        button.callbacks.wait_idle()
+        self.assertEqual(unpressed.call_count, 1)
+        button.close()
+
+    def test_held(self):
+        """ it should fire when_held once the button is held for hold_time """
+        button = Button(4, 0.01, 0.05, io_hub=self.hub)
+        held = mock.Mock()
+        button.when_held = lambda: held()
+        button.start()
+        self.hub.set_input(4, True)
+        time.sleep(0.02)
+        self.hub.set_input(4, False)
+        time.sleep(0.1)
+        self.assertFalse(held.called)
+        self.hub.set_input(4, True)
+        time.sleep(0.1)
+        button.callbacks.wait_idle()
+        self.assertEqual(held.call_count, 1)
+        button.close()
+
+    def test_slow_callback(self):
+        """ it should not hold up the IO hub while a callback runs """
+        button = Button(4, 0.01, 10, io_hub=self.hub)
+        released = Event()
+        button.when_pressed = lambda: released.wait(2)
+        button.start()
+        self.hub.set_input(4, True)
+        self.hub.wait_idle()
+        ran = Event()
+        self.hub.schedule(0.01, ran.set)
+        self.assertTrue(ran.wait(0.5))
+        self.assertFalse(released.is_set())
+        released.set()
+        button.close()
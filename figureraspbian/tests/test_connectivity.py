@@ -0,0 +1,45 @@
+from unittest import TestCase
+import mock
+
+import requests
+
+from ..connectivity import ConnectivityMonitor
+
+
+class ConnectivityMonitorTestCase(TestCase):
+
+    @mock.patch("figureraspbian.connectivity.requests.head")
+    def test_check(self, head):
+        """ it should cache the connectivity state and slow down probing while it stays the same """
+        monitor = ConnectivityMonitor(url='http://api', min_interval=5, max_interval=20)
+        self.assertIsNone(monitor.checked_at)
+        self.assertTrue(monitor.check())
+        head.assert_called_once_with('http://api', timeout=monitor.timeout)
+        self.assertTrue(monitor.is_online)
+        self.assertIsNotNone(monitor.checked_at)
+        monitor.check()
+        monitor.check()
+        monitor.check()
+        self.assertEqual(monitor.interval, 20)
+        head.side_effect = requests.ConnectionError()
+        self.assertFalse(monitor.check())
+        self.assertFalse(monitor.is_online)
+        self.assertEqual(monitor.interval, 5)
+
+    @mock.patch("figureraspbian.connectivity.requests.head")
+    def test_subscribe(self, head):
+        """ it should notify subscribers on transitions only """
+        monitor = ConnectivityMonitor(url='http://api')
+        callback = mock.Mock()
+        failing = mock.Mock(side_effect=Exception())
+        monitor.subscribe(failing)
+        monitor.subscribe(callback)
+        monitor.check()
+        monitor.check()
+        self.assertFalse(callback.called)
+        head.side_effect = requests.Timeout()
+        monitor.check()
+        monitor.check()
+        head.side_effect = None
+        monitor.check()
+        self.assertEqual(callback.call_args_list, [mock.call(False), mock.call(True)])
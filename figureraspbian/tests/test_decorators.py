@@ -1,8 +1,8 @@
 
 from unittest import TestCase
-from threading import RLock, Thread
+from threading import RLock, Lock, Thread
 
-from ..decorators import execute_if_not_busy
+from ..decorators import execute_if_not_busy, skip_if_running
 from ..exceptions import DevicesBusy
 
 
@@ -27,4 +27,21 @@ class DecoratorsTestCase(TestCase):
         th.join()
 
         with self.assertRaises(DevicesBusy):
-            f()
\ No newline at end of file
+            f()
+
+    def test_skip_if_running(self):
+        """ it should return None instead of running a function concurrently """
+
+        lock = Lock()
+        calls = []
+
+        @skip_if_running(lock)
+        def f():
+            calls.append(1)
+            return True
+
+        self.assertTrue(f())
+        lock.acquire()
+        self.assertIsNone(f())
+        lock.release()
+        self.assertEqual(len(calls), 1)
@@ -0,0 +1,61 @@
+# -*- coding: utf8 -*-
+
+from unittest import TestCase
+import mock
+
+from ..device_manager import DeviceManager
+
+
+PRINTER_DEVICE = {'device': '/dev/bus/usb/001/005', 'vendor_id': '04b8', 'product_id': '0e15', 'tag': ''}
+
+
+class DeviceManagerTestCase(TestCase):
+
+    def setUp(self):
+        self.photobooth = mock.Mock(camera=mock.Mock(), printer=None)
+
+        def swap_devices(**devices):
+            for name, device in devices.items():
+                setattr(self.photobooth, name, device)
+        self.photobooth.swap_devices.side_effect = swap_devices
+
+    @mock.patch("figureraspbian.device_manager.elapsed")
+    @mock.patch("figureraspbian.device_manager.Printer")
+    def test_retry(self, Printer, elapsed):
+        """ it should try again to create a missing device with an exponential backoff """
+        elapsed.return_value = 100
+        Printer.factory.return_value = None
+        manager = DeviceManager(self.photobooth, min_interval=2, max_interval=5)
+        self.assertEqual(manager.retry(), {})
+        self.assertEqual(manager.get_timeout(), 2)
+        manager.retry()
+        self.assertEqual(Printer.factory.call_count, 1)
+        elapsed.return_value = 102
+        manager.retry()
+        self.assertEqual(manager.retry_at['printer'], 106)
+        elapsed.return_value = 106
+        manager.retry()
+        self.assertEqual(manager.intervals['printer'], 5)
+        printer = mock.Mock()
+        Printer.factory.return_value = printer
+        elapsed.return_value = 111
+        self.assertEqual(manager.retry(), {'printer': printer})
+        self.photobooth.swap_devices.assert_called_with(printer=printer)
+        self.assertEqual(manager.intervals['printer'], 2)
+        self.assertIsNone(manager.get_timeout())
+
+    @mock.patch("figureraspbian.device_manager.Printer")
+    def test_on_usb_change(self, Printer):
+        """ it should drop an unplugged printer and try again right away when a device is plugged """
+        printer = mock.Mock()
+        printer.matches.return_value = True
+        self.photobooth.printer = printer
+        Printer.find_device.return_value = None
+        manager = DeviceManager(self.photobooth)
+        manager.on_usb_change([], [PRINTER_DEVICE])
+        self.photobooth.swap_devices.assert_called_with(printer=None)
+        self.assertEqual(manager.get_missing(), ['printer'])
+        manager.retry_at['printer'] = float('inf')
+        manager.on_usb_change([PRINTER_DEVICE], [])
+        self.assertEqual(manager.get_timeout(), 0)
+        self.assertTrue(manager.wakeup.is_set())
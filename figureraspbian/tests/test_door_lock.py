@@ -0,0 +1,69 @@
+# -*- coding: utf8 -*-
+
+from unittest import TestCase
+import time
+
+import mock
+
+from ..devices.door_lock import DoorLock, LOCKED, UNLOCKED
+from .test_io_hub import FakeIOHub
+
+
+class DoorLockTestCase(TestCase):
+
+    def setUp(self):
+        self.hub = FakeIOHub()
+        self.door_lock = DoorLock(12, io_hub=self.hub)
+
+    def tearDown(self):
+        self.hub.stop()
+
+    def test_unlock(self):
+        """ it should unlock the door and lock it again once the duration is over without blocking """
+        ts = time.time()
+        state = self.door_lock.unlock(0.05)
+        self.assertLess(time.time() - ts, 0.01)
+        self.assertEqual(state['state'], UNLOCKED)
+        self.assertTrue(self.hub.read(12))
+        time.sleep(0.1)
+        self.assertFalse(self.hub.read(12))
+        self.assertEqual(self.door_lock.get_state()['state'], LOCKED)
+
+    def test_unlock_unlocked(self):
+        """ it should never bring the locking time of an unlocked door forward """
+        self.door_lock.unlock(10)
+        lock_deadline = self.door_lock.lock_deadline
+        self.door_lock.unlock(0.01)
+        self.assertEqual(self.door_lock.lock_deadline, lock_deadline)
+        self.door_lock.lock()
+
+    def test_extend(self):
+        """ it should push the locking time back """
+        self.door_lock.unlock(0.05)
+        state = self.door_lock.extend(0.1)
+        self.assertGreater(state['remaining'], 0.1)
+        time.sleep(0.1)
+        self.assertTrue(self.hub.read(12))
+        time.sleep(0.1)
+        self.assertFalse(self.hub.read(12))
+
+    def test_system_time_change(self):
+        """ it should lock the door on time even if the system time goes back while it is unlocked """
+        ts = time.time()
+        self.door_lock.unlock(0.05)
+        with mock.patch('time.time', return_value=ts - 3600):
+            state = self.door_lock.get_state()
+            self.assertLess(state['remaining'], 0.06)
+            self.assertAlmostEqual(state['locks_at'], ts - 3600, delta=0.1)
+            time.sleep(0.15)
+            self.assertFalse(self.hub.read(12))
+
+    def test_lock(self):
+        """ it should lock right away and cancel the scheduled locking """
+        self.door_lock.unlock(0.05)
+        state = self.door_lock.lock()
+        self.assertEqual(state, {'state': LOCKED, 'unlocked_at': None, 'locks_at': None, 'remaining': 0})
+        self.assertFalse(self.hub.read(12))
+        writes = len(self.hub.writes)
+        time.sleep(0.1)
+        self.assertEqual(len(self.hub.writes), writes)
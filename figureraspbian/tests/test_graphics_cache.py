@@ -0,0 +1,51 @@
+from unittest import TestCase
+
+from ..devices.graphics_cache import GraphicsCache, RASTER, STORE, PRINT_STORED
+
+
+class GraphicsCacheTestCase(TestCase):
+
+    def print_ticket(self, cache, template, digests):
+        clear = cache.start(template)
+        actions = [cache.get_action(index, digest)[0] for index, digest in enumerate(digests)]
+        cache.end()
+        return clear, actions
+
+    def test_static_bands(self):
+        """ it should store the bands shared by two tickets of a template and print them from the printer """
+        cache = GraphicsCache(slots=8)
+        template = (1, '2017-01-01T00:00:00Z')
+        self.assertEqual(self.print_ticket(cache, template, ['logo', 'picture1', 'footer']),
+                         (False, [RASTER, RASTER, RASTER]))
+        self.assertEqual(self.print_ticket(cache, template, ['logo', 'picture2', 'footer']),
+                         (False, [STORE, RASTER, STORE]))
+        self.assertEqual(self.print_ticket(cache, template, ['logo', 'picture3', 'footer']),
+                         (False, [PRINT_STORED, RASTER, PRINT_STORED]))
+        # a stored band that changes is sent as a raster
+        self.assertEqual(self.print_ticket(cache, template, ['logo', 'picture4', 'other']),
+                         (False, [PRINT_STORED, RASTER, RASTER]))
+
+    def test_template_modified(self):
+        """ it should delete stored graphics when the template changes """
+        cache = GraphicsCache(slots=8)
+        template = (1, '2017-01-01T00:00:00Z')
+        for _ in range(2):
+            self.print_ticket(cache, template, ['logo'])
+        modified = (1, '2017-02-01T00:00:00Z')
+        self.assertEqual(self.print_ticket(cache, modified, ['logo']), (True, [RASTER]))
+        self.assertEqual(self.print_ticket(cache, modified, ['logo']), (False, [STORE]))
+
+    def test_slots(self):
+        """ it should not store more bands than there are slots """
+        cache = GraphicsCache(slots=1)
+        for _ in range(2):
+            clear, actions = self.print_ticket(cache, None, ['a', 'b'])
+        self.assertEqual(actions, [STORE, RASTER])
+
+    def test_reset(self):
+        """ it should delete stored graphics and store them again after a reset """
+        cache = GraphicsCache(slots=8)
+        for _ in range(3):
+            self.print_ticket(cache, (1, 'modified'), ['logo'])
+        cache.reset()
+        self.assertEqual(self.print_ticket(cache, (1, 'modified'), ['logo']), (True, [RASTER]))
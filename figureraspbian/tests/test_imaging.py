@@ -0,0 +1,161 @@
+# -*- coding: utf8 -*-
+
+from unittest import TestCase
+import cStringIO
+
+import mock
+
+from PIL import Image
+
+from .. import imaging
+
+
+def encode(image, format):
+    buf = cStringIO.StringIO()
+    image.save(buf, format)
+    return buf.getvalue()
+
+
+def get_black_ratio(image):
+    return image.histogram()[0] / float(image.size[0] * image.size[1])
+
+
+class ImagingTestCase(TestCase):
+
+    def test_open_resized(self):
+        """ it should decode a JPEG at a reduced scale and resize it to the exact size """
+        data = encode(Image.new('RGB', (2048, 2048), 'gray'), 'JPEG')
+        im = imaging.open_resized(data, (300, 300))
+        self.assertEqual(im.size, (300, 300))
+        self.assertEqual(im.format, 'JPEG')
+
+    def test_resize_to_width(self):
+        """ it should resize an image preserving its ratio """
+        im = Image.new('L', (640, 1026))
+        self.assertEqual(imaging.resize_to_width(im, 576).size, (576, 923))
+        self.assertIs(imaging.resize_to_width(im, 640), im)
+
+    def test_dither(self):
+        """ it should convert an image to a bitmap with each dithering method """
+        gray = Image.new('L', (64, 64), 128)
+        for method in imaging.DITHERING_METHODS:
+            dithered = imaging.dither(gray, method)
+            self.assertEqual(dithered.mode, '1')
+            self.assertEqual(dithered.size, (64, 64))
+        for method in (imaging.FLOYD_STEINBERG, imaging.ORDERED, imaging.ATKINSON):
+            self.assertAlmostEqual(get_black_ratio(imaging.dither(gray, method)), 0.5, delta=0.05)
+
+    def test_dither_preserves_white_and_black(self):
+        """ it should not add dots to white or black areas """
+        for method in imaging.DITHERING_METHODS:
+            self.assertEqual(get_black_ratio(imaging.dither(Image.new('L', (32, 32), 255), method)), 0)
+            self.assertEqual(get_black_ratio(imaging.dither(Image.new('L', (32, 32), 0), method)), 1)
+
+    def test_dither_unknown_method(self):
+        with self.assertRaises(ValueError):
+            imaging.dither(Image.new('L', (8, 8)), 'unknown')
+
+    def test_prepare_ticket(self):
+        """ it should resize a ticket to the printer width and dither it """
+        data = encode(Image.new('RGBA', (640, 1026), 'white'), 'PNG')
+        im = imaging.prepare_ticket(data, width=576, method=imaging.ORDERED)
+        self.assertEqual(im.mode, '1')
+        self.assertEqual(im.size, (576, 923))
+
+    def test_get_tone_curve(self):
+        """ it should compute a lookup table once for each set of parameters """
+        self.assertEqual(imaging.get_tone_curve(), range(256))
+        curve = imaging.get_tone_curve(contrast=2.0)
+        self.assertEqual((curve[0], curve[128], curve[255]), (0, 129, 255))
+        self.assertEqual(curve[32], 0)
+        self.assertIs(imaging.get_tone_curve(contrast=2.0), curve)
+        self.assertLess(imaging.get_tone_curve(gamma=0.5)[128], 128)
+        self.assertGreater(imaging.get_tone_curve(brightness=1.5)[128], 128)
+
+    def test_enhance(self):
+        """ it should apply the tone curve to each band and keep the format """
+        im = Image.new('RGB', (16, 16), (64, 128, 192))
+        im.format = 'JPEG'
+        enhanced = imaging.enhance(im, gamma=2.0, sharpness=1.5)
+        r, g, b = enhanced.getpixel((8, 8))
+        self.assertGreater(r, 64)
+        self.assertGreater(g, 128)
+        self.assertEqual(enhanced.format, 'JPEG')
+        self.assertIs(imaging.enhance(im), im)
+
+    @mock.patch('figureraspbian.imaging.settings')
+    def test_get_tone_parameters(self, mock_settings):
+        """ it should override global parameters with the ones of the event """
+        mock_settings.CONTRAST_FACTOR = 1.2
+        mock_settings.BRIGHTNESS_FACTOR = 1.0
+        mock_settings.GAMMA = 1.0
+        mock_settings.SHARPNESS_FACTOR = 1.0
+        mock_settings.TONE_CURVES = '{"12": {"gamma": 1.4}}'
+        event = mock.Mock(id=12)
+        expected = {'contrast': 1.2, 'brightness': 1.0, 'gamma': 1.4, 'sharpness': 1.0}
+        self.assertEqual(imaging.get_tone_parameters(event), expected)
+        expected['gamma'] = 1.0
+        self.assertEqual(imaging.get_tone_parameters(mock.Mock(id=13)), expected)
+        self.assertEqual(imaging.get_tone_parameters(), expected)
+
+    def test_parse_tone_curves(self):
+        """ it should ignore invalid JSON and invalid curves """
+        self.assertEqual(imaging.parse_tone_curves('{"12": {"contrast": 1.2}'), {})
+        self.assertEqual(imaging.parse_tone_curves('[1.2]'), {})
+        curves = imaging.parse_tone_curves(
+            '{"12": {"contrast": 1.2}, "13": {"constrast": 1.2}, "14": {"gamma": 0}, "15": 1.2, "16": {"gamma": "1"}}')
+        self.assertEqual(curves, {'12': {'contrast': 1.2}})
+
+    def test_get_stretch_curve(self):
+        """ it should map the levels between the cutoff percentiles to the full range """
+        histogram = [0] * 256
+        histogram[50] = histogram[150] = 100
+        curve = imaging.get_stretch_curve(histogram, 1.0)
+        self.assertEqual((curve[50], curve[150]), (0, 255))
+        self.assertAlmostEqual(curve[100], 128, delta=1)
+        flat = [0] * 256
+        flat[80] = 100
+        self.assertEqual(imaging.get_stretch_curve(flat, 1.0), range(256))
+
+    def test_get_equalization_curve(self):
+        """ it should spread levels evenly while limiting the contrast of flat areas """
+        histogram = [1] * 256
+        self.assertEqual(imaging.get_equalization_curve(histogram, 2.0), range(256))
+        histogram = [0] * 256
+        histogram[100] = 256
+        curve = imaging.get_equalization_curve(histogram, 2.0)
+        self.assertLess(curve[99] - curve[0], 100)
+        self.assertLess(curve[100] - curve[99], 255)
+
+    def test_get_tile_masks(self):
+        """ it should weight tiles so that the weights of a pixel add up to 255 """
+        masks = imaging.get_tile_masks((90, 60), 3)
+        self.assertEqual(len(masks), 9)
+        for xy in [(0, 0), (20, 15), (45, 30), (89, 59)]:
+            self.assertEqual(sum(mask.getpixel(xy) for mask in masks), 255)
+        self.assertIs(imaging.get_tile_masks((90, 60), 3), masks)
+
+    def test_normalize(self):
+        """ it should bring the tones of a dull picture to the full range """
+        gradient = Image.new('L', (256, 256))
+        gradient.putdata([x for y in range(256) for x in range(256)])
+        dull = gradient.point(lambda v: 40 + v / 3)
+        dull.format = 'JPEG'
+        for method in (imaging.STRETCH, imaging.LOCAL):
+            normalized = imaging.normalize(dull, method, budget=60)
+            low, high = normalized.getextrema()
+            self.assertLess(low, 10)
+            self.assertGreater(high, 245)
+            self.assertEqual(normalized.format, 'JPEG')
+        self.assertIs(imaging.normalize(dull, imaging.NONE), dull)
+        rgb = imaging.normalize(dull.convert('RGB'), imaging.LOCAL, budget=60)
+        self.assertEqual(rgb.mode, 'RGB')
+
+    def test_normalize_budget(self):
+        """ it should fall back to the stretch when local equalization would exceed its budget """
+        dull = Image.new('L', (64, 64), 100)
+        with mock.patch('figureraspbian.imaging.time') as mock_time:
+            mock_time.time.side_effect = [0, 0, 0, 1]
+            stretched = imaging.normalize(dull, imaging.STRETCH)
+            normalized = imaging.normalize(dull, imaging.LOCAL, budget=0.5)
+        self.assertEqual(list(normalized.getdata()), list(stretched.getdata()))
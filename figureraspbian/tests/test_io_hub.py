@@ -0,0 +1,106 @@
+# -*- coding: utf8 -*-
+
+from unittest import TestCase
+from threading import Event
+import time
+
+from gpiozero import Device
+from gpiozero.pins.mock import MockFactory
+
+from ..devices.io_hub import IOHub, GPIOZeroIOHub
+
+
+class FakeIOHub(IOHub):
+    """ Pins held in memory, edges are reported when an input is set """
+
+    def __init__(self):
+        super(FakeIOHub, self).__init__()
+        self.pins = {}
+        self.callbacks = {}
+        self.writes = []
+
+    def watch(self, pin, callback, pull_up=True):
+        self.callbacks[pin] = callback
+
+    def unwatch(self, pin):
+        self.callbacks.pop(pin, None)
+
+    def read(self, pin):
+        return self.pins.get(pin, False)
+
+    def write(self, pin, value):
+        self.pins[pin] = value
+        self.writes.append((pin, value, time.time()))
+
+    def set_input(self, pin, value):
+        self.pins[pin] = value
+        if pin in self.callbacks:
+            self.call_soon(self.callbacks[pin])
+
+    def wait_idle(self, timeout=1):
+        """ Wait for the tasks due so far to be run """
+        done = Event()
+        self.call_soon(done.set)
+        done.wait(timeout)
+
+
+class IOHubTestCase(TestCase):
+
+    def setUp(self):
+        self.hub = FakeIOHub()
+
+    def tearDown(self):
+        self.hub.stop()
+
+    def test_schedule(self):
+        """ it should run tasks in order on a single thread and skip cancelled ones """
+        calls = []
+        self.hub.schedule(0.04, calls.append, 'c')
+        self.hub.schedule(0.02, calls.append, 'b')
+        cancelled = self.hub.schedule(0.01, calls.append, 'cancelled')
+        self.hub.call_soon(calls.append, 'a')
+        cancelled.cancel()
+        time.sleep(0.1)
+        self.assertEqual(calls, ['a', 'b', 'c'])
+
+    def test_pulse(self):
+        """ it should turn an output off once the pulse is over """
+        self.hub.pulse(5, 0.02)
+        self.assertTrue(self.hub.read(5))
+        time.sleep(0.06)
+        self.assertFalse(self.hub.read(5))
+        (_, _, on), (_, _, off) = self.hub.writes
+        self.assertAlmostEqual(off - on, 0.02, delta=0.02)
+
+    def test_stop(self):
+        """ it should not run tasks once stopped """
+        calls = []
+        self.hub.schedule(0.05, calls.append, 'late')
+        self.hub.stop()
+        time.sleep(0.1)
+        self.assertEqual(calls, [])
+
+
+class GPIOZeroIOHubTestCase(TestCase):
+
+    def setUp(self):
+        # mock pins can be driven from the test, whatever the host
+        self.pin_factory = Device.pin_factory
+        Device.pin_factory = MockFactory()
+
+    def tearDown(self):
+        Device.pin_factory.close()
+        Device.pin_factory = self.pin_factory
+
+    def test_watch(self):
+        """ it should share one device per pin and report edges on the hub thread """
+        hub = GPIOZeroIOHub()
+        edge = Event()
+        hub.watch(17, edge.set)
+        self.assertIs(hub.get_input(17), hub.inputs[17])
+        hub.inputs[17].pin.drive_low()
+        self.assertTrue(edge.wait(1))
+        self.assertTrue(hub.read(17))
+        hub.write(18, True)
+        self.assertTrue(hub.outputs[18].value)
+        hub.stop()
@@ -0,0 +1,45 @@
+from unittest import TestCase
+import time
+
+from ..jobs import Job, JobRunner
+from ..exceptions import DevicesBusy
+
+
+def wait_for(job, timeout=2):
+    timeout_after = time.time() + timeout
+    while job.status in (Job.QUEUED, Job.RUNNING) and time.time() < timeout_after:
+        time.sleep(0.01)
+
+
+class JobRunnerTestCase(TestCase):
+
+    def test_submit(self):
+        """ it should run jobs in the background and keep their result """
+        runner = JobRunner()
+        job = runner.submit('add', lambda a, b: a + b, 1, b=2)
+        self.assertEqual(runner.get(job.id), job)
+        wait_for(job)
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.result, 3)
+        self.assertIsNotNone(job.ended_at)
+        runner.stop()
+
+    def test_submit_failure(self):
+        """ it should mark jobs raising an exception as failed """
+        def busy():
+            raise DevicesBusy()
+        runner = JobRunner()
+        job = runner.submit('busy', busy)
+        wait_for(job)
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIsInstance(job.error, DevicesBusy)
+        runner.stop()
+
+    def test_history_size(self):
+        """ it should only keep the last jobs """
+        runner = JobRunner(history_size=2)
+        jobs = [runner.submit('noop', lambda: None) for _ in range(3)]
+        self.assertIsNone(runner.get(jobs[0].id))
+        self.assertEqual(runner.get(jobs[2].id), jobs[2])
+        wait_for(jobs[2])
+        runner.stop()
@@ -27,27 +27,6 @@ class TextTestCase(TestCase):
         expected = {'id': 1, 'text': 'some text'}
         self.assertEqual(serialized, expected)
 
-    def test_update_or_create_does_not_exist(self):
-        """ it should create a new instance if the given text does not exist """
-        data = {'id': 1, 'text': 'some text'}
-        self.assertEqual(Text.select().count(), 0)
-        Text.update_or_create(data, None)
-        self.assertEqual(Text.select().count(), 1)
-        text = Text.get(Text.id == 1)
-        self.assertEqual(text.serialize(), data)
-
-    def test_update_or_create_already_exists(self):
-        """ it should update the fields of the already existing instance """
-        data = {'id': 1, 'value': 'some text'}
-        Text.create(**data)
-        self.assertEqual(Text.select().count(), 1)
-        data.pop('value')
-        data['text'] = 'changed'
-        Text.update_or_create(data, None)
-        self.assertEqual(Text.select().count(), 1)
-        text = Text.get(Text.id == 1)
-        self.assertEqual(text.value, 'changed')
-
 
 class ImageTestCase(TestCase):
 
@@ -67,33 +46,6 @@ class ImageTestCase(TestCase):
         expected = {'id': 1, 'name': 'image'}
         self.assertEqual(serialized, expected)
 
-    @mock.patch("figureraspbian.models.utils.download")
-    def test_update_or_create_does_not_exists(self, mock_download):
-        """ it should create an image if it does not exist and download the corresponding file """
-        expected_path = '/path/to/image'
-        mock_download.return_value = expected_path
-        data = {'id': 1, 'image': 'https://url/to/image'}
-        self.assertEqual(Image.select().count(), 0)
-        Image.update_or_create(data)
-        self.assertEqual(Image.select().count(), 1)
-        mock_download.assert_called_with(data['image'], settings.IMAGE_ROOT)
-        image = Image.get(Image.id == 1)
-        self.assertEqual(image.path, expected_path)
-
-    @mock.patch("figureraspbian.models.utils.download")
-    def test_update_or_create_already_exist(self, mock_download):
-        """ it should update image and download new image file """
-        original_path = "/path/to/image1"
-        Image.create(id=1, path=original_path)
-        expected_path = "/path/to/image2"
-        mock_download.return_value = expected_path
-        self.assertEqual(Image.select().count(), 1)
-        data = {'id': 1, 'image': 'https://url/to/image2', 'name': 'image2'}
-        Image.update_or_create(data)
-        mock_download.assert_called_with(data['image'], settings.IMAGE_ROOT)
-        image = Image.get(Image.id == 1)
-        self.assertEqual(image.path, expected_path)
-
 
 class TextVariableTestCase(TestCase):
 
@@ -113,24 +65,6 @@ class TextVariableTestCase(TestCase):
         expected = {'items': [], 'mode': 'sequential', 'id': 1, 'name': 'variable'}
         self.assertEqual(serialized, expected)
 
-    def test_update_or_create_does_not_exist(self):
-        """ it should create a text variable if it does not exist """
-        data = {'id': 1, 'name': 'variable', 'mode': 'sequential', 'items': []}
-        self.assertEqual(TextVariable.select().count(), 0)
-        TextVariable.update_or_create(data, None)
-        self.assertEqual(TextVariable.select().count(),  1)
-
-    def test_update_or_create_already_exists(self):
-        """ it should update the fields of the already existing instance """
-        data = {'id': 1, 'name': 'variable', 'mode': 'sequential', 'items': []}
-        TextVariable.create(**data)
-        self.assertEqual(TextVariable.select().count(),  1)
-        data['name'] = 'changed'
-        TextVariable.update_or_create(data, None)
-        self.assertEqual(TextVariable.select().count(),  1)
-        text = TextVariable.get(TextVariable.id == 1)
-        self.assertEqual(text.name, 'changed')
-
 
 class ImageVariableTestCase(TestCase):
 
@@ -150,24 +84,6 @@ class ImageVariableTestCase(TestCase):
         expected = {'items': [], 'mode': 'sequential', 'id': 1, 'name': 'variable'}
         self.assertEqual(serialized, expected)
 
-    def test_update_or_create_does_not_exist(self):
-        """ it should create an image variable if it does not exist """
-        data = {'id': 1, 'name': 'variable', 'mode': 'sequential', 'items': []}
-        self.assertEqual(ImageVariable.select().count(), 0)
-        ImageVariable.update_or_create(data, None)
-        self.assertEqual(ImageVariable.select().count(), 1)
-
-    def test_update_or_create_already_exist(self):
-        """ it should update fields of an already existing instance """
-        data = {'id': 1, 'name': 'variable', 'mode': 'sequential', 'items': []}
-        ImageVariable.create(**data)
-        self.assertEqual(ImageVariable.select().count(), 1)
-        data['name'] = 'changed'
-        ImageVariable.update_or_create(data)
-        self.assertEqual(ImageVariable.select().count(), 1)
-        image_variable = ImageVariable.get(id=1)
-        image_variable.name = 'changed'
-
 
 class TicketTemplateTestCase(TestCase):
 
@@ -236,6 +152,80 @@ class TicketTemplateTestCase(TestCase):
         self.assertEqual(ticket_template.serialize(), data)
 
 
+    @mock.patch("figureraspbian.models.utils.download_all")
+    def test_update_or_create_items(self, mock_download_all):
+        """ it should create, update and delete variables, texts and images to match the payload """
+        downloaded = []
+
+        def download_all(urls, path):
+            downloaded.extend(urls)
+            return {url: '/path/to/%s' % url.rsplit('/', 1)[1] for url in urls}
+
+        mock_download_all.side_effect = download_all
+        data = {
+            'id': 1,
+            'html': '<body></body>',
+            'modified': '2015-05-11T08:31:01Z',
+            'title': 'foo',
+            'description': 'bar',
+            'text_variables': [
+                {'id': 1, 'name': 'quote', 'mode': 'random', 'items': [
+                    {'id': 1, 'text': 'foo'}, {'id': 2, 'text': 'bar'}]},
+                {'id': 2, 'name': 'other', 'mode': 'random', 'items': [{'id': 3, 'text': 'baz'}]}
+            ],
+            'image_variables': [
+                {'id': 1, 'name': 'logo', 'mode': 'random', 'items': [
+                    {'id': 2, 'image': 'https://url/to/logo1.png', 'name': 'logo1.png'}]}
+            ],
+            'images': [{'id': 1, 'image': 'https://url/to/image1.png', 'name': 'image1.png'}]
+        }
+        TicketTemplate.update_or_create(data)
+        self.assertEqual(Text.select().count(), 3)
+        self.assertEqual(Image.select().count(), 2)
+        self.assertEqual(len(downloaded), 2)
+
+        data['modified'] = '2015-05-12T08:31:01Z'
+        data['text_variables'] = [
+            {'id': 1, 'name': 'quote', 'mode': 'sequential', 'items': [
+                {'id': 1, 'text': 'changed'}, {'id': 4, 'text': 'new'}]}
+        ]
+        data['image_variables'][0]['items'].append({'id': 3, 'image': 'https://url/to/logo2.png', 'name': 'logo2.png'})
+        TicketTemplate.update_or_create(data)
+
+        self.assertEqual(downloaded[2:], ['https://url/to/logo2.png'])
+        self.assertEqual(TextVariable.select().count(), 1)
+        self.assertEqual(TextVariable.get(TextVariable.id == 1).mode, 'sequential')
+        self.assertEqual(sorted(text.id for text in Text.select()), [1, 4])
+        self.assertEqual(Text.get(Text.id == 1).value, 'changed')
+        self.assertEqual(Image.get(Image.id == 3).path, '/path/to/logo2.png')
+        ticket_template = TicketTemplate.get(TicketTemplate.id == 1)
+        self.assertEqual(ticket_template.serialize()['text_variables'], [
+            {'id': 1, 'name': 'quote', 'mode': 'sequential', 'items': [
+                {'id': 1, 'text': 'changed'}, {'id': 4, 'text': 'new'}]}
+        ])
+
+    def test_update_or_create_many_items(self):
+        """ it should upsert more items than SQLite accepts parameters in a single query """
+        data = {
+            'id': 1,
+            'html': '<body></body>',
+            'modified': '2015-05-11T08:31:01Z',
+            'title': 'foo',
+            'description': 'bar',
+            'text_variables': [
+                {'id': 1, 'name': 'quote', 'mode': 'random', 'items': [
+                    {'id': i, 'text': 'text %s' % i} for i in range(1, 1201)]}
+            ],
+            'image_variables': [],
+            'images': []
+        }
+        TicketTemplate.update_or_create(data)
+        self.assertEqual(Text.select().count(), 1200)
+        data['text_variables'][0]['items'] = data['text_variables'][0]['items'][200:]
+        TicketTemplate.update_or_create(data)
+        self.assertEqual(Text.select().count(), 1000)
+
+
 class PhotoboothTestCase(TestCase):
 
     def setUp(self):
@@ -0,0 +1,79 @@
+# -*- coding: utf8 -*-
+
+from unittest import TestCase
+import mock
+
+from usb.core import USBError
+
+from ..paper_monitor import PaperMonitor, reconcile_paper_level
+from ..devices.printer import PAPER_OK, PAPER_NEAR_END, PAPER_OUT, VKP80III, EpsonTMT20
+
+
+class PaperMonitorTestCase(TestCase):
+
+    def test_check(self):
+        """ it should cache the status of the paper sensors and keep it when they can not be read """
+        printer = mock.Mock()
+        printer.get_status.return_value = {'paper': PAPER_NEAR_END}
+        monitor = PaperMonitor(printer=printer)
+        self.assertIsNone(monitor.status)
+        self.assertTrue(monitor.paper_present())
+        self.assertEqual(monitor.check(), PAPER_NEAR_END)
+        self.assertIsNotNone(monitor.checked_at)
+        printer.get_status.side_effect = USBError('timeout')
+        self.assertEqual(monitor.check(), PAPER_NEAR_END)
+        printer.get_status.side_effect = None
+        printer.get_status.return_value = {'paper': PAPER_OUT}
+        monitor.check()
+        self.assertFalse(monitor.paper_present())
+
+    def test_subscribe(self):
+        """ it should call subscribers when the status changes """
+        printer = mock.Mock()
+        printer.get_status.return_value = {'paper': PAPER_OK}
+        monitor = PaperMonitor(printer=printer)
+        callback = mock.Mock()
+        monitor.subscribe(callback)
+        monitor.check()
+        monitor.check()
+        callback.assert_called_once_with(PAPER_OK)
+        printer.get_status.return_value = {'paper': PAPER_OUT}
+        monitor.check()
+        callback.assert_called_with(PAPER_OUT)
+        monitor.unsubscribe(callback)
+        printer.get_status.return_value = {'paper': PAPER_OK}
+        monitor.check()
+        self.assertEqual(callback.call_count, 2)
+
+    @mock.patch('figureraspbian.paper_monitor.settings')
+    def test_reconcile_paper_level(self, mock_settings):
+        """ it should keep the estimate as long as it agrees with the sensors """
+        mock_settings.PAPER_NEAR_END_LEVEL = 10.0
+        self.assertEqual(reconcile_paper_level(55.0, None), 55.0)
+        self.assertEqual(reconcile_paper_level(55.0, PAPER_OK, PAPER_OK), 55.0)
+        self.assertEqual(reconcile_paper_level(4.0, PAPER_OK, PAPER_OK), 10.0)
+        self.assertEqual(reconcile_paper_level(55.0, PAPER_NEAR_END, PAPER_OK), 10.0)
+        self.assertEqual(reconcile_paper_level(4.0, PAPER_NEAR_END, PAPER_NEAR_END), 4.0)
+        self.assertEqual(reconcile_paper_level(0, PAPER_NEAR_END, PAPER_NEAR_END), 0)
+        self.assertEqual(reconcile_paper_level(55.0, PAPER_OUT, PAPER_OK), 0)
+
+    @mock.patch('figureraspbian.paper_monitor.settings')
+    def test_reconcile_paper_level_refill(self, mock_settings):
+        """ it should only assume a new roll when paper is found after the sensors reported it out """
+        mock_settings.PAPER_NEAR_END_LEVEL = 10.0
+        self.assertEqual(reconcile_paper_level(0, PAPER_OK, PAPER_OUT), 100.0)
+        self.assertEqual(reconcile_paper_level(0, PAPER_NEAR_END, PAPER_OUT), 10.0)
+        # the level was left at 0 before a restart
+        self.assertEqual(reconcile_paper_level(0, PAPER_OK), 100.0)
+        # an estimate that reached 0 while the sensors still see paper is not a refill
+        self.assertEqual(reconcile_paper_level(0, PAPER_OK, PAPER_OK, near_end_sensor=False), 0)
+
+    @mock.patch('figureraspbian.paper_monitor.settings')
+    def test_reconcile_paper_level_without_near_end_sensor(self, mock_settings):
+        """ it should let the estimate go below the near end level when the printer cannot report it (VKP80III) """
+        mock_settings.PAPER_NEAR_END_LEVEL = 10.0
+        self.assertFalse(VKP80III.has_near_end_sensor)
+        self.assertTrue(EpsonTMT20.has_near_end_sensor)
+        self.assertEqual(reconcile_paper_level(4.0, PAPER_OK, PAPER_OK, near_end_sensor=False), 4.0)
+        self.assertEqual(reconcile_paper_level(55.0, PAPER_OK, PAPER_OK, near_end_sensor=False), 55.0)
+        self.assertEqual(reconcile_paper_level(4.0, PAPER_OUT, PAPER_OK, near_end_sensor=False), 0)
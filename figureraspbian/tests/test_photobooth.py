@@ -14,7 +14,18 @@ from ..db import db
 from ..models import get_all_models, Photobooth as PhotoboothModel, Code, TicketTemplate
 from .. import settings
 from ..photobooth import Photobooth
-from ..exceptions import OutOfPaperError
+from ..print_queue import PrintJob, PrintQueue
+from ..exceptions import OutOfPaperError, PrintQueueFullError
+from ..devices.printer import PAPER_OK, PAPER_OUT
+
+
+class InlinePrintQueue(PrintQueue):
+    """ Prints in the calling thread, other threads do not share the in memory test database """
+
+    def submit(self, image, callback=None, template=None, timeout=None):
+        job = PrintJob(image, callback, template)
+        job.run(self.printer)
+        return job
 
 
 class PhotoboothTestCase(TestCase):
@@ -56,16 +67,17 @@ class PhotoboothTestCase(TestCase):
         printer_factory.return_value = printer
         camera_factory.return_value = camera
 
-        printer.paper_present.return_value = False
         _p = PhotoboothModel.get()
         _p.paper_level = 0.0
         _p.save()
         photobooth = Photobooth()
+        photobooth.paper_monitor.status = PAPER_OUT
         photobooth._trigger()
 
         self.assertEqual(camera.capture.call_count, 0)
+        self.assertFalse(printer.get_status.called)
 
-        printer.paper_present.return_value = True
+        photobooth.paper_monitor.status = PAPER_OK
         snapshot = open("./test_snapshot.jpg").read()
         camera.capture.return_value = snapshot
 
@@ -100,8 +112,8 @@ class PhotoboothTestCase(TestCase):
     @mock.patch("figureraspbian.devices.camera.Camera.factory")
     @mock.patch("figureraspbian.devices.printer.Printer.factory")
     @mock.patch("figureraspbian.devices.door_lock.DoorLock.factory")
-    @mock.patch("figureraspbian.photobooth.Image")
-    def test_render_ticket(self, mock_Image, door_lock_factory, printer_factory, camera_factory):
+    @mock.patch("figureraspbian.photobooth.imaging.open_resized")
+    def test_render_ticket(self, open_resized, door_lock_factory, printer_factory, camera_factory):
         """ it should resize picture and render ticket from context """
         camera = mock.Mock()
         printer = mock.Mock()
@@ -110,10 +122,7 @@ class PhotoboothTestCase(TestCase):
         printer_factory.return_value = printer
         camera_factory.return_value = camera
 
-        picture = mock.Mock()
-        mock_Image.open.return_value = picture
-        picture.format = 'JPEG'
-        picture.resize.return_value = Image.open('./test_snapshot.jpg')
+        open_resized.return_value = Image.open('./test_snapshot.jpg')
 
         photobooth = Photobooth()
         now = datetime(2017, 1, 1)
@@ -129,10 +138,11 @@ class PhotoboothTestCase(TestCase):
         }
         photobooth.photobooth.ticket_template = TicketTemplate.create(**tt)
         photobooth.photobooth.save()
-        rendered = photobooth.render_ticket(open('./test_snapshot.jpg').read())
+        picture = open('./test_snapshot.jpg').read()
+        rendered = photobooth.render_ticket(picture)
 
         size = settings.TICKET_TEMPLATE_PICTURE_SIZE
-        picture.resize.assert_called_once_with((size, size))
+        open_resized.assert_called_once_with(picture, (size, size))
         expected = "<html>foobar</html>"
         self.assertEqual(rendered, expected)
 
@@ -142,6 +152,7 @@ class PhotoboothTestCase(TestCase):
     @mock.patch("figureraspbian.devices.door_lock.DoorLock.factory")
     @mock.patch("figureraspbian.photobooth.webkit2png")
     @mock.patch("figureraspbian.photobooth.request")
+    @mock.patch("figureraspbian.photobooth.PrintQueue", InlinePrintQueue)
     def test_render_print_and_upload(self, request, webkit2png, door_lock_factory, printer_factory, camera_factory):
         """ it should render a ticket, print it and upload it """
         camera = mock.Mock()
@@ -201,6 +212,7 @@ class PhotoboothTestCase(TestCase):
     @mock.patch("figureraspbian.devices.door_lock.DoorLock.factory")
     @mock.patch("figureraspbian.photobooth.webkit2png")
     @mock.patch("figureraspbian.photobooth.request")
+    @mock.patch("figureraspbian.photobooth.PrintQueue", InlinePrintQueue)
     def test_render_print_and_upload_out_of_paper(self, request, webkit2png, door_lock_factory,
                                                   printer_factory, camera_factory):
         """ it should catch OutOfPaperException and set paper level to 0 """
@@ -248,14 +260,76 @@ class PhotoboothTestCase(TestCase):
         request.update_paper_level_async.assert_called_with(photobooth.paper_level)
 
 
+    @mock.patch("figureraspbian.devices.camera.Camera.factory")
+    @mock.patch("figureraspbian.devices.printer.Printer.factory")
+    @mock.patch("figureraspbian.devices.door_lock.DoorLock.factory")
+    @mock.patch("figureraspbian.photobooth.webkit2png")
+    @mock.patch("figureraspbian.photobooth.request")
+    def test_render_print_and_upload_queue_full(self, request, webkit2png, door_lock_factory, printer_factory,
+                                                camera_factory):
+        """ it should put the code back when the ticket cannot be queued """
+        photobooth = Photobooth()
+        photobooth.render_ticket = mock.Mock(return_value='<html></html>')
+        photobooth.print_queue.submit = mock.Mock(side_effect=PrintQueueFullError)
 
+        with self.assertRaises(PrintQueueFullError):
+            photobooth.render_print_and_upload(open("./test_snapshot.jpg").read())
 
+        self.assertEqual([code.value for code in Code.select()], ["CODE1"])
+        self.assertEqual(photobooth.counter, 0)
+        self.assertFalse(request.upload_portrait_async.called)
 
 
+    @mock.patch("figureraspbian.devices.camera.Camera.factory")
+    @mock.patch("figureraspbian.devices.printer.Printer.factory")
+    @mock.patch("figureraspbian.devices.door_lock.DoorLock.factory")
+    @mock.patch("figureraspbian.photobooth.request")
+    def test_on_paper_status_change(self, request, door_lock_factory, printer_factory, camera_factory):
+        """ it should correct the estimated paper level with the paper sensors """
+        photobooth = Photobooth()
+        photobooth.on_paper_status_change(PAPER_OK)
+        self.assertFalse(request.update_paper_level_async.called)
+        photobooth.on_paper_status_change(PAPER_OUT)
+        self.assertEqual(photobooth.paper_level, 0)
+        self.assertEqual(PhotoboothModel.get().paper_level, 0)
+        request.update_paper_level_async.assert_called_with(0)
+        photobooth.on_paper_status_change(PAPER_OK)
+        self.assertEqual(photobooth.paper_level, 100.0)
 
+    @mock.patch("figureraspbian.devices.camera.Camera.factory")
+    @mock.patch("figureraspbian.devices.printer.Printer.factory")
+    @mock.patch("figureraspbian.devices.door_lock.DoorLock.factory")
+    @mock.patch("figureraspbian.photobooth.request")
+    def test_on_ticket_printed_without_near_end_sensor(self, request, door_lock_factory, printer_factory,
+                                                      camera_factory):
+        """ it should let the estimate go below the near end level when the printer cannot report it """
+        printer_factory.return_value = mock.Mock(has_near_end_sensor=False)
+        photobooth = Photobooth()
+        photobooth.paper_monitor.status = PAPER_OK
+        photobooth.on_paper_status_change(PAPER_OK)
+        photobooth.paper_level = 5.0
+        job = PrintJob('ticket')
+        job.status = PrintJob.DONE
+        job.ticket_length = 1000
+        photobooth.on_ticket_printed(job)
+        self.assertAlmostEqual(photobooth.paper_level, 4.83, 2)
+        photobooth.printer.has_near_end_sensor = True
+        photobooth.on_ticket_printed(job)
+        self.assertEqual(photobooth.paper_level, settings.PAPER_NEAR_END_LEVEL)
 
-
-
-
-
-
+    @mock.patch("figureraspbian.devices.camera.Camera.factory")
+    @mock.patch("figureraspbian.devices.printer.Printer.factory")
+    @mock.patch("figureraspbian.devices.door_lock.DoorLock.factory")
+    def test_swap_devices(self, door_lock_factory, printer_factory, camera_factory):
+        """ it should hand a new printer over to the print queue and update readiness """
+        camera_factory.return_value = None
+        photobooth = Photobooth()
+        self.assertFalse(photobooth.ready)
+        camera = mock.Mock()
+        photobooth.swap_devices(camera=camera)
+        self.assertIs(photobooth.camera, camera)
+        self.assertTrue(photobooth.ready)
+        photobooth.swap_devices(printer=None)
+        self.assertIsNone(photobooth.print_queue.printer)
+        self.assertIsNone(photobooth.paper_monitor.printer)
+        self.assertFalse(photobooth.ready)
@@ -0,0 +1,88 @@
+from unittest import TestCase
+import threading
+
+import mock
+
+from ..print_queue import PrintJob, PrintQueue
+from ..exceptions import OutOfPaperError, PrintQueueFullError
+
+
+class PrintQueueTestCase(TestCase):
+
+    def test_submit(self):
+        """ it should print jobs in the background and call their callback """
+        printer = mock.Mock()
+        printer.print_image.return_value = 700
+        callback = mock.Mock()
+        queue = PrintQueue(printer)
+        job = queue.submit('ticket', callback, template=(1, '2017-01-01'))
+        self.assertEqual(job.wait(2), PrintJob.DONE)
+        printer.print_image.assert_called_once_with('ticket', template=(1, '2017-01-01'))
+        self.assertEqual(job.ticket_length, 700)
+        self.assertIsNone(job.image)
+        callback.assert_called_once_with(job)
+        self.assertEqual(queue.get(job.id), job)
+        queue.stop()
+
+    def test_submit_failure(self):
+        """ it should mark jobs whose printing raised as failed """
+        printer = mock.Mock()
+        printer.print_image.side_effect = OutOfPaperError()
+        queue = PrintQueue(printer)
+        job = queue.submit('ticket')
+        self.assertEqual(job.wait(2), PrintJob.FAILED)
+        self.assertIsInstance(job.error, OutOfPaperError)
+        queue.stop()
+
+    def test_back_pressure(self):
+        """ it should refuse new jobs when the printer does not catch up """
+        printing = threading.Event()
+        release = threading.Event()
+
+        def print_image(image, template=None):
+            printing.set()
+            release.wait(2)
+            return 1
+
+        printer = mock.Mock()
+        printer.print_image.side_effect = print_image
+        queue = PrintQueue(printer, size=1)
+        first = queue.submit('first')
+        printing.wait(2)
+        self.assertEqual(first.status, PrintJob.PRINTING)
+        self.assertFalse(queue.is_idle())
+        second = queue.submit('second')
+        self.assertEqual(second.status, PrintJob.QUEUED)
+        with self.assertRaises(PrintQueueFullError):
+            queue.submit('third', timeout=0.05)
+        release.set()
+        queue.wait_until_idle()
+        self.assertTrue(queue.is_idle())
+        self.assertEqual(second.status, PrintJob.DONE)
+        self.assertEqual(len(queue.get_jobs()), 2)
+        queue.stop()
+
+    def test_stop_when_full(self):
+        """ it should give up waiting for the printer after a timeout and stop even if the queue is full """
+        printing = threading.Event()
+        release = threading.Event()
+
+        def print_image(image, template=None):
+            printing.set()
+            release.wait(2)
+            return 1
+
+        printer = mock.Mock()
+        printer.print_image.side_effect = print_image
+        queue = PrintQueue(printer, size=1)
+        first = queue.submit('first')
+        printing.wait(2)
+        queue.submit('second')
+        self.assertFalse(queue.wait_until_idle(0.05))
+        stopping = threading.Thread(target=queue.stop)
+        stopping.start()
+        release.set()
+        stopping.join(5)
+        self.assertFalse(stopping.is_alive())
+        self.assertFalse(queue.is_alive())
+        self.assertEqual(first.status, PrintJob.DONE)
@@ -0,0 +1,195 @@
+# -*- coding: utf8 -*-
+
+from unittest import TestCase
+import cStringIO
+
+import mock
+
+from usb.core import USBError
+from PIL import Image
+
+from ..devices import printer
+from ..devices.printer import Printer, EpsonPrinter, VKP80III, register_printer, PAPER_OK, PAPER_NEAR_END, PAPER_OUT
+from ..devices.printer import iter_bands, get_raster_band, get_raster_data
+from ..exceptions import PrinterNotFoundError, PrinterModelNotRecognizedError, OutOfPaperError, PrinterUSBError
+
+
+class PrinterFactoryTestCase(TestCase):
+
+    @mock.patch("figureraspbian.devices.printer.PRINTER_MODELS", {})
+    @mock.patch("figureraspbian.devices.printer.get_usb_devices")
+    def test_factory(self, get_usb_devices):
+        """ it should create the printer model registered for the USB devices plugged """
+        @register_printer('04b8', '0e15')
+        class Model(Printer):
+            pass
+
+        camera = {'device': '/dev/bus/usb/001/006', 'vendor_id': '04a9', 'product_id': '327f', 'tag': ''}
+        device = {'device': '/dev/bus/usb/001/005', 'vendor_id': '04b8', 'product_id': '0e15', 'tag': ''}
+        get_usb_devices.return_value = [camera, device]
+        self.assertIsInstance(Printer.factory(), Model)
+        self.assertTrue(Model.matches(device))
+        self.assertFalse(Model.matches(camera))
+        get_usb_devices.return_value = [camera]
+        self.assertIsNone(Printer.factory())
+
+    @mock.patch("figureraspbian.devices.printer.get_usb_devices")
+    def test_factory_unknown_model(self, get_usb_devices):
+        """ it should tell an unknown model of a known vendor apart from a missing printer """
+        get_usb_devices.return_value = [{'device': '/dev/bus/usb/001/005', 'vendor_id': '04b8',
+                                         'product_id': 'ffff', 'tag': 'EPSON'}]
+        with mock.patch.object(printer.logger, 'error') as error:
+            Printer.factory()
+            self.assertEqual(error.call_args[0][0], PrinterModelNotRecognizedError(
+                get_usb_devices.return_value[0]).message)
+        get_usb_devices.return_value = []
+        with mock.patch.object(printer.logger, 'error') as error:
+            Printer.factory()
+            self.assertEqual(error.call_args[0][0], PrinterNotFoundError().message)
+
+
+def get_epson_printer():
+    epson = EpsonPrinter()
+    epson.printer = mock.Mock()
+    return epson
+
+
+class EpsonPrinterStatusTestCase(TestCase):
+
+    def test_get_status(self):
+        """ it should read the paper sensors from the DLE EOT 4 status byte """
+        # bits 1 and 4 are always set, bits 2-3 report near end, bits 5-6 report the paper out
+        statuses = [
+            (0x12, PAPER_OK),
+            (0x16, PAPER_NEAR_END),
+            (0x1A, PAPER_NEAR_END),
+            (0x1E, PAPER_NEAR_END),
+            (0x32, PAPER_OUT),
+            (0x52, PAPER_OUT),
+            (0x72, PAPER_OUT),
+            (0x7E, PAPER_OUT)
+        ]
+        epson = get_epson_printer()
+        for byte, paper in statuses:
+            epson.printer.printer.read.return_value = [byte]
+            self.assertEqual(epson.get_status(), {'paper': paper}, hex(byte))
+        epson.printer.write.assert_called_with('\x10\x04\x04')
+
+    def test_get_error(self):
+        """ it should raise OutOfPaperError only when the sensors report the paper out """
+        errors = [
+            ([0x72], OutOfPaperError),
+            ([0x1E], PrinterUSBError),
+            ([0x12], PrinterUSBError),
+            (USBError('timeout'), PrinterUSBError)
+        ]
+        epson = get_epson_printer()
+        for status, error in errors:
+            if isinstance(status, Exception):
+                epson.printer.printer.read.side_effect = status
+            else:
+                epson.printer.printer.read.return_value = status
+            self.assertIsInstance(epson.get_error(USBError('pipe error')), error)
+
+    @mock.patch("figureraspbian.devices.printer.settings")
+    def test_write_chunked(self, mock_settings):
+        """ it should send data in chunks of at most PRINTER_CHUNK_SIZE bytes """
+        mock_settings.PRINTER_CHUNK_SIZE = 4
+        epson = get_epson_printer()
+        epson.write_chunked('abcdefghij')
+        self.assertEqual([c[0][0] for c in epson.printer.write.call_args_list], ['abcd', 'efgh', 'ij'])
+        epson.printer.write.reset_mock()
+        epson.write_chunked('')
+        self.assertFalse(epson.printer.write.called)
+
+
+class RasterTestCase(TestCase):
+
+    def test_get_raster_band_header(self):
+        """ it should give the width in bytes and the height in dots as little endian 16 bit numbers """
+        command = get_raster_band(Image.new('1', (576, 24), 1))
+        self.assertEqual(command[:8], '\x1dv0\x00' + chr(72) + '\x00' + chr(24) + '\x00')
+        self.assertEqual(len(command), 8 + 72 * 24)
+        command = get_raster_band(Image.new('1', (2048, 300), 1))
+        self.assertEqual(command[:8], '\x1dv0\x00' + '\x00\x01' + chr(44) + '\x01')
+        self.assertEqual(len(command), 8 + 256 * 300)
+
+    def test_get_raster_data(self):
+        """ it should pack 8 dots a byte, most significant bit first, and burn black dots only """
+        band = Image.new('1', (16, 2), 1)
+        band.putpixel((0, 0), 0)
+        band.putpixel((15, 1), 0)
+        self.assertEqual(get_raster_data(band), '\x80\x00\x00\x01')
+        self.assertEqual(get_raster_data(Image.new('1', (8, 1), 0)), '\xff')
+
+    def test_get_raster_data_padding(self):
+        """ it should not burn the bits padding rows to a whole byte """
+        self.assertEqual(get_raster_data(Image.new('1', (10, 2), 1)), '\x00' * 4)
+        self.assertEqual(get_raster_data(Image.new('1', (10, 1), 0)), '\xff\xc0')
+        command = get_raster_band(Image.new('1', (10, 1), 0))
+        self.assertEqual(command[4:8], '\x02\x00\x01\x00')
+
+    def test_iter_bands(self):
+        """ it should cut the image in bands of band_height lines, the last one being shorter """
+        im = Image.new('1', (576, 50), 1)
+        im.putpixel((0, 49), 0)
+        bands = list(iter_bands(im, 24))
+        self.assertEqual([band.size for band in bands], [(576, 24), (576, 24), (576, 2)])
+        self.assertEqual(bands[2].getpixel((0, 1)), 0)
+        command = get_raster_band(bands[2])
+        self.assertEqual(command[4:8], chr(72) + '\x00\x02\x00')
+        self.assertEqual(len(command), 8 + 72 * 2)
+
+    def test_orient(self):
+        """ it should center the ticket on the paper width and turn it upside down """
+        epson = get_epson_printer()
+        ticket = Image.new('L', (500, 100), 255)
+        ticket.putpixel((0, 0), 0)
+        oriented = epson.orient(ticket)
+        self.assertEqual(oriented.mode, '1')
+        self.assertEqual(oriented.size, (576, 100))
+        # the top left corner of the ticket, 38 dots from the left margin, ends up at the bottom right
+        self.assertEqual(oriented.getpixel((575 - 38, 99)), 0)
+        self.assertEqual(oriented.histogram()[0], 1)
+        full_width = Image.new('1', (576, 10), 1)
+        self.assertEqual(epson.orient(full_width).size, (576, 10))
+
+    @mock.patch("figureraspbian.devices.printer.settings")
+    def test_epson_print_image(self, mock_settings):
+        """ it should send a raster command for each band then feed and cut the paper """
+        mock_settings.PRINTER_BAND_HEIGHT = 24
+        mock_settings.PRINTER_CHUNK_SIZE = 4096
+        mock_settings.PRINTER_GRAPHICS_CACHE_ON = 0
+        mock_settings.LINE_FEED_COUNT = 4
+        epson = get_epson_printer()
+        buf = cStringIO.StringIO()
+        Image.new('1', (576, 50), 1).save(buf, 'PNG')
+        self.assertEqual(epson.print_image(buf.getvalue()), 50)
+        commands = [c[0][0] for c in epson.printer.write.call_args_list]
+        self.assertEqual([command[4:8] for command in commands],
+                         [chr(72) + '\x00\x18\x00', chr(72) + '\x00\x18\x00', chr(72) + '\x00\x02\x00'])
+        epson.printer.linefeed.assert_called_with(4)
+        self.assertTrue(epson.printer.cut.called)
+
+    @mock.patch("figureraspbian.devices.printer.custom_printer_utils")
+    @mock.patch("figureraspbian.devices.printer.settings")
+    def test_vkp80iii_print_image(self, mock_settings, custom_printer_utils):
+        """ it should print the VKP80III ticket upside down in bands of PRINTER_BAND_HEIGHT lines """
+        mock_settings.PRINTER_BAND_HEIGHT = 24
+        custom_printer_utils.to_base_256.side_effect = lambda n: divmod(n, 256)
+        custom_printer_utils.image_to_raster.side_effect = lambda band: band.size
+        vkp80iii = VKP80III.__new__(VKP80III)
+        Printer.__init__(vkp80iii)
+        vkp80iii.printer = mock.Mock()
+        vkp80iii.max_width = 640
+        ticket = Image.new('1', (640, 30), 1)
+        ticket.putpixel((0, 0), 0)
+        buf = cStringIO.StringIO()
+        ticket.save(buf, 'PNG')
+        self.assertEqual(vkp80iii.print_image(buf.getvalue()), 30)
+        calls = [c[0] for c in vkp80iii.printer.print_raster_image.call_args_list]
+        self.assertEqual(calls, [(0, 80, 0, 24, 0, (640, 24)), (0, 80, 0, 6, 0, (640, 6))])
+        # the top left corner is printed last, at the right
+        last_band = custom_printer_utils.image_to_raster.call_args[0][0]
+        self.assertEqual(last_band.getpixel((639, 5)), 0)
+        self.assertTrue(vkp80iii.printer.present_paper.called)
@@ -0,0 +1,125 @@
+# -*- coding: utf8 -*-
+
+from unittest import TestCase
+from datetime import datetime, timedelta
+import sys
+
+import mock
+
+RPi = mock.Mock()
+sys.modules.setdefault('RPi', RPi)
+sys.modules.setdefault('RPi.GPIO', RPi.GPIO)
+
+from ..devices import real_time_clock
+from ..devices.real_time_clock import RTC_DS1302, bcd_to_int, int_to_bcd
+
+
+SCLK, IO, CE = 3, 2, 13
+
+
+class FakeDS1302GPIO(object):
+    """ Emulates the registers of a DS1302 wired to the SCLK, IO and CE pins """
+
+    BCM = OUT = IN = PUD_DOWN = None
+
+    def __init__(self):
+        self.pins = {SCLK: 0, IO: 0, CE: 0}
+        self.clock = [0] * 8
+        self.ram = [0] * 31
+        self.calls = 0
+        self.reset()
+
+    def reset(self):
+        self.bits = []
+        self.command = None
+        self.pending = []
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, channel, direction, initial=None, pull_up_down=None):
+        pass
+
+    def cleanup(self, channels=None):
+        pass
+
+    def output(self, channels, values):
+        self.calls += 1
+        if not isinstance(channels, list):
+            channels, values = [channels], [values]
+        for channel, value in zip(channels, values):
+            previous = self.pins[channel]
+            self.pins[channel] = value
+            if channel == CE and not value:
+                self.reset()
+            elif channel == SCLK and self.pins[CE]:
+                if value and not previous and not self.pending:
+                    self.bits.append(self.pins[IO])
+                    if len(self.bits) == 8:
+                        self.on_byte(sum(bit << i for i, bit in enumerate(self.bits)))
+                        self.bits = []
+                elif not value and previous and self.pending:
+                    self.pins[IO] = self.pending.pop(0)
+
+    def input(self, channel):
+        self.calls += 1
+        return self.pins[channel]
+
+    def on_byte(self, byte):
+        if self.command is None:
+            self.command = byte
+            self.index = 0
+            if byte & 1:
+                registers = self.clock if byte == RTC_DS1302.CLOCK_BURST_READ else self.ram
+                # the first bit is output on the falling edge following the command
+                self.pending = [value >> i & 1 for value in registers for i in range(8)]
+        elif self.command == RTC_DS1302.CLOCK_BURST_WRITE:
+            self.clock[self.index] = byte
+            self.index += 1
+        elif self.command == RTC_DS1302.RAM_BURST_WRITE:
+            self.ram[self.index] = byte
+            self.index += 1
+
+
+class RTCTestCase(TestCase):
+
+    def setUp(self):
+        self.gpio = FakeDS1302GPIO()
+        patcher = mock.patch.object(real_time_clock, 'GPIO', self.gpio)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.rtc = RTC_DS1302(SCLK, IO, CE)
+
+    def test_bcd(self):
+        self.assertEqual(int_to_bcd(59), 0x59)
+        self.assertEqual(bcd_to_int(0x59), 59)
+
+    def test_write_read_datetime(self):
+        """ it should write and read the date and time in a single burst """
+        dt = datetime(2017, 6, 15, 18, 42, 7)
+        self.rtc.write_datetime(dt)
+        self.assertEqual(self.gpio.clock, [0x07, 0x42, 0x18, 0x15, 0x06, 4, 0x17, 0])
+        self.assertEqual(self.rtc._read_datetime(), dt)
+
+    def test_read_datetime_is_cached(self):
+        """ it should only read the bus once and add the time elapsed since then """
+        self.gpio.clock = [0x80 | 0x07, 0x42, 0x18, 0x15, 0x06, 4, 0x17, 0]
+        with mock.patch.object(real_time_clock, 'elapsed', return_value=100):
+            self.assertEqual(self.rtc.read_datetime(), datetime(2017, 6, 15, 18, 42, 7))
+        calls = self.gpio.calls
+        with mock.patch.object(real_time_clock, 'elapsed', return_value=160):
+            self.assertEqual(self.rtc.read_datetime(), datetime(2017, 6, 15, 18, 43, 7))
+        self.assertEqual(self.gpio.calls, calls)
+
+    def test_correct_drift(self):
+        """ it should set the clock to the system time when it drifted apart """
+        self.rtc.write_datetime(datetime.now() - timedelta(seconds=30))
+        self.assertAlmostEqual(self.rtc.correct_drift(max_drift=2), -30, delta=1.5)
+        self.assertAlmostEqual(self.rtc.get_drift(), 0, delta=1.5)
+
+    def test_ram(self):
+        self.rtc.write_ram('figure')
+        self.assertEqual(self.rtc.read_ram(), 'figure'.ljust(31))
@@ -0,0 +1,55 @@
+# -*- coding: utf8 -*-
+
+from unittest import TestCase
+import mock
+
+from ..devices.remote_release_connector import RemoteReleaseConnector, wait_until
+from ..threads import elapsed
+from .test_io_hub import FakeIOHub
+
+
+class RemoteReleaseConnectorTestCase(TestCase):
+
+    def setUp(self):
+        self.hub = FakeIOHub()
+
+    def tearDown(self):
+        self.hub.stop()
+
+    def test_wait_until(self):
+        """ it should wake up right after the deadline """
+        deadline = elapsed() + 0.02
+        woke_up_at = wait_until(deadline)
+        self.assertGreaterEqual(woke_up_at, deadline)
+        self.assertLess(woke_up_at - deadline, 0.005)
+
+    def test_trigger(self):
+        """ it should press the release for the pulse duration and record when """
+        connector = RemoteReleaseConnector(5, io_hub=self.hub, pulse_duration=0.02)
+        pulse = connector.trigger()
+        self.assertEqual([(pin, value) for pin, value, _ in self.hub.writes], [(5, True), (5, False)])
+        self.assertIsNone(pulse.half_pressed_at)
+        self.assertAlmostEqual(pulse.released_at - pulse.pressed_at, 0.02, delta=0.002)
+        self.assertIs(connector.last_pulse, pulse)
+
+    def test_trigger_with_focus(self):
+        """ it should half press the release before fully pressing it """
+        connector = RemoteReleaseConnector(5, focus_pin=6, io_hub=self.hub, focus_time=0.03, pulse_duration=0.01)
+        pulse = connector.trigger()
+        self.assertEqual([(pin, value) for pin, value, _ in self.hub.writes],
+                         [(6, True), (5, True), (5, False), (6, False)])
+        self.assertAlmostEqual(pulse.pressed_at - pulse.half_pressed_at, 0.03, delta=0.002)
+
+    def test_trigger_write_error(self):
+        """ it should not leave the release pressed when a write fails """
+        connector = RemoteReleaseConnector(5, focus_pin=6, io_hub=self.hub, focus_time=0.01, pulse_duration=0.01)
+        write = self.hub.write
+
+        def fail_on_press(pin, value):
+            write(pin, value)
+            if pin == 5 and value:
+                raise IOError()
+        with mock.patch.object(self.hub, 'write', side_effect=fail_on_press):
+            with self.assertRaises(IOError):
+                connector.trigger()
+        self.assertEqual(self.hub.pins, {5: False, 6: False})
@@ -1,9 +1,12 @@
+# -*- coding: utf8 -*-
 
 from unittest import TestCase
 from datetime import datetime
 import mock
 
 from .. import request
+from .. import settings
+from .stand_in_api import StandInAPI
 
 
 class RequestTestCase(TestCase):
@@ -119,3 +122,87 @@ class RequestTestCase(TestCase):
         self.assertIsNotNone(updated.serial_number)
 
 
+class UpdateSyncTestCase(TestCase):
+
+    def setUp(self):
+        from ..models import get_all_models, Photobooth
+        from ..db import db
+        db.connect_db()
+        db.database.drop_tables(get_all_models(), safe=True)
+        db.database.create_tables(get_all_models())
+        Photobooth.get_or_create(uuid=settings.RESIN_UUID)
+        request._versions = None
+        self.data = {
+            "id": 1,
+            "serial_number": "FIG.00012",
+            "place": {
+                "id": 1,
+                "name": "Atelier Commode",
+                "tz": "Europe/Paris",
+                "modified": "2017-03-17T09:09:03.268825Z",
+                "portraits_expiration": 30,
+                "code": "ATELIER"
+            },
+            "event": None,
+            "ticket_template": {
+                "id": 1,
+                "modified": "2017-04-13T16:54:19.987969Z",
+                "html": "<!doctype html></html>\n" * 100,
+                "title": "Atelier Commode",
+                "description": "",
+                "text_variables": [],
+                "image_variables": [],
+                "images": [],
+            }
+        }
+        self.api = StandInAPI(self.data)
+        self.api.start()
+        self.api_base = mock.patch.object(request.figure, 'api_base', self.api.url)
+        self.api_base.start()
+
+    def tearDown(self):
+        from ..db import db
+        self.api_base.stop()
+        self.api.stop()
+        db.close_db()
+
+    def test_update_sends_versions_and_applies_delta(self):
+        """ it should send last known versions and only receive what changed """
+        from ..models import Photobooth
+        request.update()
+        updated = Photobooth.get()
+        self.assertEqual(updated.place.name, "Atelier Commode")
+        self.assertEqual(updated.ticket_template.id, 1)
+        self.assertEqual(self.api.requests[0][1], {})
+
+        full_size = self.api.bytes_sent
+        self.data['place'] = dict(self.data['place'], name="Le Bar à Bulles", modified="2017-05-04T09:33:21.988428Z")
+        request.update()
+        _, query = self.api.requests[1]
+        self.assertEqual(query['ticket_template_id'], '1')
+        self.assertEqual(query['ticket_template_modified'], "2017-04-13T16:54:19.987969Z")
+        self.assertEqual(Photobooth.get().place.name, u"Le Bar à Bulles")
+        self.assertLess(self.api.bytes_sent - full_size, full_size)
+
+    def test_update_delta_removes_relation(self):
+        """ it should delete a relation the API explicitly set to None """
+        from ..models import Photobooth
+        request.update()
+        self.data['place'] = None
+        request.update()
+        self.assertIsNone(Photobooth.get().place)
+
+    def test_update_nothing_changed(self):
+        """ it should skip local diffing when the API reports nothing changed """
+        request.update()
+        with mock.patch("figureraspbian.request.Photobooth.update_from_api_data") as update_from_api_data:
+            self.assertEqual(request.update(), 0)
+            self.assertFalse(update_from_api_data.called)
+
+    def test_update_full_document_nothing_changed(self):
+        """ it should compare versions of a full document before diffing it """
+        self.api.delta = False
+        request.update()
+        with mock.patch("figureraspbian.request.Photobooth.update_from_api_data") as update_from_api_data:
+            self.assertEqual(request.update(), 0)
+            self.assertFalse(update_from_api_data.called)
@@ -0,0 +1,124 @@
+# -*- coding: utf8 -*-
+
+from unittest import TestCase
+import threading
+import time
+
+import mock
+
+from ..scheduler import ScheduledJob, Scheduler
+from ..threads import elapsed
+
+
+class ScheduledJobTestCase(TestCase):
+
+    def test_run(self):
+        """ it should record the statistics of each run and the error of a failing one """
+        func = mock.Mock(side_effect=[None, Exception('boom')])
+        job = ScheduledJob('job', lambda: func(), 10)
+        job.run()
+        job.run()
+        stats = job.serialize()
+        self.assertEqual(stats['runs'], 2)
+        self.assertEqual(stats['failures'], 1)
+        self.assertEqual(stats['consecutive_failures'], 1)
+        self.assertEqual(stats['last_error'], "Exception('boom',)")
+        self.assertIsNotNone(stats['mean_duration'])
+        self.assertFalse(stats['running'])
+
+    def test_get_delay(self):
+        """ it should back off exponentially on failures and spread runs by the jitter """
+        job = ScheduledJob('job', lambda: None, 10, jitter=0.1, max_backoff=40)
+        for _ in range(20):
+            self.assertTrue(9 <= job.get_delay() <= 11)
+        job.consecutive_failures = 1
+        self.assertTrue(18 <= job.get_delay() <= 22)
+        job.consecutive_failures = 5
+        self.assertTrue(36 <= job.get_delay() <= 44)
+
+
+class SchedulerTestCase(TestCase):
+
+    def test_run_pending(self):
+        """ it should only run jobs that are due and schedule their next run """
+        scheduler = Scheduler()
+        func = mock.Mock()
+        job = scheduler.add('job', lambda: func(), 10, delay=0, jitter=0)
+        scheduler.add('later', lambda: func(), 10, jitter=0)
+        self.assertIs(scheduler.run_pending(), job)
+        self.assertEqual(func.call_count, 1)
+        self.assertIsNone(scheduler.run_pending())
+        self.assertAlmostEqual(job.next_run, elapsed() + 10, delta=1)
+
+    def test_pause_while_busy(self):
+        """ it should defer pausable jobs while the photobooth is busy """
+        busy = mock.Mock(return_value=True)
+        scheduler = Scheduler(is_busy=lambda: busy(), busy_delay=5)
+        func = mock.Mock()
+        job = scheduler.add('network', lambda: func(), 10, delay=0, pausable=True)
+        scheduler.add('clock', lambda: func(), 10, delay=0)
+        scheduler.run_pending()
+        scheduler.run_pending()
+        self.assertEqual(func.call_count, 1)
+        self.assertEqual(job.deferred, 1)
+        self.assertEqual(job.runs, 0)
+        busy.return_value = False
+        job.next_run = elapsed()
+        self.assertIs(scheduler.run_pending(), job)
+
+    def test_deadline(self):
+        """ it should drop a run that cannot start before its deadline """
+        scheduler = Scheduler()
+        func = mock.Mock()
+        job = scheduler.add('job', lambda: func(), 10, delay=-5, deadline=2)
+        self.assertIsNone(scheduler.run_pending())
+        self.assertFalse(func.called)
+        self.assertEqual(job.missed, 1)
+        self.assertGreater(job.next_run, elapsed())
+
+    def test_loop(self):
+        """ it should run jobs in the background until stopped """
+        ran = threading.Event()
+        scheduler = Scheduler()
+        scheduler.start()
+        scheduler.add('job', ran.set, 10, delay=0.01)
+        self.assertTrue(ran.wait(2))
+        scheduler.stop()
+        self.assertFalse(scheduler.is_alive())
+
+    def test_run_soon(self):
+        """ it should make a job due now and run it on the scheduler thread """
+        scheduler = Scheduler()
+        func = mock.Mock()
+        job = scheduler.add('job', lambda: func(), 10, delay=10, jitter=0)
+        self.assertIsNone(scheduler.run_pending())
+        self.assertIs(scheduler.run_soon('job'), job)
+        self.assertIs(scheduler.run_pending(), job)
+        self.assertTrue(func.called)
+        self.assertAlmostEqual(job.next_run, elapsed() + 10, delta=1)
+
+    def test_reset_backoff(self):
+        """ it should stop jobs from backing off once the photobooth is online again """
+        scheduler = Scheduler()
+        job = scheduler.add('job', mock.Mock(side_effect=Exception()), 10, delay=0, jitter=0, max_backoff=80)
+        for _ in range(3):
+            job.next_run = elapsed()
+            scheduler.run_pending()
+        self.assertEqual(job.consecutive_failures, 3)
+        self.assertAlmostEqual(job.next_run, elapsed() + 80, delta=1)
+        scheduler.on_connectivity_change(False)
+        self.assertEqual(job.consecutive_failures, 3)
+        scheduler.on_connectivity_change(True)
+        self.assertEqual(job.consecutive_failures, 0)
+        self.assertAlmostEqual(job.next_run, elapsed() + 10, delta=1)
+
+    def test_system_time_change(self):
+        """ it should not make jobs due when the system time is set forward """
+        scheduler = Scheduler()
+        func = mock.Mock()
+        job = scheduler.add('job', lambda: func(), 10, delay=10, jitter=0, deadline=2)
+        with mock.patch('figureraspbian.scheduler.time.time', return_value=time.time() + 3600):
+            self.assertIsNone(scheduler.run_pending())
+            self.assertAlmostEqual(job.serialize()['next_run'], time.time() + 10, delta=1)
+        self.assertFalse(func.called)
+        self.assertEqual(job.missed, 0)
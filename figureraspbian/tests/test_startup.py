@@ -0,0 +1,50 @@
+from unittest import TestCase
+from threading import Event
+import time
+
+from ..startup import Startup
+
+
+class StartupTestCase(TestCase):
+
+    def test_run_steps_concurrently(self):
+        """ it should run independent steps concurrently and dependent steps after their requirements """
+        calls = []
+        released = Event()
+
+        def slow():
+            released.wait(1)
+            calls.append('slow')
+
+        startup = Startup()
+        startup.add('slow', slow, timeout=2)
+        startup.add('fast', lambda: calls.append('fast'), timeout=2)
+        startup.add('after_slow', lambda: calls.append('after_slow'), timeout=2, requires=['slow'])
+        startup.start()
+        self.assertTrue(startup.wait('fast'))
+        self.assertEqual(calls, ['fast'])
+        released.set()
+        startup.join()
+        self.assertEqual(calls, ['fast', 'slow', 'after_slow'])
+        timeline = dict((name, (status, started, ended)) for name, status, started, ended in startup.get_timeline())
+        self.assertEqual(timeline['after_slow'][0], 'done')
+        self.assertGreaterEqual(timeline['after_slow'][1], timeline['slow'][2])
+
+    def test_step_timeout_and_failure(self):
+        """ it should stop waiting for a step after its timeout and keep running other steps when one fails """
+        released = Event()
+
+        def fail():
+            raise Exception('failed')
+
+        startup = Startup()
+        startup.add('hanging', lambda: released.wait(5), timeout=0.1)
+        startup.add('failing', fail)
+        startup.add('after_hanging', lambda: None, requires=['hanging'])
+        startup.start()
+        ts = time.time()
+        startup.join()
+        self.assertLess(time.time() - ts, 1)
+        statuses = dict((name, status) for name, status, _, _ in startup.get_timeline())
+        self.assertEqual(statuses, {'hanging': 'timeout', 'failing': 'failed', 'after_hanging': 'done'})
+        released.set()
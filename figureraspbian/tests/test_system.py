@@ -0,0 +1,36 @@
+from unittest import TestCase
+import mock
+
+from .. import system
+from ..system import SystemSampler
+
+
+class SystemTestCase(TestCase):
+
+    @mock.patch("figureraspbian.system.subprocess.check_output")
+    @mock.patch("figureraspbian.system.THROTTLED_PATH", "/does/not/exist")
+    def test_get_throttled_state(self, check_output):
+        """ it should fall back on vcgencmd when the firmware state is not exposed in sysfs """
+        check_output.return_value = "throttled=0x50005\n"
+        throttled = system.get_throttled_state()
+        self.assertEqual(throttled, 0x50005)
+        throttling = system.get_throttling(throttled)
+        self.assertTrue(throttling['under_voltage'])
+        self.assertTrue(throttling['throttled'])
+        self.assertFalse(throttling['frequency_capped'])
+        self.assertTrue(throttling['throttled_occurred'])
+
+    @mock.patch("figureraspbian.system.get_throttled_state")
+    def test_sample(self, get_throttled_state):
+        """ it should keep the last samples in a ring buffer """
+        get_throttled_state.return_value = None
+        sampler = SystemSampler(interval=60, history_size=2)
+        latest = sampler.latest()
+        self.assertIn('cpu_percent', latest)
+        self.assertIn('rss', latest['process'])
+        sampler.sample()
+        sampler.sample()
+        history = sampler.history()
+        self.assertEqual(len(history), 2)
+        self.assertEqual(sampler.latest(), history[-1])
+        self.assertEqual(sampler.history(since=history[-1]['timestamp']), [])
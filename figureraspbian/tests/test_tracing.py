@@ -0,0 +1,58 @@
+from unittest import TestCase
+from threading import Thread
+
+from .. import tracing
+from ..tracing import LatencyStore, trace, span, timed, current_trace
+
+
+class TracingTestCase(TestCase):
+
+    def setUp(self):
+        tracing.store.clear()
+
+    def test_percentile(self):
+        """ it should compute nearest rank percentiles """
+        values = range(1, 101)
+        self.assertEqual(tracing.percentile(values, 50), 50)
+        self.assertEqual(tracing.percentile(values, 95), 95)
+        self.assertEqual(tracing.percentile(values, 99), 99)
+        self.assertEqual(tracing.percentile([3], 99), 3)
+        self.assertIsNone(tracing.percentile([], 50))
+
+    def test_store(self):
+        """ it should keep a bounded number of durations per stage and of traces """
+        store = LatencyStore(size=3, traces_size=2)
+        for i in range(5):
+            store.record('capture', float(i), trace_id='trace%s' % i)
+        stats = store.get_stats()['capture']
+        self.assertEqual(stats['count'], 3)
+        self.assertEqual(stats['p50'], 3.0)
+        self.assertEqual(stats['p99'], 4.0)
+        self.assertEqual([t['id'] for t in store.get_traces()], ['trace3', 'trace4'])
+
+    def test_trace_and_spans(self):
+        """ it should group spans under the current trace, nested traces joining it """
+
+        @timed('render')
+        def render():
+            return 'html'
+
+        with trace() as trace_id:
+            with span('capture'):
+                pass
+            with trace() as nested_trace_id:
+                self.assertEqual(nested_trace_id, trace_id)
+                self.assertEqual(render(), 'html')
+        self.assertIsNone(current_trace())
+
+        def upload():
+            with trace(trace_id), span('upload'):
+                pass
+        thr = Thread(target=upload)
+        thr.start()
+        thr.join()
+
+        traces = tracing.store.get_traces()
+        self.assertEqual(len(traces), 1)
+        self.assertEqual([s['stage'] for s in traces[0]['spans']], ['capture', 'render', 'upload'])
+        self.assertEqual(sorted(tracing.store.get_stats()), ['capture', 'render', 'upload'])
@@ -0,0 +1,70 @@
+# -*- coding: utf8 -*-
+
+from unittest import TestCase
+import mock
+import os
+import shutil
+import tempfile
+
+from ..devices import usb_devices
+from ..devices.usb_devices import USBMonitor, enumerate_sysfs
+
+
+def write_device(root, entry, **attributes):
+    path = os.path.join(root, entry)
+    os.mkdir(path)
+    for name, value in attributes.items():
+        with open(os.path.join(path, name), 'w') as f:
+            f.write('%s\n' % value)
+
+
+class USBDevicesTestCase(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        write_device(self.root, '1-1.2', idVendor='04b8', idProduct='0e15', busnum='1', devnum='5',
+                     manufacturer='EPSON', product='TM-T20II')
+        # interfaces have no device attributes
+        write_device(self.root, '1-1.2:1.0', bInterfaceClass='07')
+        write_device(self.root, '1-1.3', idVendor='04a9', idProduct='327f', busnum='1', devnum='6')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_enumerate_sysfs(self):
+        """ it should list USB devices from sysfs """
+        expected = [
+            {'device': '/dev/bus/usb/001/005', 'vendor_id': '04b8', 'tag': 'EPSON TM-T20II', 'product_id': '0e15'},
+            {'device': '/dev/bus/usb/001/006', 'vendor_id': '04a9', 'tag': '', 'product_id': '327f'}]
+        self.assertEqual(enumerate_sysfs(self.root), expected)
+
+    @mock.patch("figureraspbian.devices.usb_devices.enumerate_sysfs")
+    def test_get_usb_devices(self, enumerate_sysfs):
+        """ it should enumerate devices again once the cached list is too old """
+        usb_devices._usb_devices['enumerated_at'] = None
+        enumerate_sysfs.return_value = [{'device': '/dev/bus/usb/001/005'}]
+        with mock.patch("figureraspbian.devices.usb_devices.exists", return_value=True):
+            usb_devices.get_usb_devices(max_age=60)
+            usb_devices.get_usb_devices(max_age=60)
+            self.assertEqual(enumerate_sysfs.call_count, 1)
+            usb_devices.get_usb_devices(max_age=0)
+            self.assertEqual(enumerate_sysfs.call_count, 2)
+
+    @mock.patch("figureraspbian.devices.usb_devices.get_usb_devices")
+    def test_monitor_check(self, get_usb_devices):
+        """ it should report devices plugged and unplugged since the previous check """
+        printer = {'device': '/dev/bus/usb/001/005', 'vendor_id': '04b8', 'product_id': '0e15', 'tag': ''}
+        camera = {'device': '/dev/bus/usb/001/006', 'vendor_id': '04a9', 'product_id': '327f', 'tag': ''}
+        monitor = USBMonitor()
+        callback = mock.Mock()
+        monitor.subscribe(callback)
+        get_usb_devices.return_value = [printer, camera]
+        self.assertEqual(monitor.check(), ([], []))
+        get_usb_devices.return_value = [camera]
+        self.assertEqual(monitor.check(), ([], [printer]))
+        replugged = dict(printer, device='/dev/bus/usb/001/007')
+        get_usb_devices.return_value = [camera, replugged]
+        monitor.check()
+        callback.assert_called_with([replugged], [])
+        monitor.check()
+        self.assertEqual(callback.call_count, 2)
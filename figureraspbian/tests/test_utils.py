@@ -36,6 +36,45 @@ class TestUtils(TestCase):
         utils.download('https://path/to/some/file.txt', tempdir, force=True)
         self.assertEqual(mock_urllib2.urlopen.call_count, 2)
 
+    def test_write_file_atomic(self):
+        """ it should give the file the permissions of a file created with open """
+        tempdir = tempfile.mkdtemp()
+        path = os.path.join(tempdir, 'ticket.css')
+        utils.write_file_atomic('body {}', path)
+        with open(path) as f:
+            self.assertEqual(f.read(), 'body {}')
+        self.assertEqual(os.stat(path).st_mode & 0777, 0666 & ~utils.UMASK)
+        self.assertEqual(os.listdir(tempdir), ['ticket.css'])
+
+    @mock.patch('figureraspbian.utils.urllib2')
+    def test_download_all(self, mock_urllib2):
+        """ it should download each url once and hard link files with identical contents """
+        tempdir = tempfile.mkdtemp()
+        contents = {'https://path/to/a.png': 'a', 'https://path/to/b.png': 'b', 'https://path/to/c.png': 'a'}
+
+        def urlopen(req, timeout):
+            response = mock.Mock()
+            response.read.return_value = contents[req.get_full_url()]
+            return response
+
+        mock_urllib2.Request.side_effect = lambda url: mock.Mock(get_full_url=lambda: url)
+        mock_urllib2.urlopen.side_effect = urlopen
+        urls = ['https://path/to/a.png', 'https://path/to/b.png', 'https://path/to/c.png', 'https://path/to/a.png']
+        paths = utils.download_all(urls, tempdir, pool_size=2)
+        self.assertEqual(mock_urllib2.urlopen.call_count, 3)
+        self.assertEqual(paths['https://path/to/b.png'], os.path.join(tempdir, 'b.png'))
+        with open(paths['https://path/to/c.png']) as f:
+            self.assertEqual(f.read(), 'a')
+        self.assertEqual(os.stat(paths['https://path/to/a.png']).st_ino, os.stat(paths['https://path/to/c.png']).st_ino)
+        self.assertEqual(sorted(os.listdir(tempdir)), ['a.png', 'b.png', 'c.png'])
+
+    @mock.patch('figureraspbian.utils.urllib2')
+    def test_download_all_error(self, mock_urllib2):
+        """ it should raise if any of the downloads failed """
+        mock_urllib2.urlopen.side_effect = IOError()
+        with self.assertRaises(IOError):
+            utils.download_all(['https://path/to/a.png'], tempfile.mkdtemp())
+
     @mock.patch('figureraspbian.utils.logger.info')
     def test_timeit(self, mock_info):
         """
@@ -76,10 +115,10 @@ class TestUtils(TestCase):
         new_paper_level = utils.new_paper_level(80.0, 900)
         self.assertAlmostEqual(new_paper_level, 79.85, delta=0.01)
 
-    def test_new_aper_level_below_1(self):
-        """ it should reset paper level to 10 if we go below 1 """
-        new_paper_level = utils.new_paper_level(1.0, 900)
-        self.assertEqual(new_paper_level, 10.0)
+    def test_new_paper_level_below_0(self):
+        """ it should not estimate a negative paper level """
+        new_paper_level = utils.new_paper_level(0.1, 900)
+        self.assertEqual(new_paper_level, 0.0)
 
     @mock.patch("figureraspbian.utils.os.system")
     def test_set_system_time(self, mock_system):
@@ -111,18 +150,6 @@ class TestUtils(TestCase):
         expected = "foobar"
         self.assertEqual(rendered, expected)
 
-    @mock.patch("figureraspbian.utils.subprocess")
-    def test_get_usb_devices(self, mock_subprocess):
-        """ it should parse the output of lsusb """
-        mock_subprocess.check_output.return_value = (
-            "Bus 001 Device 005: ID 04b8:0e15 Seiko Epson Corp.\n"
-            "Bus 001 Device 006: ID 04a9:327f Canon, Inc.")
-        devices = utils.get_usb_devices()
-        expected = [
-            {'device': '/dev/bus/usb/001/005', 'vendor_id': '04b8', 'tag': 'Seiko Epson Corp.', 'product_id': '0e15'},
-            {'device': '/dev/bus/usb/001/006', 'vendor_id': '04a9', 'tag': 'Canon, Inc.', 'product_id': '327f'}]
-        self.assertEqual(devices, expected)
-
     def test_crop_to_square(self):
         """ it should crop a rectangle image to a square """
         im = Image.new('L', (200, 100))
@@ -143,11 +170,11 @@ class TestUtils(TestCase):
         self.assertAlmostEqual(new_paper_level, 55.83, 2)
 
     def test_new_paper_level_when_below_1(self):
-        """ it should set paper level to 10 """
+        """ it should keep decreasing the estimate, the paper sensors correct it """
         new_paper_level = utils.new_paper_level(1.0, 1000)
-        self.assertEqual(new_paper_level, 10.0)
+        self.assertAlmostEqual(new_paper_level, 0.83, 2)
 
     def test_new_paper_level_if_previous_paper_level_is_0(self):
-        """ it should set paper level to 100 """
+        """ it should not guess a refill """
         new_paper_level = utils.new_paper_level(0.0, 1000)
-        self.assertEqual(new_paper_level, 100.0)
\ No newline at end of file
+        self.assertEqual(new_paper_level, 0.0)
\ No newline at end of file
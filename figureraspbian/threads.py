@@ -1,3 +1,6 @@
+import ctypes
+import ctypes.util
+import os
 from threading import Thread, Event, RLock
 
 
@@ -5,6 +8,35 @@ _THREADS = set()
 
 rlock = RLock()
 
+CLOCK_MONOTONIC = 1
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _get_clock_gettime():
+    """ Python 2 has no time.monotonic, clock_gettime is called through ctypes when the libc provides it """
+    try:
+        return ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True).clock_gettime
+    except (OSError, AttributeError):
+        return None
+
+
+_clock_gettime = _get_clock_gettime()
+
+
+def elapsed():
+    """ Seconds elapsed since an arbitrary point in the past, not affected by changes of the system time """
+    if _clock_gettime is None:
+        # only counts in clock ticks, 10 ms on Linux
+        return os.times()[4]
+    ts = _Timespec()
+    if _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+    return ts.tv_sec + ts.tv_nsec * 1e-9
+
 
 def threads_shutdown():
     while _THREADS:
@@ -32,17 +64,3 @@ class StoppableThread(Thread):
     def join(self):
         super(StoppableThread, self).join()
         _THREADS.discard(self)
-
-
-class Interval(StoppableThread):
-
-    def __init__(self, sec, func):
-        super(Interval, self).__init__(target=self.set_interval, args=(func, sec))
-        self.daemon = True
-
-    def set_interval(self, sec, func):
-        while not self.stopping.wait(sec):
-            try:
-                func()
-            except:
-                pass
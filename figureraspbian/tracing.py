@@ -0,0 +1,109 @@
+# -*- coding: utf8 -*-
+
+import math
+import time
+import uuid
+from collections import defaultdict, deque, OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from threading import local, Lock
+
+import settings
+
+
+_context = local()
+
+
+def percentile(sorted_values, p):
+    """ Nearest rank percentile of an already sorted list """
+    if not sorted_values:
+        return None
+    rank = int(math.ceil(p / 100.0 * len(sorted_values)))
+    return sorted_values[max(rank, 1) - 1]
+
+
+class LatencyStore(object):
+    """
+    Keeps the durations of the last `size` spans of each stage and the spans of the last `traces_size` traces
+    A trace groups the spans recorded during a single trigger
+    """
+
+    def __init__(self, size=settings.LATENCY_SAMPLES_SIZE, traces_size=settings.LATENCY_TRACES_SIZE):
+        self.size = size
+        self.traces_size = traces_size
+        self._durations = defaultdict(lambda: deque(maxlen=self.size))
+        self._traces = OrderedDict()
+        self._lock = Lock()
+
+    def record(self, stage, duration, trace_id=None, started_at=None):
+        with self._lock:
+            self._durations[stage].append(duration)
+            if trace_id:
+                if trace_id not in self._traces:
+                    self._traces[trace_id] = []
+                    while len(self._traces) > self.traces_size:
+                        self._traces.popitem(last=False)
+                self._traces[trace_id].append({'stage': stage, 'started': started_at, 'duration': duration})
+
+    def get_stats(self):
+        """ Returns count, mean, p50, p95 and p99 durations in seconds for each stage """
+        with self._lock:
+            durations = {stage: sorted(values) for stage, values in self._durations.items()}
+        stats = {}
+        for stage, values in durations.items():
+            stats[stage] = {
+                'count': len(values),
+                'mean': sum(values) / len(values),
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'p99': percentile(values, 99)
+            }
+        return stats
+
+    def get_traces(self):
+        with self._lock:
+            return [{'id': trace_id, 'spans': list(spans)} for trace_id, spans in self._traces.items()]
+
+    def clear(self):
+        with self._lock:
+            self._durations.clear()
+            self._traces.clear()
+
+
+store = LatencyStore()
+
+
+def current_trace():
+    return getattr(_context, 'trace_id', None)
+
+
+@contextmanager
+def trace(trace_id=None):
+    """ Group the spans recorded in this thread under a trace id, joining the current trace if there is one """
+    previous = current_trace()
+    _context.trace_id = trace_id or previous or uuid.uuid4().hex[:12]
+    try:
+        yield _context.trace_id
+    finally:
+        _context.trace_id = previous
+
+
+@contextmanager
+def span(stage):
+    """ Record the time spent in a stage of the current trace """
+    started_at = time.time()
+    try:
+        yield
+    finally:
+        store.record(stage, time.time() - started_at, current_trace(), started_at)
+
+
+def timed(stage):
+    """ Decorator recording the time spent in a function as a span """
+    def wrap(func):
+        @wraps(func)
+        def decorated(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return decorated
+    return wrap
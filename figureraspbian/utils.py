@@ -5,17 +5,18 @@ import logging
 import base64
 import cStringIO
 import netifaces
-import re
-import subprocess
-from os.path import join, basename, exists
+from os.path import join, basename, dirname, exists
 import os
+import hashlib
+import tempfile
+from multiprocessing.pool import ThreadPool
 from urlparse import urlsplit
 import urllib
 import urllib2
 import codecs
 
 from hashids import Hashids
-from PIL import ImageOps, ImageEnhance
+from PIL import ImageOps
 from jinja2 import Environment
 
 import settings
@@ -39,19 +40,74 @@ def write_file(file, path):
         f.write(file)
 
 
+# read once while the process is still single threaded, setting the umask is the only way to read it
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+def write_file_atomic(file, path):
+    """
+    Write a file to a temporary path next to path and rename it so that readers never see a partial file
+    The file gets the permissions open would have given it, mkstemp creates it readable by its owner only
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=dirname(path), prefix='.%s.' % basename(path))
+    try:
+        os.fchmod(fd, 0666 & ~UMASK)
+        with os.fdopen(fd, "wb") as f:
+            f.write(file)
+        os.rename(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
 def download(url, path, force=False):
     """
     Download a file from a remote url and copy it to the local path
+    The file is written atomically and left untouched if its content did not change
     """
     local_name = url2name(url)
     path_to_file = join(path, local_name)
     if not exists(path_to_file) or force:
         req = urllib2.Request(url)
         r = urllib2.urlopen(req, timeout=10)
-        write_file(r.read(), path_to_file)
+        content = r.read()
+        if not exists(path_to_file) or hashlib.sha1(content).hexdigest() != file_hash(path_to_file):
+            write_file_atomic(content, path_to_file)
     return path_to_file
 
 
+def download_all(urls, path, pool_size=settings.DOWNLOAD_POOL_SIZE):
+    """
+    Download files concurrently in a bounded pool of threads and return a dict mapping each url to its local path
+    Urls are downloaded once and files with identical contents are hard linked together. The contents are only
+    known once downloaded, linking saves space on the SD card, not bandwidth
+    An exception is raised if any of the downloads failed
+    """
+    urls = list(set(urls))
+    if not urls:
+        return {}
+    pool = ThreadPool(min(pool_size, len(urls)))
+    try:
+        paths = pool.map(lambda url: download(url, path), urls)
+    finally:
+        pool.close()
+        pool.join()
+    by_hash = {}
+    for path_to_file in sorted(set(paths)):
+        original = by_hash.setdefault(file_hash(path_to_file), path_to_file)
+        if original != path_to_file and os.stat(original).st_ino != os.stat(path_to_file).st_ino:
+            tmp_path = '%s.link' % path_to_file
+            os.link(original, tmp_path)
+            os.rename(tmp_path, path_to_file)
+    return dict(zip(urls, paths))
+
+
 def get_file_name(code):
     # TODO check for unicity
     ascii = [ord(c) for c in code]
@@ -59,6 +115,11 @@ def get_file_name(code):
     return "Figure_%s.jpg" % hash
 
 
+def chunks(items, size):
+    """ Split a list into successive chunks of at most size items """
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
 def timeit(func):
 
     def timed(*args, **kw):
@@ -85,14 +146,9 @@ def pixels2cm(pixels):
 
 
 def new_paper_level(old_paper_level, ticket_length):
-    if old_paper_level == 0:
-        return 100.0
+    """ Paper level estimated from the length of the ticket printed, the paper sensors correct it """
     cm = pixels2cm(ticket_length)
-    new_paper_level = old_paper_level - (cm / float(settings.PAPER_ROLL_LENGTH)) * 100
-    if new_paper_level <= 1:
-        # estimate is wrong, guess it's 10%
-        new_paper_level = 10
-    return new_paper_level
+    return max(old_paper_level - (cm / float(settings.PAPER_ROLL_LENGTH)) * 100, 0.0)
 
 
 def set_system_time(dt):
@@ -123,21 +179,6 @@ def render_jinja_template(path, **kwargs):
         return template.render(kwargs)
 
 
-def get_usb_devices():
-    pattern = re.compile("Bus\s+(?P<bus>\d+)\s+Device\s+(?P<device>\d+).+ID\s(?P<vendor_id>\w+):(?P<product_id>\w+)\s(?P<tag>.+)$", re.I)
-    df = subprocess.check_output("lsusb", shell=True)
-    # parse all usb devices
-    devices = []
-    for i in df.split('\n'):
-        if i:
-            info = pattern.match(i)
-            if info:
-                dinfo = info.groupdict()
-                dinfo['device'] = '/dev/bus/usb/%s/%s' % (dinfo.pop('bus'), dinfo.pop('device'))
-                devices.append(dinfo)
-    return devices
-
-
 def crop_to_square(pil_image):
     """ convert a rectangle image to a square shape """
     w, h = pil_image.size
@@ -168,12 +209,3 @@ def resize_preserve_ratio(image, new_height=None, new_width=None):
 def add_margin(image, border, color='white'):
     """ add an horizontal margin to the image """
     return ImageOps.expand(image, border, color)
-
-
-@timeit
-def enhance_image(image):
-    contraster = ImageEnhance.Contrast(image)
-    image = contraster.enhance(settings.CONTRAST_FACTOR)
-    sharpener = ImageEnhance.Sharpness(image)
-    image = sharpener.enhance(settings.SHARPNESS_FACTOR)
-    return image
\ No newline at end of file